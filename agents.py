@@ -1,14 +1,14 @@
 # agents.py
 
+import asyncio
 import os
-import google.generativeai as genai
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
 from langchain.llms.base import LLM
-from langchain.agents import initialize_agent, AgentType
-from langchain.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import SimpleSequentialChain
-from langchain_ollama import OllamaLLM
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun
+from langchain.agents import initialize_agent, AgentType, AgentExecutor, Tool
+from langchain.schema import AgentFinish, BaseMemory
 from tools import (
     search_ingredients_tool,
     search_youtube_tool,
@@ -17,21 +17,25 @@ from tools import (
     create_note,
     update_note,
     delete_note,
-    show_note
+    show_note,
+    search_notes
 )
-import uuid
 import logging
-from db import engine, SessionLocal, Note, Conversation
+from memory import memory_manager, estimate_tokens
+from llm_cache import completion_cache
+from gateway import model_gateway, prompt_session
+from tracing import current_trace, span, record_prompt_tokens
+from planner import PlanAndExecuteChain
+from router import AUTO_MODEL, RoutedLLM
+from deadlines import DeadlineExceeded, clamp, exceeded, remaining, running_low, usable_seconds, partial_answer
+from observations import full_text
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Google Generative AI
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
-if not GOOGLE_API_KEY:
-    logger.warning("GOOGLE_API_KEY is not set.")
-genai.configure(api_key=GOOGLE_API_KEY)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
 
 # Define Available Models
 AVAILABLE_MODELS = {
@@ -39,51 +43,145 @@ AVAILABLE_MODELS = {
     "qwen": "qwen2.5:3b"
 }
 
-# Create a new session
-session = SessionLocal()
-
-# Global Dictionary to Store Memories per Conversation ID
-conversation_memories: Dict[str, ConversationBufferMemory] = {}
+# Provider SDKs are only imported for enabled models; the first one is the fallback
+ENABLED_MODELS = [
+    m.strip() for m in os.getenv("ENABLED_MODELS", "gemini,qwen").split(",") if m.strip() in AVAILABLE_MODELS
+] or ["gemini"]
+
+# "react" runs the ReAct loop; "plan" plans all tool calls up front and runs them concurrently
+EXECUTION_MODES = ("react", "plan")
+PLAN_EXECUTE_AGENTS = {a.strip() for a in os.getenv("PLAN_EXECUTE_AGENTS", "").split(",") if a.strip()}
+
+# Seconds spent importing each provider SDK, filled in on first use
+provider_import_seconds: Dict[str, float] = {}
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def load_genai():
+    """
+    Imports and configures the Gemini SDK the first time a Gemini client is built.
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            started = time.perf_counter()
+            import google.generativeai as genai
+            if not GOOGLE_API_KEY:
+                logger.warning("GOOGLE_API_KEY is not set.")
+            genai.configure(api_key=GOOGLE_API_KEY)
+            _genai = genai
+            provider_import_seconds["gemini"] = time.perf_counter() - started
+        return _genai
+
+
+def record_gemini_usage(model_name: str, response: Any) -> None:
+    # cached_content_token_count is the part of the prompt Gemini served from its cache
+    usage = getattr(response, "usage_metadata", None)
+    sent = getattr(usage, "prompt_token_count", 0) or 0
+    if sent:
+        record_prompt_tokens(model_name, sent, sent - (getattr(usage, "cached_content_token_count", 0) or 0))
+
+
+def gemini_request_options() -> Dict[str, Any]:
+    # Bounds the call by the request's deadline when it has one
+    if remaining() is None:
+        return {}
+    try:
+        return {"timeout": clamp(GEMINI_TIMEOUT)}
+    except DeadlineExceeded:
+        exceeded("llm")
+        raise
 
 
 class GeminiLLM(LLM):
+    """
+    Gemini backend. Errors are raised so the router can fall back.
+    """
+
     def __init__(self, model_name: str = "gemini-1.5-flash-8b", **kwargs):
         super().__init__(**kwargs)
         self._model_name = model_name
-        self._model = genai.GenerativeModel(model_name=self._model_name)
+        self._model = load_genai().GenerativeModel(model_name=self._model_name)
 
     @property
     def _llm_type(self) -> str:
         return "gemini"
 
+    def get_num_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
     def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        try:
-            response = self._model.generate_content(prompt)
+        response = self._model.generate_content(prompt, request_options=gemini_request_options())
+        record_gemini_usage(self._model_name, response)
+        if not response.parts:
+            return "• No response generated."
+        return response.parts[0].text.strip()
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        if run_manager is None:
+            response = await self._model.generate_content_async(prompt, request_options=gemini_request_options())
+            record_gemini_usage(self._model_name, response)
             if not response.parts:
                 return "• No response generated."
             return response.parts[0].text.strip()
-        except Exception as e:
-            logger.error(f"Gemini LLM Error: {e}")
-            return f"• Unable to generate a response: {str(e)}"
+        # Stream so callback handlers see tokens as Gemini produces them
+        chunks = []
+        response = await self._model.generate_content_async(prompt, stream=True, request_options=gemini_request_options())
+        async for chunk in response:
+            if not chunk.parts:
+                continue
+            text = chunk.parts[0].text
+            chunks.append(text)
+            await run_manager.on_llm_new_token(text)
+        record_gemini_usage(self._model_name, response)
+        if not chunks:
+            return "• No response generated."
+        return "".join(chunks).strip()
 
 
 class QwenLLM(LLM):
+    """
+    Qwen backend served by Ollama through the model gateway.
+    """
+
     def __init__(self, model_name: str = "qwen2.5:3b", **kwargs):
         super().__init__(**kwargs)
         self._model_name = model_name
-        self._ollama_llm = OllamaLLM(model=self._model_name)
 
     @property
     def _llm_type(self) -> str:
         return "qwen"
 
+    def get_num_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
     def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        try:
-            response = self._ollama_llm(prompt)
+        return model_gateway.generate(self._model_name, prompt, stop=stop).strip()
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        if run_manager is None:
+            response = await model_gateway.agenerate(self._model_name, prompt, stop=stop)
             return response.strip()
-        except Exception as e:
-            logger.error(f"Qwen LLM Error: {e}")
-            return f"• Unable to generate a response: {str(e)}"
+        # Stream so callback handlers see tokens as Ollama produces them
+        chunks = []
+        async for text in model_gateway.astream(self._model_name, prompt, stop=stop):
+            chunks.append(text)
+            await run_manager.on_llm_new_token(text)
+        return "".join(chunks).strip()
 
 
 def get_system_prompt(agent_name: str) -> str:
@@ -138,6 +236,7 @@ You are a Notes Agent.
 You can:
 - Create, update, delete, rename, and show notes in any specified location.
 - Use create_note, update_note, delete_note, show_note tools to manage notes.
+- Use search_notes to find notes by their content when the user does not know the note name.
 
 Always respond in bullet points.
 If tools are needed, follow ReAct format:
@@ -335,63 +434,258 @@ https://www.youtube.com/watch?v=exampleVideoId9
     return prompts.get(agent_name, "You are a helpful agent.")
 
 
-def get_llm(model_choice: str) -> LLM:
+AGENT_NAMES = (
+    "Cooking Agent",
+    "Notes Agent",
+    "News Agent",
+    "Entertainment Agent",
+    "Weather Agent",
+    "Travel Itinerary Agent",
+)
+
+
+def resolve_model_key(model_choice: str) -> str:
     model_key = model_choice.lower()
+    if model_key == AUTO_MODEL:
+        return model_key
+    if model_key not in ENABLED_MODELS:
+        logger.warning(f"Model choice '{model_choice}' not recognized or not enabled. Defaulting to '{ENABLED_MODELS[0]}'.")
+        return ENABLED_MODELS[0]
+    return model_key
+
+
+def get_llm(model_choice: str) -> LLM:
+    """
+    Builds the backend client for one model; agents reach it through AgentRegistry.get_llm.
+    """
+    model_key = resolve_model_key(model_choice)
     if model_key == "qwen":
         return QwenLLM(model_name=AVAILABLE_MODELS["qwen"])
-    elif model_key == "gemini":
-        return GeminiLLM(model_name=AVAILABLE_MODELS["gemini"])
-    else:
-        logger.warning(f"Model choice '{model_choice}' not recognized. Defaulting to Gemini.")
-        return GeminiLLM(model_name=AVAILABLE_MODELS["gemini"])
-
-
-def get_agent(agent_name: str, model_choice: str, conversation_id: str) -> Any:
-    if conversation_id not in conversation_memories:
-        conversation_memories[conversation_id] = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=False,
-        )
-        logger.info(f"Initialized memory for conversation ID: {conversation_id}")
+    return GeminiLLM(model_name=AVAILABLE_MODELS["gemini"])
 
-    memory = conversation_memories[conversation_id]
-    system_prompt = get_system_prompt(agent_name)
 
-    tools = []
+def resolve_execution_mode(agent_name: str, execution_mode: Optional[str] = None) -> str:
+    if execution_mode is None:
+        return "plan" if agent_name in PLAN_EXECUTE_AGENTS else "react"
+    if execution_mode not in EXECUTION_MODES:
+        logger.warning(f"Execution mode '{execution_mode}' not recognized. Defaulting to 'react'.")
+        return "react"
+    return execution_mode
+
+
+def get_tools(agent_name: str) -> List[Tool]:
     if agent_name == "Cooking Agent":
-        tools = [search_ingredients_tool, search_youtube_tool, create_note, show_note]
+        return [search_ingredients_tool, search_youtube_tool, create_note, show_note]
     elif agent_name == "News Agent":
-        tools = [search_news_tool, search_youtube_tool]
+        return [search_news_tool, search_youtube_tool]
     elif agent_name == "Entertainment Agent":
-        tools = [search_youtube_tool]
+        return [search_youtube_tool]
     elif agent_name == "Weather Agent":
-        tools = [search_weather_tool]
+        return [search_weather_tool]
     elif agent_name == "Travel Itinerary Agent":
-        tools = [search_weather_tool, search_youtube_tool]
+        return [search_weather_tool, search_youtube_tool]
     elif agent_name == "Notes Agent":
-        tools = [create_note, update_note, delete_note, show_note]
-    else:
-        logger.warning(f"Agent '{agent_name}' has no specific tools assigned.")
-
-    chat_prompt = ChatPromptTemplate.from_messages([
-        SystemMessagePromptTemplate.from_template(system_prompt),
-        HumanMessagePromptTemplate.from_template("{input}")
-    ])
-
-    llm = get_llm(model_choice)
-
-    try:
-        agent = initialize_agent(
-            tools=tools,
-            llm=llm,
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            verbose=True,
-            handle_parsing_errors=True,
+        return [create_note, update_note, delete_note, show_note, search_notes]
+    logger.warning(f"Agent '{agent_name}' has no specific tools assigned.")
+    return []
+
+
+# What AgentExecutor answers when it stops on its iteration or time limit
+STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+
+class DeadlineAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that starts no new step once the request's deadline is
+    close, and answers a stopped run from the observations it gathered
+    instead of the stock "Agent stopped" message.
+    """
+
+    def _should_continue(self, iterations: int, time_elapsed: float) -> bool:
+        if running_low():
+            return False
+        return super()._should_continue(iterations, time_elapsed)
+
+    def _partial(self, output: AgentFinish, intermediate_steps: list) -> AgentFinish:
+        if output.log or output.return_values.get("output") != STOPPED_OUTPUT:
+            return output
+        if running_low():
+            exceeded("agent")
+        return AgentFinish({"output": partial_answer([full_text(o) for _, o in intermediate_steps])}, "")
+
+    def _return(self, output: AgentFinish, intermediate_steps: list, run_manager: Optional[Any] = None) -> Dict[str, Any]:
+        return super()._return(self._partial(output, intermediate_steps), intermediate_steps, run_manager=run_manager)
+
+    async def _areturn(self, output: AgentFinish, intermediate_steps: list, run_manager: Optional[Any] = None) -> Dict[str, Any]:
+        return await super()._areturn(self._partial(output, intermediate_steps), intermediate_steps, run_manager=run_manager)
+
+
+class AgentRegistry:
+    """
+    Long-lived cache of LLM clients and agents.
+
+    LLM clients are built once per model and agents once per (agent_name, model,
+    execution mode). Only a cheap wrapper is created per call, so the
+    per-conversation memory can be bound at call time. Agents get a RoutedLLM,
+    which picks the backend client for each call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llms: Dict[str, LLM] = {}
+        self._routed: Dict[str, LLM] = {}
+        self._agents: Dict[Tuple[str, str, str], Any] = {}
+        self._hits = 0
+        self._builds = 0
+        self._build_seconds = 0.0
+
+    def get_backend(self, model_key: str) -> LLM:
+        with self._lock:
+            llm = self._llms.get(model_key)
+            if llm is None:
+                llm = get_llm(model_key)
+                self._llms[model_key] = llm
+            return llm
+
+    def get_llm(self, model_choice: str) -> LLM:
+        model_key = resolve_model_key(model_choice)
+        with self._lock:
+            llm = self._routed.get(model_key)
+            if llm is None:
+                llm = RoutedLLM(model_key, self.get_backend, ENABLED_MODELS)
+                self._routed[model_key] = llm
+            return llm
+
+    def register_llm(self, model_key: str, llm: LLM) -> None:
+        # Lets benchmarks and tests swap in a different client for a model
+        with self._lock:
+            self._llms[model_key] = llm
+            self._agents = {k: v for k, v in self._agents.items() if k[1] != model_key}
+
+    def _get_base_agent(self, agent_name: str, model_choice: str, execution_mode: str = "react") -> Any:
+        key = (agent_name, resolve_model_key(model_choice), execution_mode)
+        with self._lock:
+            base = self._agents.get(key)
+            if base is not None:
+                self._hits += 1
+                return base
+
+        started = time.perf_counter()
+        try:
+            with span("agent_build", agent_name):
+                llm = completion_cache.wrap(self.get_llm(key[1]), agent_name)
+                if execution_mode == "plan":
+                    base = PlanAndExecuteChain(
+                        llm=llm,
+                        tools=get_tools(agent_name),
+                        system_prompt=get_system_prompt(agent_name),
+                        verbose=True
+                    )
+                else:
+                    base = initialize_agent(
+                        tools=get_tools(agent_name),
+                        llm=llm,
+                        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                        verbose=True,
+                        handle_parsing_errors=True,
+                        max_iterations=10
+                    )
+        except Exception as e:
+            logger.error(f"Error initializing agent '{agent_name}': {e}")
+            raise e
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            # Another request may have built the same agent concurrently; keep the first one.
+            existing = self._agents.setdefault(key, base)
+            self._builds += 1
+            self._build_seconds += elapsed
+        logger.info(f"Built '{execution_mode}' agent '{agent_name}' with model '{key[1]}' in {elapsed:.3f}s")
+        return existing
+
+    def get_agent(self, agent_name: str, model_choice: str, memory: BaseMemory, execution_mode: str = "react") -> Any:
+        base = self._get_base_agent(agent_name, model_choice, execution_mode)
+        if execution_mode == "plan":
+            return base.model_copy(update={"memory": memory})
+        return DeadlineAgentExecutor.from_agent_and_tools(
+            agent=base.agent,
+            tools=base.tools,
             memory=memory,
-            max_iterations=10
+            verbose=base.verbose,
+            handle_parsing_errors=base.handle_parsing_errors,
+            max_iterations=base.max_iterations,
+            # Interrupts an async run mid-step once only the reserve is left
+            max_execution_time=usable_seconds()
         )
-        logger.info(f"Initialized agent '{agent_name}' with model '{model_choice}' for conversation ID: {conversation_id}")
-        return agent
-    except Exception as e:
-        logger.error(f"Error initializing agent '{agent_name}': {e}")
-        raise e
+
+    def warm(self, agent_names: List[str], models: List[str]) -> int:
+        """
+        Builds the LLM clients and base agents ahead of the first request.
+        Returns the number of agents that are ready.
+        """
+        built = 0
+        for model in models:
+            if model != AUTO_MODEL:
+                self.get_backend(model)
+            for agent_name in agent_names:
+                try:
+                    self._get_base_agent(agent_name, model, resolve_execution_mode(agent_name))
+                    built += 1
+                except Exception as e:
+                    logger.error(f"Agent Warm-up Error for '{agent_name}': {e}")
+        return built
+
+    def clear(self) -> None:
+        with self._lock:
+            self._llms.clear()
+            self._routed.clear()
+            self._agents.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "llms": len(self._llms),
+                "agents": len(self._agents),
+                "hits": self._hits,
+                "builds": self._builds,
+                "build_seconds": round(self._build_seconds, 6),
+            }
+
+
+agent_registry = AgentRegistry()
+
+
+def get_agent(
+    agent_name: str,
+    model_choice: str,
+    conversation_id: str,
+    memory_strategy: Optional[str] = None,
+    execution_mode: Optional[str] = None
+) -> Any:
+    mode = resolve_execution_mode(agent_name, execution_mode)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.mode = mode
+    # Lets the gateway continue this conversation's previous generation
+    prompt_session.set(conversation_id)
+    memory = memory_manager.get(conversation_id, agent_registry.get_llm(model_choice), memory_strategy)
+    agent = agent_registry.get_agent(agent_name, model_choice, memory, mode)
+    logger.info(f"Bound agent '{agent_name}' with model '{model_choice}' to conversation ID: {conversation_id}")
+    return agent
+
+
+async def aget_agent(
+    agent_name: str,
+    model_choice: str,
+    conversation_id: str,
+    memory_strategy: Optional[str] = None,
+    execution_mode: Optional[str] = None
+) -> Any:
+    """
+    get_agent for the event loop. Loading memory can summarise it with a
+    blocking LLM call, so it runs on a worker thread.
+    """
+    agent = await asyncio.to_thread(get_agent, agent_name, model_choice, conversation_id, memory_strategy, execution_mode)
+    # The thread ran in a copy of this context, so bind the session here too
+    prompt_session.set(conversation_id)
+    return agent
@@ -0,0 +1,119 @@
+# batch.py
+
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from gateway import request_priority
+from history import conversations_with_messages
+from memory import memory_manager
+from metrics import registry, COUNT_BUCKETS
+from task import execute_agent_query, asave_conversation_turn
+from deadlines import resolve_timeout
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+BATCH_ITEMS = registry.counter(
+    "prism_batch_items", "Batch items by outcome.", ["status"]
+)
+BATCH_SIZE = registry.histogram(
+    "prism_batch_size", "Items per batch request.", buckets=COUNT_BUCKETS + (25, 50, 100, 250, 500)
+)
+
+
+def _dedupe_key(item: Any) -> Tuple[str, ...]:
+    return (
+        item.agent_name, item.model_name.lower(), item.memory_strategy or "",
+        item.execution_mode or "", item.user_input.strip()
+    )
+
+
+def _stateless_conversations(items: Sequence[Any]) -> set:
+    """
+    Conversation ids that appear once in the batch and have neither a live
+    memory nor stored messages, so their answer cannot depend on history.
+    """
+    counts = Counter(item.conversation_id for item in items)
+    candidates = {cid for cid, n in counts.items() if n == 1 and not memory_manager.is_live(cid)}
+    return candidates - conversations_with_messages(candidates)
+
+
+async def iter_batch(items: Sequence[Any], max_concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs QueryRequest-like items concurrently and yields one result per item
+    as it completes. Each result carries its input index.
+
+    Identical items on fresh conversations share a single agent run; the
+    answer is still written to every item's conversation. Items that share a
+    conversation_id run one after another in input order.
+    """
+    limit = max(1, min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+    stateless = await asyncio.to_thread(_stateless_conversations, items)
+    conversation_locks = {item.conversation_id: asyncio.Lock() for item in items}
+    leaders: Dict[Tuple[str, ...], Tuple[int, asyncio.Future]] = {}
+    BATCH_SIZE.observe(len(items))
+
+    async def run_item(index: int, item: Any) -> Dict[str, Any]:
+        # Local model calls from batch items queue behind interactive traffic
+        request_priority.set("batch")
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"index": index, "conversation_id": item.conversation_id, "deduplicated_from": None}
+        key = _dedupe_key(item) if item.conversation_id in stateless else None
+        leader = leaders.get(key) if key is not None else None
+        shared: Optional[asyncio.Future] = None
+        if key is not None and leader is None:
+            # Registered before the first await, so later items see it
+            shared = asyncio.get_running_loop().create_future()
+            leaders[key] = (index, shared)
+        try:
+            if leader is not None:
+                answer = await asyncio.shield(leader[1])
+                await asave_conversation_turn(
+                    item.conversation_id, item.agent_name, item.model_name, item.user_input, answer["response"]
+                )
+                result["deduplicated_from"] = leader[0]
+            else:
+                async with conversation_locks[item.conversation_id], semaphore:
+                    answer = await execute_agent_query(
+                        item.agent_name, item.user_input, item.model_name,
+                        item.conversation_id, item.memory_strategy, item.execution_mode, resolve_timeout(item.timeout)
+                    )
+                if shared is not None:
+                    shared.set_result(answer)
+            result.update(status="ok", response=answer["response"], reasoning=answer["reasoning"])
+        except Exception as e:
+            if shared is not None and not shared.done():
+                shared.set_exception(e)
+                # Followers re-raise it; mark it retrieved for the leader-only case
+                shared.exception()
+            logger.error(f"Batch Item Error: {e}")
+            result.update(status="error", response=f"Unexpected error occurred: {str(e)}", reasoning=str(e))
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        BATCH_ITEMS.inc(status="deduplicated" if result["deduplicated_from"] is not None else result["status"])
+        return result
+
+    tasks = [asyncio.ensure_future(run_item(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for pending in tasks:
+            pending.cancel()
+
+
+async def run_batch(items: Sequence[Any], max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Runs the batch to completion and returns the results in input order.
+    """
+    results: List[Dict[str, Any]] = [None] * len(items)
+    async for result in iter_batch(items, max_concurrency):
+        results[result["index"]] = result
+    return results
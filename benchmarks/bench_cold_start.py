@@ -0,0 +1,98 @@
+# benchmarks/bench_cold_start.py
+#
+# Measures cold start in fresh interpreters: time to import server.py, time
+# until /ready, and the latency of the first request per agent, with and
+# without the pre-warm phase.
+#
+#   python benchmarks/bench_cold_start.py --runs 3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Runs inside the child interpreter; prints one JSON line
+CHILD = r"""
+import json, os, sys, time
+sys.path.insert(0, sys.argv[1]); sys.path.insert(0, sys.argv[2])
+from fakes import ScriptedLLM, start_stub_upstreams
+stubs = start_stub_upstreams()
+for env_var, stub in stubs.items():
+    os.environ[env_var] = stub.url
+os.environ.setdefault("RATE_LIMITS_ENABLED", "false")
+
+started = time.perf_counter()
+import server
+import_seconds = time.perf_counter() - started
+
+from agents import agent_registry, AGENT_NAMES
+from fastapi.testclient import TestClient
+for model in ("gemini", "qwen"):
+    agent_registry.register_llm(model, ScriptedLLM(latency=0.0, skip_tools=("create_note", "update_note", "delete_note", "show_note")))
+
+started = time.perf_counter()
+with TestClient(server.app) as client:
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.005)
+    ready_seconds = time.perf_counter() - started
+    first = {}
+    for agent_name in AGENT_NAMES:
+        body = {"agent_name": agent_name, "user_input": "Tell me something #1", "model_name": "gemini", "conversation_id": agent_name}
+        t = time.perf_counter()
+        client.post("/query", json=body)
+        first[agent_name] = time.perf_counter() - t
+    status = client.get("/ready").json()
+
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "ready_seconds": ready_seconds,
+    "first_request_ms": {k: round(v * 1000, 2) for k, v in first.items()},
+    "prewarm_steps": status["steps"],
+}))
+"""
+
+
+def run_child(prewarm: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix="prism-cold-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'cold.db')}",
+        PREWARM_ENABLED="true" if prewarm else "false",
+        ENABLED_MODELS="gemini",
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD, ROOT_DIR, BENCH_DIR], env=env, cwd=workdir, stderr=subprocess.DEVNULL, text=True
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs: list) -> dict:
+    firsts = [statistics.mean(r["first_request_ms"].values()) for r in runs]
+    return {
+        "import_ms": round(statistics.median(r["import_seconds"] for r in runs) * 1000, 1),
+        "ready_ms": round(statistics.median(r["ready_seconds"] for r in runs) * 1000, 1),
+        "mean_first_request_ms": round(statistics.median(firsts), 2),
+        "last_run": runs[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {
+        "prewarm_off": summarize([run_child(False) for _ in range(args.runs)]),
+        "prewarm_on": summarize([run_child(True) for _ in range(args.runs)]),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/bench_concurrent_writes.py
+#
+# Many threads appending conversation turns at once, with readers running
+# alongside, under three storage modes:
+#   direct        rollback journal, one session and commit per write (the old path)
+#   wal_direct    WAL and tuned pragmas, still one commit per write
+#   group_commit  WAL plus the background group-commit writer
+# Each mode runs in a fresh interpreter against its own scratch database.
+#
+#   python benchmarks/bench_concurrent_writes.py --writers 32 --turns 50 --readers 4
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+MODES = {
+    "direct": {"SQLITE_WAL": "false", "DB_GROUP_COMMIT": "false"},
+    "wal_direct": {"SQLITE_WAL": "true", "DB_GROUP_COMMIT": "false"},
+    "group_commit": {"SQLITE_WAL": "true", "DB_GROUP_COMMIT": "true"},
+}
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def run_mode(mode: str, writers: int, turns: int, readers: int) -> dict:
+    sys.path.insert(0, ROOT_DIR)
+    from sqlalchemy.orm import sessionmaker
+    from db import engine
+    from history import append_turn, get_recent_messages
+    from writer import db_writer
+
+    # Without the writer every call opens its own session, like the old request path
+    direct_sessions = None if mode == "group_commit" else sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    write_latencies, read_latencies, errors = [], [], []
+    done = threading.Event()
+
+    def writer(i: int):
+        for turn in range(turns):
+            started = time.perf_counter()
+            try:
+                append_turn(f"conv-{i}", "Bench Agent", "gemini", f"question {turn}", "answer " * 40, session_factory=direct_sessions)
+            except Exception as e:
+                errors.append(str(e).splitlines()[0])
+            write_latencies.append(time.perf_counter() - started)
+
+    def reader(i: int):
+        while not done.is_set():
+            started = time.perf_counter()
+            get_recent_messages(f"conv-{i % writers}", 10)
+            read_latencies.append(time.perf_counter() - started)
+            # Think time between requests, as a memory rehydration would have
+            time.sleep(0.005)
+
+    reader_threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in reader_threads:
+        t.start()
+    started = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    for t in reader_threads:
+        t.join()
+
+    return {
+        "mode": mode,
+        "turns": writers * turns,
+        "turns_per_second": round(writers * turns / elapsed, 1),
+        "write_p50_ms": round(percentile(write_latencies, 50) * 1000, 2),
+        "write_p95_ms": round(percentile(write_latencies, 95) * 1000, 2),
+        "write_p99_ms": round(percentile(write_latencies, 99) * 1000, 2),
+        "read_p95_ms": round(percentile(read_latencies, 95) * 1000, 2),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "writer": db_writer.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent conversation write benchmark")
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=50, help="turns appended per writer")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--child", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.writers, args.turns, args.readers)))
+        return
+
+    results = []
+    for mode, env_overrides in MODES.items():
+        workdir = tempfile.mkdtemp(prefix="prism-writes-")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'writes.db')}", **env_overrides)
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--writers", str(args.writers),
+             "--turns", str(args.turns), "--readers", str(args.readers)],
+            env=env, cwd=workdir, stderr=subprocess.DEVNULL, text=True
+        )
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_message_store.py
+#
+# Compares per-turn write cost of the legacy chat_history blob against the
+# append-only messages table.
+#
+#   python benchmarks/bench_message_store.py --turns 5000 --window 500
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Point db.py at a scratch database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix="prism-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import SessionLocal, Conversation  # noqa: E402
+from history import append_turn  # noqa: E402
+
+RESPONSE = "• " + "A typical bullet-point answer from the agent. " * 8
+
+
+def legacy_append(conversation_id: str, user_input: str, response: str) -> None:
+    session_db = SessionLocal()
+    try:
+        conversation = session_db.query(Conversation).filter_by(id=conversation_id).first()
+        if not conversation:
+            conversation = Conversation(id=conversation_id, agent_name="Bench Agent", model_name="gemini", chat_history="")
+            session_db.add(conversation)
+        conversation.chat_history += f"User: {user_input}\nAssistant: {response}\n"
+        session_db.commit()
+    finally:
+        session_db.close()
+
+
+def message_append(conversation_id: str, user_input: str, response: str) -> None:
+    append_turn(conversation_id, "Bench Agent", "gemini", user_input, response)
+
+
+def run(name: str, write, turns: int, window: int) -> list:
+    points = []
+    started = time.perf_counter()
+    for turn in range(1, turns + 1):
+        write(f"bench-{name}", f"question number {turn}", RESPONSE)
+        if turn % window == 0:
+            elapsed = time.perf_counter() - started
+            points.append({"turn": turn, "ms_per_turn": round(elapsed * 1000 / window, 3)})
+            started = time.perf_counter()
+    return points
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message store write benchmark")
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--window", type=int, default=500)
+    args = parser.parse_args()
+
+    results = {
+        "turns": args.turns,
+        "legacy_blob": run("legacy", legacy_append, args.turns, args.window),
+        "messages_table": run("messages", message_append, args.turns, args.window),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/bench_notes_search.py
+#
+# Times ranked FTS5 note search against a LIKE scan over a synthetic corpus.
+#
+#   python benchmarks/bench_notes_search.py --notes 100000
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Point db.py at a scratch database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix="prism-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import engine, SessionLocal, Note  # noqa: E402
+from notes import find_notes  # noqa: E402
+
+COMMON_WORDS = [
+    "milk", "eggs", "bread", "meeting", "budget", "travel", "flight", "hotel", "recipe", "garden",
+    "invoice", "project", "deadline", "birthday", "doctor", "appointment", "workout", "reminder",
+]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(size)]
+
+
+def populate(count: int, vocabulary: list, rng: random.Random) -> float:
+    rows = [
+        {
+            "name": f"note-{i}",
+            "content": " ".join(rng.choices(COMMON_WORDS, k=5) + rng.choices(vocabulary, k=rng.randint(10, 60))),
+            "location": rng.choice(["desktop", "documents"]),
+        }
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(Note.__table__.insert(), rows)
+    return time.perf_counter() - started
+
+
+def like_search(query: str, limit: int = 20) -> list:
+    session_db = SessionLocal()
+    try:
+        q = session_db.query(Note)
+        for word in query.split():
+            q = q.filter(Note.content.like(f"%{word}%"))
+        return q.limit(limit).all()
+    finally:
+        session_db.close()
+
+
+def time_queries(search, queries: list) -> dict:
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notes search benchmark")
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    insert_seconds = populate(args.notes, vocabulary, rng)
+    # One common word plus one rarer word, like "recipe pancakes"
+    queries = [f"{rng.choice(COMMON_WORDS)} {rng.choice(vocabulary)}" for _ in range(args.queries)]
+    results = {
+        "notes": args.notes,
+        "queries": args.queries,
+        "insert_seconds_with_index": round(insert_seconds, 3),
+        "fts5_ranked": time_queries(lambda q: find_notes(q, limit=20), queries),
+        "like_scan": time_queries(like_search, queries),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# benchmarks/fakes.py
+#
+# Deterministic stand-ins for the LLM backends and the upstream tool APIs,
+# so the service can be exercised without network access or API keys.
+
+import asyncio
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain.llms.base import LLM
+
+# The ReAct and plan prompts both list tool names as "one of [a, b]"
+TOOL_NAMES = re.compile(r"one of \[([^\]]*)\]")
+PLAN_REQUEST = "Plan every tool call"
+
+# Chat template markers FakeOllama wraps non-raw prompts in
+USER_TURN = "<|user|>\n"
+ASSISTANT_TURN = "<|end|>\n<|assistant|>\n"
+
+STUB_PAYLOADS = {
+    "serpapi": {"organic_results": [
+        {"snippet": "Ingredients: flour, milk, eggs, sugar, butter and a pinch of salt."},
+        {"snippet": "Classic recipe ingredients for fluffy results every time."},
+    ]},
+    "youtube": {"items": [{"id": {"videoId": "dQw4w9WgXcQ"}}]},
+    "news": {"articles": [{"title": f"Headline number {i}"} for i in range(1, 6)]},
+    "weather": {"weather": [{"description": "clear sky"}], "main": {"temp": 22.5}},
+}
+
+
+class ScriptedLLM(LLM):
+    """
+    Fake LLM that plays a fixed two-step ReAct transcript.
+
+    The first call in a run picks the first tool listed in the prompt that is
+    not in skip_tools and passes it the question; once an observation is
+    present it returns a final answer. Asked for a plan, it lists every
+    usable tool.
+    """
+
+    def __init__(self, latency: float = 0.05, skip_tools: tuple = (), **kwargs):
+        super().__init__(**kwargs)
+        self._latency = latency
+        self._skip_tools = set(skip_tools)
+        self._model_name = "scripted"
+        self._calls = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def get_num_tokens(self, text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _respond(self, prompt: str) -> str:
+        self._calls += 1
+        question = prompt.rsplit("Question:", 1)[-1]
+        if "Observation:" in question or "Tool results:" in question:
+            return "Thought: I now know the final answer\nFinal Answer: • Here is what I found."
+        match = TOOL_NAMES.search(prompt)
+        names = [n.strip() for n in match.group(1).split(",")] if match else []
+        tools = [n for n in names if n and n not in self._skip_tools]
+        if not tools:
+            return "Thought: No tools needed\nFinal Answer: • Here is my answer."
+        tool_input = question.splitlines()[0].strip()
+        if PLAN_REQUEST in prompt:
+            return "\n".join(f"Action: {tool}\nAction Input: {tool_input}" for tool in tools)
+        return f"Thought: I should use {tools[0]}\nAction: {tools[0]}\nAction Input: {tool_input}"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        time.sleep(self._latency)
+        return self._respond(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        await asyncio.sleep(self._latency)
+        response = self._respond(prompt)
+        if run_manager is not None:
+            await run_manager.on_llm_new_token(response)
+        return response
+
+
+class StubUpstream:
+    """
+    Local HTTP server that answers every GET with a canned JSON payload.
+    """
+
+    def __init__(self, payload: Dict[str, Any], latency: float = 0.0):
+        body = json.dumps(payload).encode("utf-8")
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.requests += 1
+                if latency:
+                    time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+    def start(self) -> "StubUpstream":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeOllama:
+    """
+    Local HTTP server that speaks enough of the Ollama API for the model
+    gateway: POST /api/generate, streaming or not. Answers come from
+    respond(prompt). It records peak concurrency and keep_alive per model so
+    tests can check what the gateway sends.
+
+    Prompts are split into word tokens and templated unless raw; context and
+    the token counts come back like Ollama's. Each of `slots` cache slots
+    keeps its last sequence, and only tokens past the longest cached prefix
+    count as processed, so prompt reuse can be measured.
+    """
+
+    def __init__(self, respond: Callable[[str], str], latency: float = 0.0, slots: int = 4):
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+        self.loaded: Dict[str, Any] = {}
+        self.prompt_tokens = 0
+        self.prompt_tokens_processed = 0
+        self._vocab: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._slots: List[List[int]] = []
+        self._max_slots = slots
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, body: bytes, content_type: str = "application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                model = payload.get("model", "")
+                with fake._lock:
+                    fake.requests += 1
+                    fake.active += 1
+                    fake.peak_active = max(fake.peak_active, fake.active)
+                    fake.loaded[model] = payload.get("keep_alive")
+                try:
+                    if "prompt" not in payload:
+                        self._send(json.dumps({"model": model, "response": "", "done": True}).encode("utf-8"))
+                        return
+                    if latency:
+                        time.sleep(latency)
+                    prompt = payload["prompt"] if payload.get("raw") else f"{USER_TURN}{payload['prompt']}{ASSISTANT_TURN}"
+                    with fake._lock:
+                        tokens = fake._tokenize(fake._detokenize(payload.get("context") or []) + prompt)
+                    full_text = fake._detokenize(tokens).replace(USER_TURN, "").replace(ASSISTANT_TURN, "")
+                    text = respond(full_text)
+                    with fake._lock:
+                        done = fake._finish(tokens, text)
+                    done["model"] = model
+                    if payload.get("stream", True):
+                        lines = [{"model": model, "response": word, "done": False} for word in re.findall(r"\S+\s*", text)]
+                        lines.append(dict(done, response=""))
+                        body = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+                        self._send(body, "application/x-ndjson")
+                    else:
+                        self._send(json.dumps(dict(done, response=text)).encode("utf-8"))
+                finally:
+                    with fake._lock:
+                        fake.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _tokenize(self, text: str) -> List[int]:
+        ids = []
+        for word in re.findall(r"\S+\s*|\s+", text):
+            if word not in self._vocab:
+                self._vocab[word] = len(self._words)
+                self._words.append(word)
+            ids.append(self._vocab[word])
+        return ids
+
+    def _detokenize(self, ids: List[int]) -> str:
+        return "".join(self._words[i] for i in ids)
+
+    def _finish(self, tokens: List[int], text: str) -> Dict[str, Any]:
+        def shared(cached: List[int]) -> int:
+            n = 0
+            while n < min(len(cached), len(tokens)) and cached[n] == tokens[n]:
+                n += 1
+            return n
+
+        best = max(range(len(self._slots)), key=lambda i: shared(self._slots[i]), default=None)
+        reused = shared(self._slots[best]) if best is not None else 0
+        # Like Ollama, the context is the prompt and response tokenized together
+        sequence = self._tokenize(self._detokenize(tokens) + text)
+        if reused or len(self._slots) >= self._max_slots:
+            self._slots.pop(best if reused else 0)
+        self._slots.append(sequence)
+        self.prompt_tokens += len(tokens)
+        self.prompt_tokens_processed += len(tokens) - reused
+        return {"done": True, "context": sequence, "prompt_eval_count": len(tokens) - reused, "eval_count": len(sequence) - len(tokens)}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> "FakeOllama":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeRedis:
+    """
+    Local TCP server that speaks enough of the Redis protocol for the state
+    store: GET, MGET, SET with PX/EX, DEL and WATCH/MULTI/EXEC transactions.
+    """
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        # Bumped on every write so WATCH can tell whether a key changed
+        self.revisions: Dict[bytes, int] = {}
+        self.commands = 0
+        self.aborted = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                watched: Dict[bytes, int] = {}
+                queued: Optional[List[List[bytes]]] = None
+                while True:
+                    args = fake._read_command(self.rfile)
+                    if args is None:
+                        return
+                    name = args[0].upper()
+                    if queued is not None and name not in (b"EXEC", b"DISCARD", b"MULTI", b"WATCH"):
+                        queued.append(args)
+                        self.wfile.write(b"+QUEUED\r\n")
+                        continue
+                    with fake.lock:
+                        fake.commands += 1
+                        if name == b"WATCH":
+                            for key in args[1:]:
+                                watched[key] = fake.revisions.get(key, 0)
+                            reply = b"+OK\r\n"
+                        elif name == b"UNWATCH":
+                            watched = {}
+                            reply = b"+OK\r\n"
+                        elif name == b"MULTI":
+                            queued = []
+                            reply = b"+OK\r\n"
+                        elif name == b"DISCARD":
+                            queued, watched = None, {}
+                            reply = b"+OK\r\n"
+                        elif name == b"EXEC":
+                            if any(fake.revisions.get(k, 0) != r for k, r in watched.items()):
+                                fake.aborted += 1
+                                reply = b"*-1\r\n"
+                            else:
+                                replies = [fake._execute(command) for command in queued or []]
+                                reply = b"*%d\r\n" % len(replies) + b"".join(replies)
+                            queued, watched = None, {}
+                        else:
+                            reply = fake._execute(args)
+                    self.wfile.write(reply)
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def _read_command(rfile) -> Optional[List[bytes]]:
+        line = rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(rfile.readline()[1:-2])
+            args.append(rfile.read(length + 2)[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        value = self.data.get(key)
+        if value is None:
+            return None
+        if value[1] is not None and value[1] < time.monotonic():
+            del self.data[key]
+            return None
+        return value[0]
+
+    def _execute(self, args: List[bytes]) -> bytes:
+        # Called with self.lock held
+        name = args[0].upper()
+        if name in (b"PING", b"AUTH", b"SELECT", b"CLIENT"):
+            return b"+PONG\r\n" if name == b"PING" else b"+OK\r\n"
+        if name == b"GET":
+            return self._bulk(self._get(args[1]))
+        if name == b"MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(self._get(k)) for k in args[1:])
+        if name == b"SET":
+            expires = None
+            options = [a.upper() for a in args[3:]]
+            if b"PX" in options:
+                expires = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            self.data[args[1]] = (args[2], expires)
+            self.revisions[args[1]] = self.revisions.get(args[1], 0) + 1
+            return b"+OK\r\n"
+        if name == b"DEL":
+            deleted = 0
+            for key in args[1:]:
+                if self.data.pop(key, None) is not None:
+                    deleted += 1
+                    self.revisions[key] = self.revisions.get(key, 0) + 1
+            return b":%d\r\n" % deleted
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.server.server_address[1]}/0"
+
+    def start(self) -> "FakeRedis":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stub_upstreams(latency: float = 0.0) -> Dict[str, StubUpstream]:
+    """
+    Starts one stub per upstream API and returns them keyed by the env var
+    tools.py reads its URL from. Set those env vars before importing tools.
+    """
+    return {
+        "SERPAPI_URL": StubUpstream(STUB_PAYLOADS["serpapi"], latency).start(),
+        "YOUTUBE_SEARCH_URL": StubUpstream(STUB_PAYLOADS["youtube"], latency).start(),
+        "NEWS_URL": StubUpstream(STUB_PAYLOADS["news"], latency).start(),
+        "WEATHER_URL": StubUpstream(STUB_PAYLOADS["weather"], latency).start(),
+    }
@@ -0,0 +1,232 @@
+# benchmarks/load_test.py
+#
+# Offline load test for the /query pipeline. Fake LLMs and local stub upstreams
+# replace Gemini, Ollama and the tool APIs; requests go through the real
+# FastAPI app in server.py.
+#
+#   python benchmarks/load_test.py --requests 200 --concurrency 20
+#   python benchmarks/load_test.py --compare benchmarks/results/<earlier>.json
+#   python benchmarks/load_test.py --agents "Travel Itinerary Agent" --execution-mode plan
+#   python benchmarks/load_test.py --model qwen --fake-ollama
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fakes import FakeOllama, FakeRedis, ScriptedLLM, start_stub_upstreams  # noqa: E402
+
+AGENTS = {
+    "Cooking Agent": "How do I make pancakes",
+    "Notes Agent": "Find my grocery notes",
+    "News Agent": "Latest technology news",
+    "Entertainment Agent": "Recommend a sci-fi movie",
+    "Weather Agent": "Weather in Paris",
+    "Travel Itinerary Agent": "Plan 3 days in Tokyo",
+}
+
+# The note tools below take several arguments, which a single scripted
+# Action Input cannot supply, so the fake LLM never picks them
+MULTI_ARGUMENT_TOOLS = ("create_note", "update_note", "delete_note", "show_note")
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list, elapsed: float, errors: int) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def drive_agent(client, agent_name: str, prompt: str, model: str, total: int, concurrency: int, execution_mode: str = None) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        body = {
+            "agent_name": agent_name,
+            "user_input": f"{prompt} #{i}",
+            "model_name": model,
+            "conversation_id": str(uuid.uuid4()),
+            "execution_mode": execution_mode,
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/query", json=body)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200 or response.json().get("response", "").startswith("Unexpected error"):
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def run(args) -> dict:
+    import httpx
+    import server
+    import task
+    from agents import agent_registry
+
+    for model in ("gemini", "qwen"):
+        if model == "qwen" and args.fake_ollama:
+            # Keep the real QwenLLM so requests go through the model gateway
+            continue
+        agent_registry.register_llm(model, ScriptedLLM(latency=args.llm_latency, skip_tools=MULTI_ARGUMENT_TOOLS))
+
+    # Time the conversation writes without changing what they do
+    db_write_seconds = []
+    asave = task.asave_conversation_turn
+
+    async def timed_save(*a, **kw):
+        started = time.perf_counter()
+        try:
+            return await asave(*a, **kw)
+        finally:
+            db_write_seconds.append(time.perf_counter() - started)
+
+    task.asave_conversation_turn = timed_save
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        for agent_name, prompt in AGENTS.items():
+            if args.agents and agent_name not in args.agents:
+                continue
+            results[agent_name] = await drive_agent(
+                client, agent_name, prompt, args.model, args.requests, args.concurrency, args.execution_mode
+            )
+            print(f"{agent_name}: {results[agent_name]}", file=sys.stderr)
+        stats = (await client.get("/stats")).json()
+
+    return {
+        "agents": results,
+        "db_write": {
+            "writes": len(db_write_seconds),
+            "p50_ms": round(percentile(db_write_seconds, 50) * 1000, 3),
+            "p95_ms": round(percentile(db_write_seconds, 95) * 1000, 3),
+        },
+        "rss_mb": current_rss_mb(),
+        "stats": stats,
+    }
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline.get('commit')} ({baseline_path}):")
+    for agent_name, now in current["agents"].items():
+        before = baseline.get("agents", {}).get(agent_name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            delta = now[metric] - before[metric]
+            pct = (delta / before[metric] * 100) if before[metric] else 0.0
+            print(f"  {agent_name:24} {metric:15} {before[metric]:>10} -> {now[metric]:>10} ({pct:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline /query load test")
+    parser.add_argument("--requests", type=int, default=100, help="requests per agent")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--model", default="gemini")
+    parser.add_argument("--agents", nargs="*", help="limit the run to these agent names")
+    parser.add_argument("--execution-mode", choices=["react", "plan"], help="agent execution mode to request")
+    parser.add_argument("--fake-ollama", action="store_true", help="serve qwen from a local fake Ollama behind the model gateway")
+    parser.add_argument("--state-store", choices=["memory", "sqlite", "redis"], help="conversation state store; redis uses a local fake")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="seconds per stub upstream call")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    stubs = start_stub_upstreams(latency=args.tool_latency)
+    for env_var, stub in stubs.items():
+        os.environ[env_var] = stub.url
+    # The stubs have no quotas; set RATE_LIMITS_ENABLED=true to load test admission control
+    os.environ.setdefault("RATE_LIMITS_ENABLED", "false")
+    fake_ollama = None
+    if args.fake_ollama:
+        scripted = ScriptedLLM(skip_tools=MULTI_ARGUMENT_TOOLS)
+        fake_ollama = FakeOllama(scripted._respond, latency=args.llm_latency).start()
+        os.environ["OLLAMA_BASE_URL"] = fake_ollama.url
+    fake_redis = None
+    if args.state_store:
+        os.environ["STATE_STORE"] = args.state_store
+    if args.state_store == "redis":
+        fake_redis = FakeRedis().start()
+        os.environ["STATE_REDIS_URL"] = fake_redis.url
+    workdir = tempfile.mkdtemp(prefix="prism-load-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'load.db')}")
+
+    started = time.time()
+    report = asyncio.run(run(args))
+    report.update({
+        "commit": git_commit(),
+        "started_at": started,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "upstream_requests": {name: stub.requests for name, stub in stubs.items()},
+    })
+    if fake_ollama is not None:
+        report["fake_ollama"] = {"requests": fake_ollama.requests, "peak_active": fake_ollama.peak_active}
+        fake_ollama.stop()
+    if fake_redis is not None:
+        report["fake_redis"] = {"commands": fake_redis.commands, "aborted_transactions": fake_redis.aborted}
+        fake_redis.stop()
+    for stub in stubs.values():
+        stub.stop()
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"load-{report['commit']}-{int(started)}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# cache.py
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default time-to-live in seconds for each cached tool
+DEFAULT_TOOL_TTLS = {
+    "search_weather": 600,
+    "search_news": 300,
+    "search_youtube_videos": 3600,
+    "search_ingredients": 86400,
+}
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+
+    Any object with the same get/set/clear/stats methods can be passed to
+    ToolCache as a backend.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def normalize_key(value: str) -> str:
+    return " ".join(str(value).lower().split())
+
+
+class LeaderCancelled(Exception):
+    """
+    Raised to waiters on a coalesced lookup whose leading request was cancelled.
+    """
+
+
+class ToolCache:
+    """
+    Caches tool results per (tool, normalized input) with per-tool TTLs.
+
+    Concurrent identical lookups are coalesced so only one of them calls the
+    upstream API; the others wait for its result. Exceptions are never cached.
+    """
+
+    def __init__(self, backend: Optional[Any] = None, ttls: Optional[Dict[str, float]] = None, enabled: bool = True):
+        self.backend = backend if backend is not None else TTLCache(TOOL_CACHE_MAX_ENTRIES)
+        self.ttls = dict(DEFAULT_TOOL_TTLS)
+        for name in self.ttls:
+            override = os.getenv(f"TOOL_CACHE_TTL_{name.upper()}")
+            if override:
+                self.ttls[name] = float(override)
+        if ttls:
+            self.ttls.update(ttls)
+        self.enabled = enabled
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Tuple[threading.Event, Dict[str, Any]]] = {}
+        self._ainflight: Dict[Hashable, asyncio.Future] = {}
+
+    def _key(self, tool_name: str, tool_input: str) -> Tuple[str, str]:
+        return (tool_name, normalize_key(tool_input))
+
+    def _ttl(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, 0)
+
+    def get_or_call(self, tool_name: str, tool_input: str, fetch: Callable[[], Any]) -> Any:
+        if not self.enabled or self._ttl(tool_name) <= 0:
+            return fetch()
+        key = self._key(tool_name, tool_input)
+        while True:
+            found, value = self.backend.get(key)
+            if found:
+                return value
+
+            with self._lock:
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    self._inflight[key] = (threading.Event(), {})
+                else:
+                    self.coalesced += 1
+            if waiting is None:
+                break
+            event, outcome = waiting
+            event.wait()
+            if "error" in outcome:
+                raise outcome["error"]
+            if "value" in outcome:
+                return outcome["value"]
+            # The leader was interrupted without an outcome; look up again
+
+        event, outcome = self._inflight[key]
+        try:
+            value = fetch()
+            self.backend.set(key, value, self._ttl(tool_name))
+            outcome["value"] = value
+            return value
+        except Exception as e:
+            outcome["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    async def aget_or_call(self, tool_name: str, tool_input: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled or self._ttl(tool_name) <= 0:
+            return await fetch()
+        key = self._key(tool_name, tool_input)
+        while True:
+            found, value = self.backend.get(key)
+            if found:
+                return value
+
+            pending = self._ainflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                # Shield so a cancelled waiter does not cancel the shared lookup
+                return await asyncio.shield(pending)
+            except LeaderCancelled:
+                # Only the leader's request was cancelled; look up again and
+                # maybe lead the next attempt
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._ainflight[key] = future
+        try:
+            value = await fetch()
+            self.backend.set(key, value, self._ttl(tool_name))
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            # Cancellation belongs to the leader's request alone, so waiters get
+            # a retryable error instead
+            future.set_exception(LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            # Mark retrieved so an error nobody waited for is not logged
+            future.exception()
+            raise
+        finally:
+            del self._ainflight[key]
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self.backend.stats())
+        stats["coalesced"] = self.coalesced
+        stats["ttls"] = dict(self.ttls)
+        return stats
+
+
+tool_cache = ToolCache(enabled=TOOL_CACHE_ENABLED)
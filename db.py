@@ -1,14 +1,58 @@
 # db.py
 
-from sqlalchemy import create_engine, Column, String, Text, Integer
+import os
+import time
+from sqlalchemy import create_engine, event, Column, String, Text, Integer, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # Database setup
-DATABASE_URL = 'sqlite:///agents.db'
+DATABASE_URL = os.getenv("DATABASE_URL", 'sqlite:///agents.db')
+
+# SQLite tuning: WAL lets readers run alongside the single writer
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() in ("1", "true", "yes")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "20000"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+
+def configure_sqlite(bind) -> None:
+    """
+    Applies the journal mode and pragmas to every new connection of an SQLite engine.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(bind, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+def _is_memory_database(url: str) -> bool:
+    return url.startswith("sqlite") and (url.rstrip("/").endswith(":memory:") or url in ("sqlite://", "sqlite:///"))
+
+_pool_args = {} if _is_memory_database(DATABASE_URL) else {"pool_size": DB_READ_POOL_SIZE}
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, **_pool_args)
+configure_sqlite(engine)
+
+# All writes go through one connection so they never contend for the SQLite lock;
+# an in-memory database cannot be shared between engines, so it keeps one
+if DATABASE_URL.startswith("sqlite") and not _is_memory_database(DATABASE_URL):
+    write_engine = create_engine(
+        DATABASE_URL, connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0
+    )
+    configure_sqlite(write_engine)
+else:
+    write_engine = engine
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+WriteSession = sessionmaker(autocommit=False, autoflush=False, bind=write_engine)
 Base = declarative_base()
 
 class Note(Base):
@@ -23,7 +67,147 @@ class Conversation(Base):
     id = Column(String, primary_key=True, index=True)
     agent_name = Column(String, nullable=False)
     model_name = Column(String, nullable=False)
+    # Legacy transcript blob; new turns are stored in the messages table
     chat_history = Column(Text, nullable=True)
+    __table_args__ = (
+        # Keyset pages of /conversations filtered by agent and model
+        Index('ix_conversations_agent_model', 'agent_name', 'model_name', 'id'),
+    )
+
+class Message(Base):
+    __tablename__ = 'messages'
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(String, nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False, default=time.time)
+    __table_args__ = (
+        Index('ix_messages_conversation_seq', 'conversation_id', 'seq', unique=True),
+    )
+
+class ConversationState(Base):
+    __tablename__ = 'conversation_state'
+    # Serialized conversation memory shared between workers; see statestore.py
+    conversation_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+    data = Column(Text, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(String, primary_key=True)
+    # queued, running, succeeded, failed or timed_out
+    status = Column(String, nullable=False)
+    # JSON of the query the job runs
+    request = Column(Text, nullable=False)
+    webhook_url = Column(String, nullable=True)
+    timeout = Column(Float, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    webhook_status = Column(String, nullable=True)
+    created_at = Column(Float, nullable=False)
+    started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True)
+    # A running job whose lease has passed belongs to a worker that died
+    lease_expires_at = Column(Float, nullable=True)
+    __table_args__ = (
+        Index('ix_jobs_status_created', 'status', 'created_at'),
+    )
+
+def parse_chat_history(chat_history: str) -> list:
+    """
+    Splits a legacy "User: ...\nAssistant: ...\n" transcript into (role, content) pairs.
+    Lines that do not start a new turn belong to the previous message.
+    """
+    messages = []
+    for line in (chat_history or "").splitlines():
+        if line.startswith("User: "):
+            messages.append(["user", line[len("User: "):]])
+        elif line.startswith("Assistant: "):
+            messages.append(["assistant", line[len("Assistant: "):]])
+        elif messages:
+            messages[-1][1] += "\n" + line
+    return [tuple(m) for m in messages]
+
+def migrate_chat_history(session_factory=SessionLocal) -> int:
+    """
+    Copies legacy chat_history blobs into the messages table, once per conversation.
+    Returns the number of conversations migrated.
+    """
+    session_db = session_factory()
+    migrated = 0
+    try:
+        migrated_ids = session_db.query(Message.conversation_id).distinct()
+        pending = session_db.query(Conversation).filter(
+            Conversation.chat_history.isnot(None),
+            Conversation.chat_history != "",
+            ~Conversation.id.in_(migrated_ids)
+        ).all()
+        for conversation in pending:
+            now = time.time()
+            for seq, (role, content) in enumerate(parse_chat_history(conversation.chat_history), start=1):
+                session_db.add(Message(conversation_id=conversation.id, seq=seq, role=role, content=content, created_at=now))
+            migrated += 1
+        session_db.commit()
+        return migrated
+    except Exception:
+        session_db.rollback()
+        raise
+    finally:
+        session_db.close()
+
+def create_notes_index(conn) -> None:
+    """
+    Creates the FTS5 index over note name and content, plus the triggers that
+    keep it in sync with every insert, update and delete on the notes table.
+    Runs in the caller's transaction on conn.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'"
+    ).first()
+    if exists:
+        return
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE notes_fts USING fts5("
+        "name, content, content='notes', content_rowid='id', tokenize='porter unicode61')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+        "INSERT INTO notes_fts(rowid, name, content) VALUES (new.id, new.name, new.content); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+        "INSERT INTO notes_fts(notes_fts, rowid, name, content) VALUES ('delete', old.id, old.name, old.content); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER notes_fts_update AFTER UPDATE ON notes BEGIN "
+        "INSERT INTO notes_fts(notes_fts, rowid, name, content) VALUES ('delete', old.id, old.name, old.content); "
+        "INSERT INTO notes_fts(rowid, name, content) VALUES (new.id, new.name, new.content); END"
+    )
+    # Index notes that existed before the index did
+    conn.exec_driver_sql("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+
+def init_db(bind=write_engine) -> None:
+    """
+    Creates the tables, their indexes and the notes index, and migrates legacy
+    chat histories. Every process runs this on import, so on SQLite it holds
+    the write lock (BEGIN IMMEDIATE) throughout: a process that starts at the
+    same time waits, then finds every step already done.
+    """
+    with bind.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        Base.metadata.create_all(bind=conn)
+        # Indexes added to tables that already existed
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        create_notes_index(conn)
+        migrate_chat_history(lambda: WriteSession(bind=conn))
+        conn.commit()
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+init_db()
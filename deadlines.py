@@ -0,0 +1,192 @@
+# deadlines.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from metrics import registry
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Header a client can send instead of the timeout field, in seconds
+DEADLINE_HEADER = "X-Request-Timeout"
+# Applied when a request sets no timeout; 0 leaves such requests unbounded
+DEADLINE_DEFAULT_SECONDS = float(os.getenv("DEADLINE_DEFAULT_SECONDS", "0"))
+DEADLINE_MAX_SECONDS = float(os.getenv("DEADLINE_MAX_SECONDS", "600"))
+# Kept back at the end of a budget to put the partial answer together and save
+# the turn; short budgets keep back at most a quarter of themselves
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "0.5"))
+
+RATIO_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1, 1.25, 1.5, 2)
+
+DEADLINE_REQUESTS = registry.counter(
+    "prism_deadline_requests", "Requests run with a time budget, by whether they finished within it.", ["agent_name", "outcome"]
+)
+DEADLINE_EXCEEDED = registry.counter(
+    "prism_deadline_exceeded", "Work cut short by the request deadline, by agent and stage.", ["agent_name", "stage"]
+)
+DEADLINE_BUDGET_USED = registry.histogram(
+    "prism_deadline_budget_used", "Share of the request time budget used.", ["agent_name"], RATIO_BUCKETS
+)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Budget:
+    """
+    Time budget of one request. The deadline is a time.monotonic() value.
+    """
+
+    def __init__(self, agent_name: str, seconds: float):
+        self.agent_name = agent_name
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+        self.reserve = min(DEADLINE_RESERVE_SECONDS, seconds / 4)
+        self.stages: List[str] = []
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+
+current_budget: ContextVar[Optional[Budget]] = ContextVar("current_budget", default=None)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def resolve_timeout(timeout: Optional[float] = None, header: Optional[str] = None) -> Optional[float]:
+    """
+    Seconds a request may take: the timeout field, else the header, else the
+    default, capped at DEADLINE_MAX_SECONDS. None means no deadline.
+    """
+    if timeout is None and header:
+        try:
+            timeout = float(header)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {header!r}")
+    if timeout is None or timeout <= 0:
+        timeout = DEADLINE_DEFAULT_SECONDS
+    return min(timeout, DEADLINE_MAX_SECONDS) if timeout > 0 else None
+
+
+def current_deadline() -> Optional[float]:
+    budget = current_budget.get()
+    return budget.deadline if budget is not None else None
+
+
+def remaining() -> Optional[float]:
+    budget = current_budget.get()
+    return budget.remaining() if budget is not None else None
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def running_low() -> bool:
+    # True once only the reserve is left, so no new step should start
+    budget = current_budget.get()
+    return budget is not None and budget.remaining() <= budget.reserve
+
+
+def usable_seconds() -> Optional[float]:
+    """
+    Time left for agent steps, leaving the reserve for the answer.
+    """
+    budget = current_budget.get()
+    return None if budget is None else max(budget.remaining() - budget.reserve, 0.001)
+
+
+def clamp(timeout: float) -> float:
+    """
+    Shortens a per-call timeout to the time left. Raises DeadlineExceeded if
+    none is left.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("request deadline passed")
+    return min(timeout, left)
+
+
+def exceeded(stage: str) -> None:
+    """
+    Records that the deadline cut short one stage (queue, llm, tool or agent)
+    of the current request; each stage counts once per request.
+    """
+    budget = current_budget.get()
+    if budget is None or stage in budget.stages:
+        return
+    budget.stages.append(stage)
+    DEADLINE_EXCEEDED.inc(agent_name=budget.agent_name, stage=stage)
+
+
+def partial_answer(observations: List[str]) -> str:
+    """
+    Best answer from the tool results gathered before the budget ran out.
+    """
+    found = [o.strip() for o in observations if o and o.strip() and not o.lstrip().startswith(("• Unable", "Error:"))]
+    if not found:
+        return "• I ran out of time before I could find an answer. Please try again or allow more time."
+    # Later observations are usually the more specific ones
+    unique = list(dict.fromkeys(reversed(found)))
+    return "• I ran out of time before finishing. Here is what I found so far:\n" + "\n".join(reversed(unique[:3]))
+
+
+@contextmanager
+def time_budget(agent_name: str, seconds: Optional[float]) -> Iterator[Optional[Budget]]:
+    """
+    Puts a deadline seconds from now on everything the request runs. With no
+    seconds it does nothing.
+    """
+    if not seconds:
+        yield None
+        return
+    budget = Budget(agent_name, seconds)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        try:
+            current_budget.reset(token)
+        except ValueError:
+            # A streaming generator can be closed from a different context
+            current_budget.set(None)
+        used = time.monotonic() - budget.started
+        outcome = "exceeded" if budget.stages or used > seconds else "met"
+        DEADLINE_REQUESTS.inc(agent_name=agent_name, outcome=outcome)
+        DEADLINE_BUDGET_USED.observe(used / seconds, agent_name=agent_name)
+        with _stats_lock:
+            totals = _stats.setdefault(agent_name, {"requests": 0, "exceeded": 0, "budget_seconds": 0.0, "used_seconds": 0.0})
+            totals["requests"] += 1
+            totals["exceeded"] += outcome == "exceeded"
+            totals["budget_seconds"] += seconds
+            totals["used_seconds"] += used
+
+
+def deadline_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        agents = {
+            agent_name: {
+                "requests": totals["requests"],
+                "exceeded": totals["exceeded"],
+                "budget_used": round(totals["used_seconds"] / totals["budget_seconds"], 4) if totals["budget_seconds"] else 0.0,
+            }
+            for agent_name, totals in _stats.items()
+        }
+    return {
+        "default_seconds": DEADLINE_DEFAULT_SECONDS,
+        "max_seconds": DEADLINE_MAX_SECONDS,
+        "reserve_seconds": DEADLINE_RESERVE_SECONDS,
+        "agents": agents,
+    }
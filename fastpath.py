@@ -0,0 +1,239 @@
+# fastpath.py
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Pattern, Tuple
+from metrics import registry
+from tools import (
+    search_weather, asearch_weather, search_news, asearch_news,
+    show_note_tool, search_notes_tool
+)
+from tracing import current_trace, span
+from observations import full_text
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Extracted arguments longer than this, or joining several subjects, go to the agent
+MAX_ARGUMENT_CHARS = 60
+AMBIGUOUS_ARGUMENT = re.compile(r"\b(?:and|or|vs|versus|then|also)\b|[;&+/]", re.IGNORECASE)
+# Tool outputs that are no answer (failures, sheds, not found); the agent retries those
+NO_ANSWER = re.compile(
+    r"^\s*(?:•\s*Unable|Error:|Failed|Invalid|No .*\bfound\b|Note .*(?:not found|does not exist))|Answer without this tool",
+    re.IGNORECASE
+)
+# Words that never name a place ("weather in my city", "what's the weather here")
+WEATHER_PLACE_STOP_WORDS = (
+    r"i|i'm|me|my|mine|you|your|we|our|us|they|their|he|his|she|her|it|its|this|that|these|those|"
+    r"here|there|the|a|such|so|what|how|is|was"
+)
+# Words that make "<words> weather" chatter about the weather rather than a place
+WEATHER_CHATTER_WORDS = (
+    r"love|hate|like|nice|good|great|bad|terrible|awful|horrible|lovely|beautiful|perfect|crazy|weird|strange|"
+    r"hot|cold|warm|cool|wet|dry|sunny|rainy|windy|stormy|gloomy|fine|current|today|now"
+)
+# Time words after a place that only restate that the tool reports current conditions
+WEATHER_NOW = r"(?:,? (?:today|now|right now|currently|at the moment))?"
+
+FAST_PATH_REQUESTS = registry.counter(
+    "prism_fast_path_requests", "Queries seen by the fast path router by outcome.", ["agent_name", "intent", "outcome"]
+)
+FAST_PATH_SECONDS = registry.histogram(
+    "prism_fast_path_seconds", "Time to answer a query on the fast path.", ["agent_name", "intent"]
+)
+
+
+def normalize_input(user_input: str) -> str:
+    return " ".join(user_input.split()).rstrip("?.! ")
+
+
+class IntentRule:
+    """
+    Maps inputs for one agent that fully match one of the patterns onto a
+    single tool call. The named groups of the match are the tool arguments.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        agent_name: str,
+        patterns: List[str],
+        func: Callable[..., str],
+        coroutine: Optional[Callable[..., Awaitable[str]]] = None,
+        template: str = "{output}",
+        reject: Optional[str] = None
+    ):
+        self.name = name
+        self.agent_name = agent_name
+        self.patterns: List[Pattern] = [re.compile(p, re.IGNORECASE) for p in patterns]
+        self.func = func
+        self.coroutine = coroutine
+        self.template = template
+        self.reject = re.compile(reject, re.IGNORECASE) if reject else None
+
+    def match(self, text: str) -> Optional[Dict[str, str]]:
+        if self.reject is not None and self.reject.search(text):
+            return None
+        for pattern in self.patterns:
+            m = pattern.fullmatch(text)
+            if m is None:
+                continue
+            arguments = {k: v.strip(" \"'") for k, v in m.groupdict().items() if v}
+            if not arguments or any(
+                len(v) > MAX_ARGUMENT_CHARS or AMBIGUOUS_ARGUMENT.search(v) for v in arguments.values()
+            ):
+                return None
+            return arguments
+        return None
+
+    def answered(self, output: str) -> bool:
+        return not NO_ANSWER.search(full_text(output))
+
+    def render(self, output: str, arguments: Dict[str, str]) -> str:
+        # The answer goes straight to the user, so it gets the full tool result
+        return self.template.format(output=full_text(output), **arguments)
+
+
+DEFAULT_RULES = [
+    IntentRule(
+        "weather", "Weather Agent",
+        [
+            rf"(?:what(?:'s| is) the |how(?:'s| is) the |current )?weather (?:like )?(?:in|for|at) "
+            rf"(?!.*\b(?:{WEATHER_PLACE_STOP_WORDS})\b)(?P<location>[\w .,'-]+?){WEATHER_NOW}",
+            rf"(?:in )?(?!.*\b(?:{WEATHER_PLACE_STOP_WORDS}|{WEATHER_CHATTER_WORDS})\b.* weather)"
+            rf"(?P<location>[\w .'-]+?) weather{WEATHER_NOW}",
+        ],
+        search_weather, asearch_weather,
+        # The tool only reports current conditions
+        reject=r"\b(?:tomorrow|tonight|yesterday|week|weekend|forecast|next|last|will|should|rain|umbrella)\b"
+    ),
+    IntentRule(
+        "show_note", "Notes Agent",
+        [
+            r"(?:show|open|read|display|view)(?: me)? (?:my |the )?(?P<note_name>[\w .'-]+?) note (?:in|from|on) (?:my |the )?(?P<location>desktop|documents)",
+            r"(?:show|open|read|display|view)(?: me)? (?:my |the )?note (?P<note_name>[\w .'-]+?) (?:in|from|on) (?:my |the )?(?P<location>desktop|documents)",
+        ],
+        lambda note_name, location: show_note_tool(note_name, location.lower()),
+        template="• {output}"
+    ),
+    IntentRule(
+        "search_notes", "Notes Agent",
+        [r"(?:find|search|search for|look up)(?: my)? notes? (?:about|for|on|with|mentioning) (?P<query>[\w .'-]+)"],
+        search_notes_tool
+    ),
+    IntentRule(
+        "news", "News Agent",
+        [r"(?:latest |top |recent )?(?:news|headlines) (?:about|on|for) (?P<query>[\w .'-]+)"],
+        search_news, asearch_news
+    ),
+]
+
+
+class FastPathRouter:
+    """
+    Answers simple single-tool queries without running the ReAct agent.
+
+    A query is served only when exactly one rule for its agent matches;
+    anything else returns None and the caller falls back to the full agent.
+    Rules can be added at runtime with register().
+    """
+
+    def __init__(self, rules: Optional[List[IntentRule]] = None, enabled: bool = FAST_PATH_ENABLED):
+        self.enabled = enabled
+        self._rules: Dict[str, List[IntentRule]] = {}
+        self._lock = threading.Lock()
+        self._served = 0
+        self._fallbacks = 0
+        self._seconds: Dict[str, float] = {}
+        self._hits: Dict[str, int] = {}
+        for rule in rules or []:
+            self.register(rule)
+
+    def register(self, rule: IntentRule) -> None:
+        self._rules.setdefault(rule.agent_name, []).append(rule)
+
+    def match(self, agent_name: str, user_input: str) -> Optional[Tuple[IntentRule, Dict[str, str]]]:
+        if not self.enabled:
+            return None
+        text = normalize_input(user_input)
+        matches = []
+        for rule in self._rules.get(agent_name, []):
+            arguments = rule.match(text)
+            if arguments is not None:
+                matches.append((rule, arguments))
+        return matches[0] if len(matches) == 1 else None
+
+    def _record(self, agent_name: str, rule: Optional[IntentRule], elapsed: float = 0.0) -> None:
+        intent = rule.name if rule else ""
+        FAST_PATH_REQUESTS.inc(agent_name=agent_name, intent=intent, outcome="served" if rule else "fallback")
+        with self._lock:
+            if rule is None:
+                self._fallbacks += 1
+                return
+            self._served += 1
+            self._hits[rule.name] = self._hits.get(rule.name, 0) + 1
+            self._seconds[rule.name] = self._seconds.get(rule.name, 0.0) + elapsed
+        FAST_PATH_SECONDS.observe(elapsed, agent_name=agent_name, intent=intent)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.mode = "fast_path"
+        logger.info(f"Fast path '{intent}' answered for '{agent_name}' in {elapsed * 1000:.1f}ms")
+
+    def route(self, agent_name: str, user_input: str) -> Optional[str]:
+        matched = self.match(agent_name, user_input)
+        if matched is None:
+            self._record(agent_name, None)
+            return None
+        rule, arguments = matched
+        started = time.perf_counter()
+        with span("fast_path", rule.name):
+            output = rule.func(**arguments)
+        if not rule.answered(output):
+            logger.info(f"Fast path '{rule.name}' got no answer for '{agent_name}', falling back to the agent")
+            self._record(agent_name, None)
+            return None
+        self._record(agent_name, rule, time.perf_counter() - started)
+        return rule.render(output, arguments)
+
+    async def aroute(self, agent_name: str, user_input: str) -> Optional[str]:
+        matched = self.match(agent_name, user_input)
+        if matched is None:
+            self._record(agent_name, None)
+            return None
+        rule, arguments = matched
+        started = time.perf_counter()
+        with span("fast_path", rule.name):
+            if rule.coroutine is not None:
+                output = await rule.coroutine(**arguments)
+            else:
+                output = await asyncio.to_thread(rule.func, **arguments)
+        if not rule.answered(output):
+            logger.info(f"Fast path '{rule.name}' got no answer for '{agent_name}', falling back to the agent")
+            self._record(agent_name, None)
+            return None
+        self._record(agent_name, rule, time.perf_counter() - started)
+        return rule.render(output, arguments)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._served + self._fallbacks
+            return {
+                "enabled": self.enabled,
+                "served": self._served,
+                "fallbacks": self._fallbacks,
+                "share": round(self._served / total, 4) if total else 0.0,
+                "intents": {
+                    name: {"served": hits, "mean_ms": round(self._seconds[name] / hits * 1000, 3)}
+                    for name, hits in self._hits.items()
+                },
+            }
+
+
+fast_path = FastPathRouter(DEFAULT_RULES)
@@ -0,0 +1,494 @@
+# gateway.py
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import httpx
+from metrics import registry
+from tracing import record_prompt_tokens
+from deadlines import DeadlineExceeded, clamp, exceeded, remaining
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+# How long Ollama keeps a model loaded after a request; "-1" pins it in memory
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Ollama batches concurrent requests across OLLAMA_NUM_PARALLEL slots, so
+# keeping that many in flight per model fills its batch without queueing inside it
+GATEWAY_MAX_IN_FLIGHT = int(os.getenv("GATEWAY_MAX_IN_FLIGHT", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+GATEWAY_MAX_QUEUE = int(os.getenv("GATEWAY_MAX_QUEUE", "256"))
+# Longest a blocking caller without a deadline waits for a slot, so a sync call
+# cannot wait forever on slots held by requests on the event loop
+GATEWAY_SYNC_WAIT_SECONDS = float(os.getenv("GATEWAY_SYNC_WAIT_SECONDS", "60"))
+GATEWAY_WARM_MODELS = [m.strip() for m in os.getenv("GATEWAY_WARM_MODELS", "qwen2.5:3b").split(",") if m.strip()]
+# When a prompt extends the session's previous prompt and response (the next
+# ReAct iteration), continue from the context Ollama returned and send only the new text
+GATEWAY_CONTEXT_REUSE = os.getenv("GATEWAY_CONTEXT_REUSE", "true").lower() in ("1", "true", "yes")
+GATEWAY_CONTEXT_SESSIONS = int(os.getenv("GATEWAY_CONTEXT_SESSIONS", "256"))
+
+# Interactive requests are always admitted before queued batch work
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+request_priority: ContextVar[str] = ContextVar("request_priority", default="interactive")
+# Conversation whose generations may be continued; set when an agent is bound
+prompt_session: ContextVar[Optional[str]] = ContextVar("prompt_session", default=None)
+
+# (model, prompt, stop, session) of a generation that identical requests share
+PendingKey = Tuple[str, str, Tuple[str, ...], Optional[str]]
+
+GATEWAY_WAIT_SECONDS = registry.histogram(
+    "prism_gateway_wait_seconds", "Time a model request waited in the gateway queue.", ["model", "priority"]
+)
+GATEWAY_QUEUE_DEPTH = registry.gauge(
+    "prism_gateway_queue_depth", "Model requests waiting in the gateway queue.", ["model", "priority"]
+)
+GATEWAY_IN_FLIGHT = registry.gauge(
+    "prism_gateway_in_flight", "Model requests running on the backend.", ["model"]
+)
+GATEWAY_REQUESTS = registry.counter(
+    "prism_gateway_requests", "Model requests by outcome.", ["model", "priority", "outcome"]
+)
+
+
+class GatewayOverloaded(Exception):
+    pass
+
+
+def continuation(previous_prompt: str, previous_response: str, prompt: str) -> Optional[str]:
+    """
+    Returns the text prompt adds after previous_prompt and previous_response,
+    or None if it does not extend them. Callers strip responses before
+    feeding them back, so whitespace around the response is ignored.
+    """
+    response = previous_response.strip()
+    if not response or not prompt.startswith(previous_prompt):
+        return None
+    rest = prompt[len(previous_prompt):].lstrip()
+    if not rest.startswith(response):
+        return None
+    return rest[len(response):] or None
+
+
+class _ModelQueue:
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.waiting: List[Tuple[int, int, Callable[[], None], str]] = []
+        self.depth = {priority: 0 for priority in PRIORITIES}
+
+
+class ModelGateway:
+    """
+    Single entry point for local model calls to Ollama.
+
+    Requests for each model wait in a bounded priority queue and at most
+    max_in_flight run at once; interactive requests overtake batch ones.
+    Every request carries keep_alive so the model stays resident between
+    bursts, and identical prompts already in flight share one generation.
+
+    Per session it keeps the context of the last generation; a prompt that
+    extends that prompt and response is sent as a raw continuation of it, so
+    Ollama reuses the cached prefix instead of re-templating the whole prompt.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        timeout: float = OLLAMA_TIMEOUT,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        max_in_flight: int = GATEWAY_MAX_IN_FLIGHT,
+        max_queue: int = GATEWAY_MAX_QUEUE,
+        context_reuse: bool = GATEWAY_CONTEXT_REUSE,
+        max_sessions: int = GATEWAY_CONTEXT_SESSIONS
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect=3.0)
+        self.keep_alive = keep_alive
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.context_reuse = context_reuse
+        self.max_sessions = max_sessions
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._client: Optional[httpx.Client] = None
+        # Async client and coalesced generations of each event loop that made calls
+        self._aclients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Dict[PendingKey, list]]] = {}
+        # (model, session) -> (prompt, response, context) of the last generation
+        self._contexts: "OrderedDict[Tuple[str, str], Tuple[str, str, List[int]]]" = OrderedDict()
+
+        self._served = 0
+        self._rejected = 0
+        self._coalesced = 0
+        self._continued = 0
+        self._wait_seconds = 0.0
+        self._warmed: List[str] = []
+
+    # Clients
+
+    def _get_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(base_url=self.base_url, timeout=self.timeout)
+            return self._client
+
+    def _loop_state(self) -> Tuple[httpx.AsyncClient, Dict[PendingKey, list]]:
+        """
+        Async client and pending generations for the running event loop. Both
+        only work on their own loop, so a worker thread's asyncio.run() never
+        reuses the server loop's connections or awaits its futures.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._aclients.get(loop)
+            if state is None or state[0].is_closed:
+                # Loops that have finished took their connections with them
+                for closed in [l for l in self._aclients if l.is_closed()]:
+                    del self._aclients[closed]
+                state = self._aclients[loop] = (httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout), {})
+            return state
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        return self._loop_state()[0]
+
+    # Admission
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = _ModelQueue(self.max_in_flight)
+        return queue
+
+    def _set_depth(self, model: str, queue: _ModelQueue, priority: str, delta: int) -> None:
+        queue.depth[priority] += delta
+        GATEWAY_QUEUE_DEPTH.set(queue.depth[priority], model=model, priority=priority)
+
+    def _enqueue(self, model: str, priority: str, wake: Callable[[], None]) -> Optional[tuple]:
+        """
+        Takes a slot right away and returns None, or queues the caller and
+        returns its queue entry. wake() is called once a slot is handed over.
+        """
+        priority = priority if priority in PRIORITIES else "interactive"
+        with self._lock:
+            queue = self._queue(model)
+            if queue.in_flight < queue.max_in_flight and not queue.waiting:
+                queue.in_flight += 1
+                GATEWAY_IN_FLIGHT.set(queue.in_flight, model=model)
+                return None
+            if len(queue.waiting) >= self.max_queue:
+                self._rejected += 1
+                GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="rejected")
+                raise GatewayOverloaded(f"Model queue for '{model}' is full")
+            entry = (PRIORITIES[priority], next(self._seq), wake, priority)
+            heapq.heappush(queue.waiting, entry)
+            self._set_depth(model, queue, priority, 1)
+            return entry
+
+    def _withdraw(self, model: str, entry: tuple) -> bool:
+        with self._lock:
+            queue = self._queue(model)
+            try:
+                queue.waiting.remove(entry)
+            except ValueError:
+                return False
+            heapq.heapify(queue.waiting)
+            self._set_depth(model, queue, entry[3], -1)
+            return True
+
+    def _release(self, model: str) -> None:
+        with self._lock:
+            queue = self._queue(model)
+            if queue.waiting:
+                # Hand the slot straight to the next waiter
+                entry = heapq.heappop(queue.waiting)
+                self._set_depth(model, queue, entry[3], -1)
+                entry[2]()
+                return
+            queue.in_flight -= 1
+            GATEWAY_IN_FLIGHT.set(queue.in_flight, model=model)
+
+    def _admitted(self, model: str, priority: str, started: float) -> None:
+        waited = time.perf_counter() - started
+        GATEWAY_WAIT_SECONDS.observe(waited, model=model, priority=priority)
+        with self._lock:
+            self._served += 1
+            self._wait_seconds += waited
+
+    def _queue_timeout(self) -> Optional[float]:
+        try:
+            return clamp(self.timeout.read) if remaining() is not None else None
+        except DeadlineExceeded:
+            exceeded("queue")
+            raise
+
+    def _request_timeout(self) -> httpx.Timeout:
+        # The generation may not outlive the request's deadline
+        if remaining() is None:
+            return self.timeout
+        try:
+            return httpx.Timeout(clamp(self.timeout.read), connect=clamp(self.timeout.connect))
+        except DeadlineExceeded:
+            exceeded("llm")
+            raise
+
+    def _acquire(self, model: str, priority: str) -> None:
+        started = time.perf_counter()
+        timeout = self._queue_timeout()
+        granted = threading.Event()
+        entry = self._enqueue(model, priority, granted.set)
+        if entry is not None and not granted.wait(GATEWAY_SYNC_WAIT_SECONDS if timeout is None else timeout):
+            if self._withdraw(model, entry):
+                if timeout is None:
+                    GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="timed_out")
+                    raise GatewayOverloaded(f"No '{model}' slot freed up within {GATEWAY_SYNC_WAIT_SECONDS:g}s")
+                exceeded("queue")
+                raise DeadlineExceeded(f"Deadline passed waiting for a '{model}' slot")
+            # The slot was handed over as the wait ran out; use it
+        self._admitted(model, priority, started)
+
+    async def _aacquire(self, model: str, priority: str) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant() -> None:
+            if granted.cancelled():
+                # The waiter gave up after the slot was handed over
+                self._release(model)
+            else:
+                granted.set_result(None)
+
+        timeout = self._queue_timeout()
+        entry = self._enqueue(model, priority, lambda: loop.call_soon_threadsafe(grant))
+        if entry is not None:
+            try:
+                await asyncio.wait_for(granted, timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+                if not self._withdraw(model, entry) and granted.done() and not granted.cancelled():
+                    self._release(model)
+                if isinstance(e, asyncio.TimeoutError):
+                    exceeded("queue")
+                    raise DeadlineExceeded(f"Deadline passed waiting for a '{model}' slot") from None
+                raise
+        self._admitted(model, priority, started)
+
+    # Prefix reuse
+
+    def _payload(self, model: str, prompt: str, stop: Optional[List[str]], stream: bool, session: Optional[str] = None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": stream, "keep_alive": self.keep_alive}
+        if stop:
+            payload["options"] = {"stop": list(stop)}
+        if self.context_reuse and session:
+            with self._lock:
+                state = self._contexts.get((model, session))
+            delta = continuation(state[0], state[1], prompt) if state else None
+            if delta is not None:
+                # Raw, so the new text is appended to the context without another template turn
+                payload.update(prompt=delta, context=state[2], raw=True)
+                with self._lock:
+                    self._continued += 1
+        return payload
+
+    def _finish(self, model: str, session: Optional[str], prompt: str, text: str, data: Dict[str, Any]) -> None:
+        context = data.get("context")
+        if self.context_reuse and session and context:
+            key = (model, session)
+            with self._lock:
+                self._contexts[key] = (prompt, text, context)
+                self._contexts.move_to_end(key)
+                while len(self._contexts) > self.max_sessions:
+                    self._contexts.popitem(last=False)
+        if "prompt_eval_count" in data or "eval_count" in data:
+            # prompt_eval_count leaves out tokens served from Ollama's prefix cache
+            processed = data.get("prompt_eval_count", 0)
+            sent = len(context) - data.get("eval_count", 0) if context else processed
+            record_prompt_tokens(model, sent, processed)
+
+    def _forget(self, model: str, session: Optional[str]) -> None:
+        if session:
+            with self._lock:
+                self._contexts.pop((model, session), None)
+
+    # Requests
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        priority: Optional[str] = None,
+        session: Optional[str] = None
+    ) -> str:
+        priority = priority or request_priority.get()
+        session = session or prompt_session.get()
+        self._acquire(model, priority)
+        try:
+            response = self._get_client().post(
+                "/api/generate", json=self._payload(model, prompt, stop, False, session), timeout=self._request_timeout()
+            )
+            response.raise_for_status()
+            data = response.json()
+            text = data.get("response", "")
+            self._finish(model, session, prompt, text, data)
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="ok")
+            return text
+        except Exception:
+            self._forget(model, session)
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="error")
+            raise
+        finally:
+            self._release(model)
+
+    async def _agenerate(self, model: str, prompt: str, stop: Optional[List[str]], priority: str, session: Optional[str]) -> str:
+        await self._aacquire(model, priority)
+        try:
+            response = await self._get_aclient().post(
+                "/api/generate", json=self._payload(model, prompt, stop, False, session), timeout=self._request_timeout()
+            )
+            response.raise_for_status()
+            data = response.json()
+            text = data.get("response", "")
+            self._finish(model, session, prompt, text, data)
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="ok")
+            return text
+        except Exception:
+            self._forget(model, session)
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="error")
+            raise
+        finally:
+            self._release(model)
+
+    async def agenerate(
+        self,
+        model: str,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        priority: Optional[str] = None,
+        session: Optional[str] = None
+    ) -> str:
+        priority = priority or request_priority.get()
+        session = session or prompt_session.get()
+        # A session may continue its own Ollama context, so only requests that
+        # would reuse the same context share a generation
+        key = (model, prompt, tuple(stop or ()), session if self.context_reuse else None)
+        pending = self._loop_state()[1]
+        shared = pending.get(key)
+        if shared is None:
+            shared = pending[key] = [asyncio.ensure_future(self._agenerate(model, prompt, stop, priority, session)), 0]
+            shared[0].add_done_callback(lambda _: pending.pop(key, None))
+        else:
+            self._coalesced += 1
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="coalesced")
+        shared[1] += 1
+        try:
+            return await asyncio.shield(shared[0])
+        except asyncio.CancelledError:
+            # Stop the generation once nobody is waiting for it
+            if shared[1] == 1:
+                shared[0].cancel()
+            raise
+        finally:
+            shared[1] -= 1
+
+    async def astream(
+        self,
+        model: str,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        priority: Optional[str] = None,
+        session: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        priority = priority or request_priority.get()
+        session = session or prompt_session.get()
+        await self._aacquire(model, priority)
+        try:
+            parts: List[str] = []
+            async with self._get_aclient().stream(
+                "POST", "/api/generate", json=self._payload(model, prompt, stop, True, session), timeout=self._request_timeout()
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        parts.append(chunk["response"])
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        # The final chunk carries the context and token counts
+                        self._finish(model, session, prompt, "".join(parts), chunk)
+                        break
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="ok")
+        except Exception:
+            self._forget(model, session)
+            GATEWAY_REQUESTS.inc(model=model, priority=priority, outcome="error")
+            raise
+        finally:
+            self._release(model)
+
+    # Lifecycle
+
+    async def awarm_up(self, models: Optional[List[str]] = None) -> None:
+        """
+        Loads each model with an empty prompt so the first real request does
+        not pay the load time. Failures are logged and otherwise ignored.
+        """
+        for model in models if models is not None else GATEWAY_WARM_MODELS:
+            started = time.perf_counter()
+            try:
+                response = await self._get_aclient().post(
+                    "/api/generate", json={"model": model, "keep_alive": self.keep_alive}
+                )
+                response.raise_for_status()
+                self._warmed.append(model)
+                logger.info(f"Warmed up model '{model}' in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                logger.warning(f"Model Warm-up Error for '{model}': {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self) -> None:
+        # Only the running loop's client can be closed here; the others go with their loops
+        with self._lock:
+            state = self._aclients.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].aclose()
+        self.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "keep_alive": self.keep_alive,
+                "served": self._served,
+                "rejected": self._rejected,
+                "coalesced": self._coalesced,
+                "context_reuse": self.context_reuse,
+                "context_sessions": len(self._contexts),
+                "continued": self._continued,
+                "mean_wait_ms": round(self._wait_seconds / self._served * 1000, 3) if self._served else 0.0,
+                "warmed": list(self._warmed),
+                "models": {
+                    model: {"in_flight": q.in_flight, "max_in_flight": q.max_in_flight, "queued": dict(q.depth)}
+                    for model, q in self._queues.items()
+                },
+            }
+
+
+model_gateway = ModelGateway()
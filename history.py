@@ -0,0 +1,248 @@
+# history.py
+
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from db import SessionLocal, Conversation, Message
+from writer import db_writer
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_PAGE_SIZE = 100
+
+
+def stage_turn(
+    session_db: Session,
+    conversation_id: str,
+    agent_name: str,
+    model_name: str,
+    user_input: str,
+    response: str
+) -> int:
+    """
+    Adds one user/assistant turn to the session without committing.
+
+    Only two rows are inserted per turn, so the cost stays flat however long
+    the conversation gets. Returns the seq of the assistant message.
+    """
+    if session_db.get(Conversation, conversation_id) is None:
+        session_db.add(Conversation(id=conversation_id, agent_name=agent_name, model_name=model_name))
+    last_seq = session_db.query(func.max(Message.seq)).filter(Message.conversation_id == conversation_id).scalar() or 0
+    now = time.time()
+    session_db.add_all([
+        Message(conversation_id=conversation_id, seq=last_seq + 1, role="user", content=user_input, created_at=now),
+        Message(conversation_id=conversation_id, seq=last_seq + 2, role="assistant", content=response, created_at=now),
+    ])
+    return last_seq + 2
+
+
+def append_turn(
+    conversation_id: str,
+    agent_name: str,
+    model_name: str,
+    user_input: str,
+    response: str,
+    session_factory=None
+) -> int:
+    """
+    Appends one turn and returns once it is committed. Goes through the
+    group-commit writer unless a session_factory is given.
+    """
+    if session_factory is None:
+        return db_writer.write(
+            lambda session_db: stage_turn(session_db, conversation_id, agent_name, model_name, user_input, response)
+        )
+    session_db = session_factory()
+    try:
+        seq = stage_turn(session_db, conversation_id, agent_name, model_name, user_input, response)
+        session_db.commit()
+        return seq
+    except Exception:
+        session_db.rollback()
+        raise
+    finally:
+        session_db.close()
+
+
+async def aappend_turn(conversation_id: str, agent_name: str, model_name: str, user_input: str, response: str) -> int:
+    """
+    Appends one turn through the group-commit writer; resolves once it is committed.
+    """
+    return await db_writer.awrite(
+        lambda session_db: stage_turn(session_db, conversation_id, agent_name, model_name, user_input, response)
+    )
+
+
+def conversations_with_messages(conversation_ids: Iterable[str], session_factory=SessionLocal) -> Set[str]:
+    """
+    Returns the subset of conversation_ids that already have stored messages.
+    """
+    ids = list(conversation_ids)
+    if not ids:
+        return set()
+    session_db = session_factory()
+    try:
+        rows = session_db.query(Message.conversation_id).filter(Message.conversation_id.in_(ids)).distinct().all()
+        return {row[0] for row in rows}
+    finally:
+        session_db.close()
+
+
+def get_messages(
+    conversation_id: str,
+    after_seq: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session_factory=SessionLocal
+) -> List[Dict]:
+    """
+    Returns up to `limit` messages with seq > after_seq, oldest first.
+    Pass the last seq of a page as after_seq to fetch the next one.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    session_db = session_factory()
+    try:
+        rows = (
+            session_db.query(Message)
+            .filter(Message.conversation_id == conversation_id, Message.seq > after_seq)
+            .order_by(Message.seq)
+            .limit(limit)
+            .all()
+        )
+        return [
+            {"seq": m.seq, "role": m.role, "content": m.content, "created_at": m.created_at}
+            for m in rows
+        ]
+    finally:
+        session_db.close()
+
+
+def get_last_seq(conversation_id: str, session_factory=SessionLocal) -> Optional[int]:
+    """
+    Returns the seq of the newest message, 0 for a conversation without
+    messages, or None if the conversation does not exist.
+    """
+    session_db = session_factory()
+    try:
+        last_seq = session_db.query(func.max(Message.seq)).filter(Message.conversation_id == conversation_id).scalar()
+        if last_seq is not None:
+            return last_seq
+        return 0 if session_db.get(Conversation, conversation_id) is not None else None
+    finally:
+        session_db.close()
+
+
+def _conversation_page(
+    session_db: Session,
+    agent_name: Optional[str],
+    model_name: Optional[str],
+    after_id: str,
+    limit: int
+) -> List[Conversation]:
+    query = session_db.query(Conversation).filter(Conversation.id > after_id)
+    if agent_name:
+        query = query.filter(Conversation.agent_name == agent_name)
+    if model_name:
+        query = query.filter(Conversation.model_name == model_name)
+    return query.order_by(Conversation.id).limit(limit).all()
+
+
+def list_conversations(
+    agent_name: Optional[str] = None,
+    model_name: Optional[str] = None,
+    after_id: str = "",
+    limit: int = DEFAULT_PAGE_SIZE,
+    session_factory=SessionLocal
+) -> List[Dict]:
+    """
+    Returns conversations ordered by id with their message count and last
+    activity. Pass the last id of a page as after_id to fetch the next one.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    session_db = session_factory()
+    try:
+        rows = _conversation_page(session_db, agent_name, model_name, after_id, limit)
+        activity = {
+            r[0]: r[1:]
+            for r in session_db.query(
+                Message.conversation_id, func.count(Message.id), func.max(Message.seq), func.max(Message.created_at)
+            ).filter(Message.conversation_id.in_([c.id for c in rows])).group_by(Message.conversation_id)
+        }
+        conversations = []
+        for c in rows:
+            message_count, last_seq, updated_at = activity.get(c.id, (0, 0, None))
+            conversations.append({
+                "id": c.id,
+                "agent_name": c.agent_name,
+                "model_name": c.model_name,
+                "message_count": message_count,
+                "last_seq": last_seq,
+                "updated_at": updated_at,
+            })
+        return conversations
+    finally:
+        session_db.close()
+
+
+def iter_conversations(
+    agent_name: Optional[str] = None,
+    model_name: Optional[str] = None,
+    page_size: int = EXPORT_PAGE_SIZE,
+    session_factory=SessionLocal
+) -> Iterator[List[Dict]]:
+    """
+    Yields every matching conversation with all of its messages, one page of
+    conversations at a time, for export. Each page is read in its own short
+    session so a long export does not hold a connection open throughout.
+    """
+    after_id = ""
+    while True:
+        session_db = session_factory()
+        try:
+            rows = _conversation_page(session_db, agent_name, model_name, after_id, page_size)
+            messages: Dict[str, List[Dict]] = {c.id: [] for c in rows}
+            for m in (
+                session_db.query(Message)
+                .filter(Message.conversation_id.in_(list(messages)))
+                .order_by(Message.conversation_id, Message.seq)
+            ):
+                messages[m.conversation_id].append(
+                    {"seq": m.seq, "role": m.role, "content": m.content, "created_at": m.created_at}
+                )
+        finally:
+            session_db.close()
+        if not rows:
+            return
+        yield [
+            {"id": c.id, "agent_name": c.agent_name, "model_name": c.model_name, "messages": messages[c.id]}
+            for c in rows
+        ]
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1].id
+
+
+def get_recent_messages(conversation_id: str, limit: int, session_factory=SessionLocal) -> List[Dict]:
+    """
+    Returns the last `limit` messages of a conversation, oldest first.
+    """
+    session_db = session_factory()
+    try:
+        rows = (
+            session_db.query(Message)
+            .filter(Message.conversation_id == conversation_id)
+            .order_by(Message.seq.desc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            {"seq": m.seq, "role": m.role, "content": m.content, "created_at": m.created_at}
+            for m in reversed(rows)
+        ]
+    finally:
+        session_db.close()
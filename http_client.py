@@ -0,0 +1,286 @@
+# http_client.py
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+from deadlines import DeadlineExceeded, clamp, exceeded, remaining
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.getenv("TOOL_HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.25"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "4"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retryable(error: Exception) -> bool:
+    """
+    True for the errors get_json and aget_json raise that a retry may fix.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUSES
+    return isinstance(error, httpx.TransportError)
+
+
+class HTTPClient:
+    """
+    Shared HTTP layer for the tools.
+
+    Keeps one pooled keep-alive client for sync calls and one for async calls
+    per event loop, caps in-flight requests per host, and retries transport
+    errors and 429/5xx responses with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        timeout: float = HTTP_TIMEOUT,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        per_host_limit: int = HTTP_PER_HOST_LIMIT,
+        max_retries: int = HTTP_MAX_RETRIES,
+        backoff_base: float = HTTP_BACKOFF_BASE,
+        backoff_max: float = HTTP_BACKOFF_MAX
+    ):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        # Async client and per-host slots of each event loop that made calls
+        self._aclients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Dict[str, asyncio.Semaphore]]] = {}
+
+        self._requests = 0
+        self._connections_opened = 0
+        self._retries = 0
+        self._failures = 0
+        self._status_counts: Dict[int, int] = {}
+
+    # Clients
+
+    def _get_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(timeout=self.timeout, limits=self.limits)
+            return self._client
+
+    def _loop_state(self) -> Tuple[httpx.AsyncClient, Dict[str, asyncio.Semaphore]]:
+        """
+        Async client and per-host slots for the running event loop. Both only
+        work on the loop that first used them, so the server's loop and any
+        asyncio.run() in a worker thread each get their own.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._aclients.get(loop)
+            if state is None or state[0].is_closed:
+                # Loops that have finished took their connections with them
+                for closed in [l for l in self._aclients if l.is_closed()]:
+                    del self._aclients[closed]
+                state = self._aclients[loop] = (httpx.AsyncClient(timeout=self.timeout, limits=self.limits), {})
+            return state
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        return self._loop_state()[0]
+
+    def open(self) -> None:
+        """
+        Creates both pooled clients ahead of the first tool call. Call it from
+        the event loop that will serve requests.
+        """
+        self._get_client()
+        self._get_aclient()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self) -> None:
+        # Only the running loop's client can be closed here; the others go with their loops
+        with self._lock:
+            state = self._aclients.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].aclose()
+        self.close()
+
+    # Bookkeeping
+
+    def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        # httpcore reports every new TCP connection; anything else was a reused one
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._connections_opened += 1
+
+    async def _atrace(self, event_name: str, info: Dict[str, Any]) -> None:
+        self._trace(event_name, info)
+
+    def _record(self, response: Optional[httpx.Response], retried: bool) -> None:
+        with self._lock:
+            self._requests += 1
+            if retried:
+                self._retries += 1
+            if response is None:
+                self._failures += 1
+            else:
+                self._status_counts[response.status_code] = self._status_counts.get(response.status_code, 0) + 1
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+    def _ahost_slot(self, host: str) -> asyncio.Semaphore:
+        # Per loop, like the client; only ever touched from that loop
+        slots = self._loop_state()[1]
+        slot = slots.get(host)
+        if slot is None:
+            slot = slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return slot
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        return min(delay, self.backoff_max)
+
+    def _request_timeout(self) -> httpx.Timeout:
+        # Never wait on the upstream past the request's deadline
+        if remaining() is None:
+            return self.timeout
+        try:
+            return httpx.Timeout(clamp(self.timeout.read), connect=clamp(self.timeout.connect))
+        except DeadlineExceeded:
+            exceeded("tool")
+            raise
+
+    def retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        # None when the retry could not finish before the deadline
+        delay = self._backoff(attempt, response)
+        left = remaining()
+        if left is not None and delay >= left:
+            exceeded("tool")
+            return None
+        return delay
+
+    # Requests
+
+    def get(self, url: str, params: Optional[dict] = None, retries: Optional[int] = None) -> httpx.Response:
+        """
+        GETs url, retrying up to retries times (max_retries by default).
+        """
+        retries = self.max_retries if retries is None else retries
+        host = urlsplit(url).netloc
+        client = self._get_client()
+        error: Optional[Exception] = None
+        response: Optional[httpx.Response] = None
+        for attempt in range(retries + 1):
+            try:
+                timeout = self._request_timeout()
+                with self._host_slot(host):
+                    response = client.get(url, params=params, timeout=timeout, extensions={"trace": self._trace})
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+            self._record(response, retried=attempt > 0)
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt < retries:
+                delay = self.retry_delay(attempt, response)
+                if delay is None:
+                    break
+                logger.warning(f"Retrying GET {host} in {delay:.2f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+        if response is not None:
+            return response
+        raise error
+
+    async def _arequest(self, method: str, url: str, retries: Optional[int] = None, **kwargs: Any) -> httpx.Response:
+        retries = self.max_retries if retries is None else retries
+        host = urlsplit(url).netloc
+        client = self._get_aclient()
+        error: Optional[Exception] = None
+        response: Optional[httpx.Response] = None
+        for attempt in range(retries + 1):
+            try:
+                timeout = self._request_timeout()
+                async with self._ahost_slot(host):
+                    response = await client.request(method, url, timeout=timeout, extensions={"trace": self._atrace}, **kwargs)
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+            self._record(response, retried=attempt > 0)
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt < retries:
+                delay = self.retry_delay(attempt, response)
+                if delay is None:
+                    break
+                logger.warning(f"Retrying {method} {host} in {delay:.2f}s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
+        if response is not None:
+            return response
+        raise error
+
+    async def aget(self, url: str, params: Optional[dict] = None, retries: Optional[int] = None) -> httpx.Response:
+        return await self._arequest("GET", url, retries=retries, params=params)
+
+    async def apost(self, url: str, json: Any = None) -> httpx.Response:
+        """
+        POSTs a JSON body. Retried like GET, so the receiver should be idempotent.
+        """
+        return await self._arequest("POST", url, json=json)
+
+    def get_json(self, url: str, params: Optional[dict] = None, retries: Optional[int] = None) -> Any:
+        response = self.get(url, params=params, retries=retries)
+        response.raise_for_status()
+        return response.json()
+
+    async def aget_json(self, url: str, params: Optional[dict] = None, retries: Optional[int] = None) -> Any:
+        response = await self.aget(url, params=params, retries=retries)
+        response.raise_for_status()
+        return response.json()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "connections_opened": self._connections_opened,
+                "connections_reused": max(self._requests - self._failures - self._connections_opened, 0),
+                "retries": self._retries,
+                "failures": self._failures,
+                "status_counts": dict(self._status_counts),
+            }
+
+
+http_client = HTTPClient()
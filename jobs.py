@@ -0,0 +1,379 @@
+# jobs.py
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from sqlalchemy import delete, func, select, update
+from db import SessionLocal, Job
+from writer import db_writer
+from http_client import http_client
+from metrics import registry
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "thread" runs jobs in this process; "process" runs them in separate worker processes
+JOB_POOL = os.getenv("JOB_POOL", "thread")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+JOB_MAX_TIMEOUT = float(os.getenv("JOB_MAX_TIMEOUT", "1800"))
+# Submissions are refused with 429 once this many jobs are waiting
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+# Times a job is started before a lost worker makes it fail instead of requeueing
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often to look for jobs queued by other processes and for lost workers
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_LEASE_GRACE = float(os.getenv("JOB_LEASE_GRACE", "30"))
+# Longest GET /jobs/{id}?wait= may hold the request open
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "60"))
+# Finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+
+FINISHED = ("succeeded", "failed", "timed_out")
+
+JOBS = registry.counter(
+    "prism_jobs", "Jobs submitted and finished, by status.", ["status"]
+)
+JOB_WAIT_SECONDS = registry.histogram(
+    "prism_job_wait_seconds", "Time a job waited in the queue before a worker started it."
+)
+JOB_RUN_SECONDS = registry.histogram(
+    "prism_job_run_seconds", "Time from a job starting to it finishing.", ["status"]
+)
+
+
+def run_job(request: Dict[str, Any], deadline_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Runs one job's query on a worker thread or process. deadline_at is the
+    wall-clock time the job times out at; the agent answers with what it has
+    by then.
+    """
+    from gateway import request_priority
+    from task import run_agent_query
+    # Interactive queries go ahead of jobs at the model gateway
+    request_priority.set("batch")
+    # Wall clock, since a worker process does not share the server's monotonic clock
+    timeout = max(deadline_at - time.time(), 0.001) if deadline_at is not None else None
+    return run_agent_query(**request, timeout=timeout)
+
+
+class JobQueue:
+    """
+    Jobs persisted in the jobs table, so queued work survives a restart.
+
+    Workers claim the oldest queued job with a single UPDATE, which SQLite
+    serializes across processes, and hold a lease until the job's timeout
+    has passed. Running jobs whose lease expires are requeued.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    @staticmethod
+    def _row_dict(job: Job) -> Dict[str, Any]:
+        request = json.loads(job.request)
+        return {
+            "id": job.id,
+            "status": job.status,
+            "agent_name": request.get("agent_name"),
+            "conversation_id": request.get("conversation_id"),
+            "attempts": job.attempts,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error,
+            "webhook_status": job.webhook_status,
+        }
+
+    async def enqueue(self, request: Dict[str, Any], webhook_url: Optional[str], timeout: float) -> Dict[str, Any]:
+        job = Job(
+            id=uuid.uuid4().hex,
+            status="queued",
+            request=json.dumps(request),
+            webhook_url=webhook_url,
+            timeout=timeout,
+            attempts=0,
+            created_at=time.time(),
+        )
+        payload = self._row_dict(job)
+        await db_writer.awrite(lambda session_db: session_db.add(job))
+        JOBS.inc(status="queued")
+        return payload
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        def stage(session_db) -> Optional[Dict[str, Any]]:
+            now = time.time()
+            oldest = (
+                select(Job.id).where(Job.status == "queued").order_by(Job.created_at).limit(1).scalar_subquery()
+            )
+            row = session_db.execute(
+                update(Job)
+                .where(Job.id == oldest, Job.status == "queued")
+                .values(
+                    status="running",
+                    started_at=now,
+                    attempts=Job.attempts + 1,
+                    lease_expires_at=now + Job.timeout + JOB_LEASE_GRACE,
+                )
+                .returning(Job.id, Job.request, Job.timeout, Job.webhook_url, Job.created_at, Job.started_at)
+            ).first()
+            return dict(row._mapping) if row is not None else None
+
+        return await db_writer.awrite(stage)
+
+    async def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        await db_writer.awrite(lambda session_db: session_db.execute(
+            update(Job).where(Job.id == job_id, Job.status == "running").values(
+                status=status,
+                result=json.dumps(result) if result is not None else None,
+                error=error,
+                finished_at=time.time(),
+                lease_expires_at=None,
+            )
+        ))
+
+    async def set_webhook_status(self, job_id: str, webhook_status: str) -> None:
+        await db_writer.awrite(lambda session_db: session_db.execute(
+            update(Job).where(Job.id == job_id).values(webhook_status=webhook_status)
+        ))
+
+    async def recover(self) -> int:
+        """
+        Requeues running jobs whose worker is gone, or fails them once they
+        have used up JOB_MAX_ATTEMPTS. Returns the number of jobs recovered.
+        """
+        def stage(session_db) -> int:
+            now = time.time()
+            lost = (Job.status == "running") & (Job.lease_expires_at < now)
+            failed = session_db.execute(
+                update(Job).where(lost, Job.attempts >= JOB_MAX_ATTEMPTS).values(
+                    status="failed", error="Worker lost", finished_at=now, lease_expires_at=None
+                )
+            ).rowcount
+            requeued = session_db.execute(
+                update(Job).where(lost).values(status="queued", started_at=None, lease_expires_at=None)
+            ).rowcount
+            return failed + requeued
+
+        recovered = await db_writer.awrite(stage)
+        if recovered:
+            logger.warning(f"Recovered {recovered} jobs from lost workers")
+        return recovered
+
+    async def prune(self) -> int:
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        return await db_writer.awrite(lambda session_db: session_db.execute(
+            delete(Job).where(Job.status.in_(FINISHED), Job.finished_at < cutoff)
+        ).rowcount)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        session_db = self.session_factory()
+        try:
+            job = session_db.get(Job, job_id)
+            return self._row_dict(job) if job is not None else None
+        finally:
+            session_db.close()
+
+    def counts(self) -> Dict[str, int]:
+        session_db = self.session_factory()
+        try:
+            rows = session_db.execute(select(Job.status, func.count()).group_by(Job.status)).all()
+            return {status: count for status, count in rows}
+        finally:
+            session_db.close()
+
+    def depth(self) -> int:
+        session_db = self.session_factory()
+        try:
+            return session_db.execute(select(func.count()).where(Job.status == "queued")).scalar() or 0
+        finally:
+            session_db.close()
+
+
+class JobRunner:
+    """
+    Dispatches queued jobs to a thread or process pool of JOB_WORKERS.
+
+    A job that runs past its timeout is marked timed_out at once, but its
+    worker slot is only released when the run actually returns, since a
+    thread cannot be interrupted. Completion is announced to long-polling
+    readers in this process and, if the job has one, to its webhook.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = JOB_WORKERS, pool: str = JOB_POOL):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.pool = pool if pool in ("thread", "process") else "thread"
+        self._executor: Optional[Executor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._waiters: Dict[str, List[asyncio.Event]] = {}
+        self._running = 0
+        self._outcomes: Dict[str, int] = {}
+        self._last_recover = 0.0
+        self._last_prune = 0.0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.pool == "process":
+                # Spawned, not forked: the parent holds threads and open connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        return self._executor
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _maintain(self) -> None:
+        now = time.monotonic()
+        if now - self._last_recover >= JOB_POLL_SECONDS * 10:
+            self._last_recover = now
+            await self.queue.recover()
+        if now - self._last_prune >= 3600:
+            self._last_prune = now
+            await self.queue.prune()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._maintain()
+                while self._running < self.workers:
+                    job = await self.queue.claim()
+                    if job is None:
+                        break
+                    self._running += 1
+                    asyncio.create_task(self._execute(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job Dispatch Error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        JOB_WAIT_SECONDS.observe(max(0.0, job["started_at"] - job["created_at"]))
+        started = time.perf_counter()
+        future: Optional[asyncio.Future] = None
+        result, error = None, None
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), run_job, json.loads(job["request"]), time.time() + job["timeout"]
+            )
+            # shield: on timeout the run keeps its slot until it returns
+            result = await asyncio.wait_for(asyncio.shield(future), job["timeout"])
+            status = "succeeded"
+        except asyncio.TimeoutError:
+            status, error = "timed_out", f"Job exceeded its {job['timeout']:g}s timeout"
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"Job Error for '{job_id}': {e}")
+        try:
+            await self.queue.finish(job_id, status, result, error)
+        except Exception as e:
+            logger.error(f"Job Finish Error for '{job_id}': {e}")
+        JOBS.inc(status=status)
+        JOB_RUN_SECONDS.observe(time.perf_counter() - started, status=status)
+        self._outcomes[status] = self._outcomes.get(status, 0) + 1
+        for event in self._waiters.pop(job_id, []):
+            event.set()
+        if job["webhook_url"]:
+            asyncio.create_task(self._notify(job_id, job["webhook_url"]))
+        if status == "timed_out":
+            try:
+                await future
+            except Exception:
+                pass
+        self._running -= 1
+        self.wake()
+
+    async def _notify(self, job_id: str, webhook_url: str) -> None:
+        payload = self.queue.get(job_id)
+        try:
+            response = await http_client.apost(webhook_url, json=payload)
+            webhook_status = f"delivered ({response.status_code})" if response.is_success else f"failed ({response.status_code})"
+        except Exception as e:
+            webhook_status = f"failed ({e})"
+            logger.error(f"Job Webhook Error for '{job_id}': {e}")
+        await self.queue.set_webhook_status(job_id, webhook_status)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Returns the job once it has finished or timeout seconds have passed.
+        Jobs finished by another process are noticed by polling.
+        """
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT)
+        while True:
+            job = await asyncio.to_thread(self.queue.get, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                return job
+            event = asyncio.Event()
+            self._waiters.setdefault(job_id, []).append(event)
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, JOB_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiters = self._waiters.get(job_id)
+                if waiters and event in waiters:
+                    waiters.remove(event)
+                    if not waiters:
+                        del self._waiters[job_id]
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            # Jobs still running are requeued by the next process once their lease expires
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "running": self._running,
+            "statuses": self.queue.counts(),
+            "finished_here": dict(self._outcomes),
+        }
+
+
+job_queue = JobQueue()
+job_runner = JobRunner(job_queue)
+
+registry.gauge(
+    "prism_job_queue_depth", "Jobs waiting for a worker.",
+    function=job_queue.depth
+)
+registry.gauge(
+    "prism_jobs_running", "Jobs running on this process's worker pool.",
+    function=lambda: job_runner.running
+)
@@ -0,0 +1,219 @@
+# llm_cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import create_engine, MetaData, Table, Column, String, Text, Integer, Float, select, func, delete, update
+from langchain.llms.base import LLM
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun
+from router import served_backend
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_URL = os.getenv("LLM_CACHE_URL", "sqlite:///llm_cache.db")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+# Agents whose answers go stale too quickly to reuse
+LLM_CACHE_BYPASS_AGENTS = {
+    name.strip() for name in os.getenv("LLM_CACHE_BYPASS_AGENTS", "News Agent").split(",") if name.strip()
+}
+
+# Error strings returned by the LLM wrappers must never be cached
+UNCACHEABLE_PREFIXES = ("• Unable to generate a response", "• No response generated.")
+
+metadata = MetaData()
+
+completions = Table(
+    "completions", metadata,
+    Column("key", String, primary_key=True),
+    Column("model", String, nullable=False),
+    Column("response", Text, nullable=False),
+    Column("size", Integer, nullable=False),
+    Column("latency", Float, nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("last_used", Float, nullable=False, index=True),
+    Column("hits", Integer, nullable=False, default=0),
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def completion_key(model: str, prompt: str, stop: Optional[List[str]]) -> str:
+    payload = "\x00".join([model, json.dumps(sorted(stop or [])), normalize_prompt(prompt)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    Disk-backed cache of LLM completions keyed on model, stop list and prompt.
+
+    Entries expire after a TTL, and the least recently used entries are
+    evicted once the stored responses exceed max_bytes.
+    """
+
+    def __init__(self, url: str = LLM_CACHE_URL, max_bytes: int = LLM_CACHE_MAX_BYTES, ttl: float = LLM_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._engine = None
+        self._url = url
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    @property
+    def engine(self):
+        # Opened on first use so a disabled cache never creates its file
+        with self._lock:
+            if self._engine is None:
+                self._engine = create_engine(self._url, connect_args={"check_same_thread": False})
+                metadata.create_all(self._engine)
+            return self._engine
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.engine.begin() as conn:
+            row = conn.execute(select(completions).where(completions.c.key == key)).first()
+            if row is None or now - row.created_at > self.ttl:
+                if row is not None:
+                    conn.execute(delete(completions).where(completions.c.key == key))
+                with self._lock:
+                    self.misses += 1
+                return None
+            conn.execute(
+                update(completions)
+                .where(completions.c.key == key)
+                .values(last_used=now, hits=completions.c.hits + 1)
+            )
+        with self._lock:
+            self.hits += 1
+            self.seconds_saved += row.latency
+        return row.response
+
+    def put(self, key: str, model: str, response: str, latency: float) -> None:
+        if response.startswith(UNCACHEABLE_PREFIXES):
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.engine.begin() as conn:
+            conn.execute(delete(completions).where(completions.c.key == key))
+            conn.execute(completions.insert().values(
+                key=key, model=model, response=response, size=size,
+                latency=latency, created_at=now, last_used=now, hits=0
+            ))
+            evicted = self._evict(conn)
+        with self._lock:
+            self.writes += 1
+            self.evictions += evicted
+
+    def _evict(self, conn) -> int:
+        total = conn.execute(select(func.coalesce(func.sum(completions.c.size), 0))).scalar()
+        evicted = 0
+        if total <= self.max_bytes:
+            return evicted
+        rows = conn.execute(select(completions.c.key, completions.c.size).order_by(completions.c.last_used)).all()
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute(delete(completions).where(completions.c.key == row.key))
+            total -= row.size
+            evicted += 1
+        return evicted
+
+    def wrap(self, llm: LLM, agent_name: str) -> LLM:
+        if not LLM_CACHE_ENABLED or agent_name in LLM_CACHE_BYPASS_AGENTS:
+            return llm
+        return CachedLLM(llm, self)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": LLM_CACHE_ENABLED,
+                "bypass_agents": sorted(LLM_CACHE_BYPASS_AGENTS),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "llm_seconds_saved": round(self.seconds_saved, 3),
+            }
+
+
+class CachedLLM(LLM):
+    """
+    Wraps GeminiLLM or QwenLLM and answers repeated prompts from a CompletionCache.
+    """
+
+    def __init__(self, llm: LLM, cache: CompletionCache, **kwargs):
+        super().__init__(**kwargs)
+        self._llm = llm
+        self._cache = cache
+        self._model_name = getattr(llm, "_model_name", llm._llm_type)
+
+    @property
+    def _llm_type(self) -> str:
+        return self._llm._llm_type
+
+    def get_num_tokens(self, text: str) -> int:
+        return self._llm.get_num_tokens(text)
+
+    def _expected_model(self) -> str:
+        # A routed LLM answers from whichever backend it picks, so look up the
+        # answer of the backend it will try first rather than the requested model
+        preferred = getattr(self._llm, "preferred_backend", None)
+        return preferred() if preferred is not None else self._model_name
+
+    def _served(self, prompt: str, stop: Optional[List[str]], model: str, key: str) -> Tuple[str, str]:
+        # Stored under the backend that actually answered, which a fallback changes
+        served = served_backend.get() or model
+        return (served, key) if served == model else (served, completion_key(served, prompt, stop))
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        model = self._expected_model()
+        key = completion_key(model, prompt, stop)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        served_backend.set(None)
+        response = self._llm._call(prompt, stop=stop)
+        served, key = self._served(prompt, stop, model, key)
+        self._cache.put(key, served, response, time.perf_counter() - started)
+        return response
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        model = self._expected_model()
+        key = completion_key(model, prompt, stop)
+        cached = await asyncio.to_thread(self._cache.get, key)
+        if cached is not None:
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(cached)
+            return cached
+        started = time.perf_counter()
+        served_backend.set(None)
+        response = await self._llm._acall(prompt, stop=stop, run_manager=run_manager)
+        served, key = self._served(prompt, stop, model, key)
+        await asyncio.to_thread(self._cache.put, key, served, response, time.perf_counter() - started)
+        return response
+
+
+completion_cache = CompletionCache()
@@ -0,0 +1,358 @@
+# memory.py
+
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.llms.base import LLM
+from langchain.memory import (
+    ConversationBufferWindowMemory,
+    ConversationTokenBufferMemory,
+    ConversationSummaryBufferMemory,
+)
+from langchain.schema import BaseMemory
+from history import get_recent_messages
+from statestore import StateStore, create_state_store
+from metrics import registry
+from tracing import span
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEMORY_STRATEGIES = ("window", "tokens", "summary")
+
+MEMORY_STRATEGY = os.getenv("MEMORY_STRATEGY", "window")
+MEMORY_MAX_CONVERSATIONS = int(os.getenv("MEMORY_MAX_CONVERSATIONS", "1000"))
+MEMORY_IDLE_SECONDS = float(os.getenv("MEMORY_IDLE_SECONDS", "1800"))
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "5"))
+MEMORY_TOKEN_LIMIT = int(os.getenv("MEMORY_TOKEN_LIMIT", "1000"))
+MEMORY_REHYDRATE_MESSAGES = int(os.getenv("MEMORY_REHYDRATE_MESSAGES", "100"))
+# Times a turn is re-applied to a newer state before saving it is given up
+MEMORY_SAVE_ATTEMPTS = int(os.getenv("MEMORY_SAVE_ATTEMPTS", "8"))
+# Base of the jittered backoff between attempts, so racing turns stop colliding
+MEMORY_SAVE_BACKOFF = float(os.getenv("MEMORY_SAVE_BACKOFF", "0.005"))
+
+MEMORY_SAVE_CONFLICTS = registry.counter(
+    "prism_memory_save_conflicts", "Memory saves that lost a race with another turn and were re-applied."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+class StoredMemory(BaseMemory):
+    """
+    Memory of one conversation as of one version of its stored state. Saving
+    a turn writes the new state back through the ConversationMemoryManager.
+    """
+
+    conversation_id: str
+    strategy: str
+    memory: BaseMemory
+    llm: Any = None
+    version: int = 0
+    manager: Any = None
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return self.memory.memory_variables
+
+    @property
+    def chat_memory(self) -> Any:
+        return self.memory.chat_memory
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return self.memory.load_memory_variables(inputs)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        self.manager.save_turn(self, inputs, outputs)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.manager.discard(self.conversation_id)
+
+
+class ConversationMemoryManager:
+    """
+    Builds conversation memories from the state kept in a StateStore.
+
+    A memory starts from the stored state at some version. When a turn is
+    saved, the new state is written only if that version is still current;
+    otherwise the turn is applied again on top of the newer state, so turns
+    racing on different workers are both kept. With a shared store, recently
+    used states are cached locally and checked against the stored version on
+    every read. Conversations the store does not have are rebuilt from the
+    messages table. Each memory uses one of the strategies in MEMORY_STRATEGIES.
+    """
+
+    def __init__(
+        self,
+        store: Optional[StateStore] = None,
+        max_conversations: int = MEMORY_MAX_CONVERSATIONS,
+        idle_seconds: float = MEMORY_IDLE_SECONDS,
+        default_strategy: str = MEMORY_STRATEGY,
+        window_turns: int = MEMORY_WINDOW_TURNS,
+        token_limit: int = MEMORY_TOKEN_LIMIT
+    ):
+        self.store = store if store is not None else create_state_store()
+        self.max_conversations = max_conversations
+        self.idle_seconds = idle_seconds
+        self.default_strategy = default_strategy if default_strategy in MEMORY_STRATEGIES else "window"
+        self.window_turns = window_turns
+        self.token_limit = token_limit
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[int, Dict[str, Any], float]]" = OrderedDict()
+        self._rehydrations = 0
+        self._evictions = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._conflicts = 0
+        self._store_errors = 0
+
+    def _build(self, strategy: str, llm: LLM) -> BaseMemory:
+        if strategy == "tokens":
+            return ConversationTokenBufferMemory(
+                llm=llm, memory_key="chat_history", max_token_limit=self.token_limit
+            )
+        if strategy == "summary":
+            return ConversationSummaryBufferMemory(
+                llm=llm, memory_key="chat_history", max_token_limit=self.token_limit
+            )
+        return ConversationBufferWindowMemory(
+            memory_key="chat_history", k=self.window_turns, return_messages=False
+        )
+
+    def _rehydrate(self, conversation_id: str, strategy: str, memory: BaseMemory) -> None:
+        limit = 2 * self.window_turns if strategy == "window" else MEMORY_REHYDRATE_MESSAGES
+        with span("db", "rehydrate_memory"):
+            messages = get_recent_messages(conversation_id, limit)
+        if strategy == "tokens":
+            # Keep only the newest messages that fit in the token budget
+            kept, used = [], 0
+            for message in reversed(messages):
+                used += estimate_tokens(message["content"])
+                if used > self.token_limit:
+                    break
+                kept.append(message)
+            messages = list(reversed(kept))
+        for message in messages:
+            if message["role"] == "user":
+                memory.chat_memory.add_user_message(message["content"])
+            else:
+                memory.chat_memory.add_ai_message(message["content"])
+        if strategy == "summary" and messages:
+            # Folds everything over the budget into the summary with one LLM call
+            memory.prune()
+        if messages:
+            with self._lock:
+                self._rehydrations += 1
+            logger.info(f"Rehydrated {len(messages)} messages for conversation ID: {conversation_id}")
+
+    def _state(self, strategy: str, memory: BaseMemory) -> Dict[str, Any]:
+        messages = [
+            ["user" if m.type == "human" else "assistant", m.content] for m in memory.chat_memory.messages
+        ]
+        if strategy == "window":
+            # The window memory keeps every message but only shows the last k turns
+            messages = messages[-2 * self.window_turns:]
+        return {
+            "strategy": strategy,
+            "messages": messages,
+            "summary": getattr(memory, "moving_summary_buffer", ""),
+        }
+
+    def _restore(self, state: Dict[str, Any], llm: LLM) -> BaseMemory:
+        memory = self._build(state["strategy"], llm)
+        for role, content in state["messages"]:
+            if role == "user":
+                memory.chat_memory.add_user_message(content)
+            else:
+                memory.chat_memory.add_ai_message(content)
+        if state.get("summary"):
+            memory.moving_summary_buffer = state["summary"]
+        return memory
+
+    def _evict(self, now: float) -> None:
+        for conversation_id in list(self._cache):
+            _, _, last_used = self._cache[conversation_id]
+            if now - last_used <= self.idle_seconds and len(self._cache) <= self.max_conversations:
+                break
+            del self._cache[conversation_id]
+            self._evictions += 1
+
+    def _cache_put(self, conversation_id: str, version: int, state: Dict[str, Any]) -> None:
+        if not self.store.shared:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._cache[conversation_id] = (version, state, now)
+            self._cache.move_to_end(conversation_id)
+            self._evict(now)
+
+    def _load(self, conversation_id: str, use_cache: bool = True) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Reads a conversation's state through the local cache. Only the version
+        is fetched from the store when the cached state is still current.
+        """
+        if not self.store.shared:
+            return self.store.load(conversation_id)
+        with self._lock:
+            entry = self._cache.get(conversation_id) if use_cache else None
+        if entry is not None:
+            version = self.store.version(conversation_id)
+            if version == entry[0]:
+                with self._lock:
+                    self._cache_hits += 1
+                    if conversation_id in self._cache:
+                        self._cache[conversation_id] = (entry[0], entry[1], time.monotonic())
+                        self._cache.move_to_end(conversation_id)
+                return entry[0], entry[1]
+        with self._lock:
+            self._cache_misses += 1
+        record = self.store.load(conversation_id)
+        if record is None:
+            with self._lock:
+                self._cache.pop(conversation_id, None)
+            return None
+        self._cache_put(conversation_id, *record)
+        return record
+
+    def _safe_load(self, conversation_id: str, use_cache: bool = True) -> Optional[Tuple[int, Dict[str, Any]]]:
+        try:
+            return self._load(conversation_id, use_cache)
+        except Exception as e:
+            # Without the store the memory is rebuilt from the messages table
+            with self._lock:
+                self._store_errors += 1
+            logger.error(f"State Store Error: {e}")
+            return None
+
+    def _memory_from(self, conversation_id: str, strategy: str, llm: LLM, record: Optional[Tuple[int, Dict[str, Any]]]) -> Tuple[int, BaseMemory]:
+        if record is not None and record[1]["strategy"] == strategy:
+            return record[0], self._restore(record[1], llm)
+        # A new conversation, or one switching strategy, starts from the messages table
+        memory = self._build(strategy, llm)
+        self._rehydrate(conversation_id, strategy, memory)
+        return (record[0] if record is not None else 0), memory
+
+    def get(self, conversation_id: str, llm: LLM, strategy: Optional[str] = None) -> BaseMemory:
+        strategy = strategy or self.default_strategy
+        if strategy not in MEMORY_STRATEGIES:
+            logger.warning(f"Memory strategy '{strategy}' not recognized. Defaulting to '{self.default_strategy}'.")
+            strategy = self.default_strategy
+        record = self._safe_load(conversation_id)
+        version, memory = self._memory_from(conversation_id, strategy, llm, record)
+        if record is None:
+            logger.info(f"Initialized '{strategy}' memory for conversation ID: {conversation_id}")
+        return StoredMemory(
+            conversation_id=conversation_id, strategy=strategy, memory=memory, llm=llm, version=version, manager=self
+        )
+
+    def save_turn(self, stored: StoredMemory, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """
+        Adds a turn to stored and writes the new state, re-applying the turn
+        to the latest state whenever another worker saved first.
+        """
+        for attempt in range(MEMORY_SAVE_ATTEMPTS):
+            stored.memory.save_context(inputs, outputs)
+            state = self._state(stored.strategy, stored.memory)
+            try:
+                version = self.store.save(stored.conversation_id, stored.version, state)
+            except Exception as e:
+                with self._lock:
+                    self._store_errors += 1
+                logger.error(f"State Store Error: {e}")
+                return
+            if version is not None:
+                stored.version = version
+                self._cache_put(stored.conversation_id, version, state)
+                return
+            with self._lock:
+                self._conflicts += 1
+            MEMORY_SAVE_CONFLICTS.inc()
+            time.sleep(random.uniform(0, MEMORY_SAVE_BACKOFF * 2 ** attempt))
+            record = self._safe_load(stored.conversation_id, use_cache=False)
+            stored.version, stored.memory = self._memory_from(stored.conversation_id, stored.strategy, stored.llm, record)
+        logger.error(f"Gave up saving memory for conversation ID: {stored.conversation_id} after {MEMORY_SAVE_ATTEMPTS} conflicts")
+
+    def record_turn(self, conversation_id: str, user_input: str, response: str, llm: Optional[LLM] = None) -> None:
+        """
+        Adds a turn that was answered without the agent to the stored memory, if any.
+        """
+        record = self._safe_load(conversation_id)
+        if record is None:
+            # The next request rebuilds this memory from the messages table, turn included
+            return
+        if llm is None and record[1]["strategy"] != "window":
+            self.discard(conversation_id)
+            return
+        stored = StoredMemory(
+            conversation_id=conversation_id, strategy=record[1]["strategy"], memory=self._restore(record[1], llm),
+            llm=llm, version=record[0], manager=self
+        )
+        stored.save_context({"input": user_input}, {"output": response})
+
+    def is_live(self, conversation_id: str) -> bool:
+        try:
+            return self.store.version(conversation_id) is not None
+        except Exception as e:
+            logger.error(f"State Store Error: {e}")
+            return True
+
+    def discard(self, conversation_id: str) -> None:
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+        try:
+            self.store.delete(conversation_id)
+        except Exception as e:
+            logger.error(f"State Store Error: {e}")
+
+    def memory_bytes(self) -> int:
+        # Bytes of the states held in this process
+        if self.store.shared:
+            with self._lock:
+                states = [state for _, state, _ in self._cache.values()]
+        else:
+            states = self.store.states()
+        total = 0
+        for state in states:
+            total += sum(len(content.encode("utf-8")) for _, content in state["messages"])
+            total += len(state.get("summary", "").encode("utf-8"))
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        store = self.store.stats()
+        with self._lock:
+            if self.store.shared:
+                strategies: Dict[str, int] = {}
+                for _, state, _ in self._cache.values():
+                    strategies[state["strategy"]] = strategies.get(state["strategy"], 0) + 1
+                live, evictions = len(self._cache), self._evictions
+            else:
+                strategies = store.pop("strategies")
+                live, evictions = store["conversations"], store["evictions"]
+            lookups = self._cache_hits + self._cache_misses
+            stats = {
+                "live_conversations": live,
+                "max_conversations": self.max_conversations,
+                "strategies": strategies,
+                "rehydrations": self._rehydrations,
+                "evictions": evictions,
+                "cache_hits": self._cache_hits,
+                "cache_misses": self._cache_misses,
+                "cache_hit_rate": round(self._cache_hits / lookups, 4) if lookups else 0.0,
+                "save_conflicts": self._conflicts,
+                "store_errors": self._store_errors,
+                "store": store,
+            }
+        stats["memory_bytes"] = self.memory_bytes()
+        return stats
+
+
+memory_manager = ConversationMemoryManager()
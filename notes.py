@@ -0,0 +1,87 @@
+# notes.py
+
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from db import SessionLocal, Note
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+SEARCH_SQL = text("""
+    SELECT n.id, n.name, n.location,
+           snippet(notes_fts, 1, '[', ']', '...', 12) AS snippet,
+           bm25(notes_fts) AS rank
+    FROM notes_fts
+    JOIN notes n ON n.id = notes_fts.rowid
+    WHERE notes_fts MATCH :match
+      AND (:location IS NULL OR n.location = :location)
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query: every word must match, as a prefix.
+    Quoting each word keeps FTS operators in user input from being parsed.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def find_notes(
+    query: str,
+    location: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    offset: int = 0,
+    session_factory=SessionLocal
+) -> List[Dict]:
+    """
+    Full-text search over note names and content, best matches first.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    session_db = session_factory()
+    try:
+        rows = session_db.execute(
+            SEARCH_SQL,
+            {"match": match, "location": location, "limit": limit, "offset": max(offset, 0)}
+        ).all()
+        return [
+            {"id": r.id, "name": r.name, "location": r.location, "snippet": r.snippet, "rank": r.rank}
+            for r in rows
+        ]
+    finally:
+        session_db.close()
+
+
+def list_notes(
+    location: Optional[str] = None,
+    after_id: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    session_factory=SessionLocal
+) -> List[Dict]:
+    """
+    Returns notes ordered by id. Pass the last id of a page as after_id to fetch the next one.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    session_db = session_factory()
+    try:
+        query = session_db.query(Note).filter(Note.id > after_id)
+        if location:
+            query = query.filter(Note.location == location)
+        rows = query.order_by(Note.id).limit(limit).all()
+        return [
+            {"id": n.id, "name": n.name, "location": n.location, "content": n.content}
+            for n in rows
+        ]
+    finally:
+        session_db.close()
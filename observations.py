@@ -0,0 +1,135 @@
+# observations.py
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+from metrics import registry, SIZE_BUCKETS
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Characters a tool's observation may take in the agent's scratchpad (about
+# four per token). TOOL_OBSERVATION_CHARS_<TOOL> overrides it for one tool.
+TOOL_OBSERVATION_CHARS = int(os.getenv("TOOL_OBSERVATION_CHARS", "600"))
+# Longest a single result line may be in the scratchpad
+TOOL_OBSERVATION_ITEM_CHARS = int(os.getenv("TOOL_OBSERVATION_ITEM_CHARS", "200"))
+TOOL_OBSERVATIONS_COMPACT = os.getenv("TOOL_OBSERVATIONS_COMPACT", "true").lower() in ("1", "true", "yes")
+
+TOOL_OBSERVATION_BYTES = registry.histogram(
+    "prism_tool_observation_bytes", "Size of a tool result, in full and as sent to the LLM.", ["tool", "kind"], SIZE_BUCKETS
+)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+class Observation(str):
+    """
+    Structured tool result. As a str it is the compact rendering the agent
+    puts in its scratchpad and resends on every later step; full holds the
+    complete rendering for anything that answers the user directly.
+    """
+
+    def __new__(cls, compact: str, full: Optional[str] = None, tool: str = "", items: Sequence[str] = ()):
+        obj = super().__new__(cls, compact)
+        obj.full = compact if full is None else full
+        obj.tool = tool
+        obj.items = list(items)
+        return obj
+
+
+def full_text(output: Any) -> str:
+    """
+    Complete text of a tool result, whether or not it is an Observation.
+    """
+    return getattr(output, "full", None) or str(output)
+
+
+def observation_budget(tool: str) -> int:
+    override = os.getenv(f"TOOL_OBSERVATION_CHARS_{tool.upper()}")
+    return int(override) if override else TOOL_OBSERVATION_CHARS
+
+
+def dedupe(items: Sequence[str]) -> List[str]:
+    # Compared case- and whitespace-insensitively; the first spelling is kept
+    seen = set()
+    unique = []
+    for item in items:
+        key = " ".join(item.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def truncate(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1].rsplit(" ", 1)[0] if " " in text[:limit - 1] else text[:limit - 1]
+    return cut.rstrip(" ,;:") + "…"
+
+
+def observation(
+    tool: str,
+    items: Sequence[str],
+    title: str = "",
+    bullet: str = "• ",
+    budget: Optional[int] = None,
+    item_chars: int = TOOL_OBSERVATION_ITEM_CHARS
+) -> Observation:
+    """
+    Renders a tool's results in full and compactly. The compact rendering
+    drops duplicates, shortens each item to item_chars and stops adding items
+    once the tool's character budget is spent, noting how many were left out.
+    """
+    items = [i for i in items if i and i.strip()]
+    lines = ([title] if title else []) + [bullet + i for i in items]
+    full = "\n".join(lines)
+    if not TOOL_OBSERVATIONS_COMPACT:
+        result = Observation(full, full, tool, items)
+        record_observation(tool, result)
+        return result
+
+    budget = observation_budget(tool) if budget is None else budget
+    unique = dedupe(items)
+    compact_lines = [title] if title else []
+    used = len(title)
+    for index, item in enumerate(unique):
+        line = bullet + truncate(item, item_chars)
+        if compact_lines and used + len(line) + 1 > budget:
+            compact_lines.append(f"(+{len(unique) - index} more)")
+            break
+        compact_lines.append(line)
+        used += len(line) + 1
+    result = Observation("\n".join(compact_lines), full, tool, unique)
+    record_observation(tool, result)
+    return result
+
+
+def record_observation(tool: str, result: Observation) -> None:
+    full = len(result.full.encode("utf-8"))
+    sent = len(str(result).encode("utf-8"))
+    TOOL_OBSERVATION_BYTES.observe(full, tool=tool, kind="full")
+    TOOL_OBSERVATION_BYTES.observe(sent, tool=tool, kind="sent")
+    with _stats_lock:
+        totals = _stats.setdefault(tool, {"results": 0, "full_bytes": 0, "sent_bytes": 0})
+        totals["results"] += 1
+        totals["full_bytes"] += full
+        totals["sent_bytes"] += sent
+
+
+def observation_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        tools = {
+            tool: dict(totals, saved_ratio=round(1 - totals["sent_bytes"] / totals["full_bytes"], 4) if totals["full_bytes"] else 0.0)
+            for tool, totals in _stats.items()
+        }
+    return {
+        "compact": TOOL_OBSERVATIONS_COMPACT,
+        "budget_chars": TOOL_OBSERVATION_CHARS,
+        "item_chars": TOOL_OBSERVATION_ITEM_CHARS,
+        "tools": tools,
+    }
@@ -0,0 +1,257 @@
+# planner.py
+
+import asyncio
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.chains.base import Chain
+from langchain.callbacks.manager import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+from langchain.schema import AgentAction, AgentFinish
+from langchain.tools import BaseTool
+from langchain_core.language_models import BaseLanguageModel
+from deadlines import exceeded, partial_answer, running_low, usable_seconds
+from observations import full_text
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tool calls from one plan that may run at once, and the most a plan may ask for
+PLAN_MAX_WORKERS = int(os.getenv("PLAN_MAX_WORKERS", "8"))
+PLAN_MAX_CALLS = int(os.getenv("PLAN_MAX_CALLS", "4"))
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+ACTION_PATTERN = re.compile(r"Action\s*:\s*(.+?)\s*\n\s*Action\s*Input\s*:\s*(.+)")
+
+# Both prompts share one static prefix (system prompt, tools and the
+# instructions for both steps) followed by the history and question, so the
+# backend's prefix cache covers everything up to the question for every run of
+# an agent, and the answer call also reuses the question from the plan call
+PROMPT_PREFIX = """{system_prompt}
+
+You have access to the following tools:
+
+{tool_descriptions}
+
+You answer in two steps. First you plan the tool calls needed to answer the
+question. The calls run at the same time, so no call may depend on the result
+of another. List at most {max_calls} calls, each in this format:
+
+Action: the tool to use, one of [{tool_names}]
+Action Input: the input to the tool
+
+If no tool is needed, write only: No tools needed
+
+Then, given the results of those calls, you answer the question without
+calling any more tools, in this format:
+
+Final Answer: <your answer>
+{history}
+Question: {input}
+"""
+
+PLAN_PROMPT = PROMPT_PREFIX + """
+Plan every tool call needed to answer the question.
+"""
+
+ANSWER_PROMPT = PROMPT_PREFIX + """
+Tool results:
+{observations}
+
+Answer the question using the tool results.
+"""
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PLAN_MAX_WORKERS, thread_name_prefix="plan-tool")
+    return _executor
+
+
+def parse_plan(text: str, tool_names: List[str], max_calls: int = PLAN_MAX_CALLS) -> List[Tuple[str, str]]:
+    """
+    Extracts distinct (tool, input) pairs naming known tools from a plan.
+    """
+    calls: List[Tuple[str, str]] = []
+    for match in ACTION_PATTERN.finditer(text):
+        tool = match.group(1).strip().strip("`*")
+        tool_input = match.group(2).strip().strip("\"'`")
+        if tool in tool_names and (tool, tool_input) not in calls:
+            calls.append((tool, tool_input))
+    return calls[:max_calls]
+
+
+def final_answer(text: str) -> str:
+    idx = text.find(FINAL_ANSWER_MARKER)
+    return (text[idx + len(FINAL_ANSWER_MARKER):] if idx != -1 else text).strip()
+
+
+class PlanAndExecuteChain(Chain):
+    """
+    Asks the LLM for all tool calls up front, runs them concurrently and
+    answers from the merged observations, so a run costs two LLM calls however
+    many tools it uses. Only suits agents whose lookups are independent.
+
+    Under a request deadline, tool calls still running when only the reserve
+    is left are abandoned, and the answer call is skipped for a partial answer
+    built from the tool results.
+    """
+
+    llm: BaseLanguageModel
+    tools: List[BaseTool]
+    system_prompt: str = ""
+    max_calls: int = PLAN_MAX_CALLS
+    input_key: str = "input"
+    output_key: str = "output"
+
+    @property
+    def input_keys(self) -> List[str]:
+        return [self.input_key]
+
+    @property
+    def output_keys(self) -> List[str]:
+        return [self.output_key]
+
+    @property
+    def _chain_type(self) -> str:
+        return "plan_and_execute"
+
+    def _history(self, inputs: Dict[str, Any]) -> str:
+        history = inputs.get("chat_history")
+        return f"\nConversation so far:\n{history}\n" if history else ""
+
+    def _prefix_fields(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "system_prompt": self.system_prompt.strip(),
+            "tool_descriptions": "\n".join(f"{t.name}: {t.description}" for t in self.tools),
+            "tool_names": ", ".join(t.name for t in self.tools),
+            "max_calls": self.max_calls,
+            "history": self._history(inputs),
+            "input": inputs[self.input_key],
+        }
+
+    def _plan_prompt(self, inputs: Dict[str, Any]) -> str:
+        return PLAN_PROMPT.format(**self._prefix_fields(inputs))
+
+    def _answer_prompt(self, inputs: Dict[str, Any], results: List[Tuple[str, str, str]]) -> str:
+        # The results are sent once, to the call that writes the answer, so they go in full
+        observations = "\n".join(f"[{tool}({tool_input})]\n{full_text(output)}" for tool, tool_input, output in results)
+        return ANSWER_PROMPT.format(
+            **self._prefix_fields(inputs),
+            observations=observations or "No tools were used."
+        )
+
+    def _run_tool(self, tool_name: str, tool_input: str, callbacks: Any) -> str:
+        tool = next(t for t in self.tools if t.name == tool_name)
+        try:
+            output = tool.run(tool_input, callbacks=callbacks)
+            # Kept as is, since str() would drop an Observation's full payload
+            return output if isinstance(output, str) else str(output)
+        except Exception as e:
+            logger.error(f"Plan Tool Error: {e}")
+            return f"Error: {e}"
+
+    async def _arun_tool(self, tool_name: str, tool_input: str, callbacks: Any, limit: asyncio.Semaphore) -> str:
+        tool = next(t for t in self.tools if t.name == tool_name)
+        async with limit:
+            try:
+                output = await tool.arun(tool_input, callbacks=callbacks)
+                return output if isinstance(output, str) else str(output)
+            except Exception as e:
+                logger.error(f"Plan Tool Error: {e}")
+                return f"Error: {e}"
+
+    def _abandoned(self) -> str:
+        exceeded("tool")
+        return "Error: the request deadline passed before this tool finished"
+
+    def _partial(self, results: List[Tuple[str, str, str]]) -> AgentFinish:
+        exceeded("agent")
+        return AgentFinish({self.output_key: partial_answer([full_text(output) for _, _, output in results])}, "")
+
+    def _call(self, inputs: Dict[str, Any], run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, str]:
+        run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        plan = self.llm.invoke(self._plan_prompt(inputs), config={"callbacks": run_manager.get_child()})
+        calls = parse_plan(plan, [t.name for t in self.tools], self.max_calls)
+
+        futures = []
+        for tool_name, tool_input in calls:
+            run_manager.on_agent_action(AgentAction(tool_name, tool_input, plan))
+            # Each call gets its own context copy so tracing context reaches the worker thread
+            context = contextvars.copy_context()
+            futures.append(get_executor().submit(
+                context.run, self._run_tool, tool_name, tool_input, run_manager.get_child()
+            ))
+        results = []
+        for (name, tool_input), future in zip(calls, futures):
+            try:
+                results.append((name, tool_input, future.result(timeout=usable_seconds())))
+            except FutureTimeoutError:
+                results.append((name, tool_input, self._abandoned()))
+
+        if running_low():
+            finish = self._partial(results)
+            run_manager.on_agent_finish(finish)
+            return finish.return_values
+        answer = self.llm.invoke(self._answer_prompt(inputs, results), config={"callbacks": run_manager.get_child()})
+        output = final_answer(answer)
+        run_manager.on_agent_finish(AgentFinish({self.output_key: output}, answer))
+        return {self.output_key: output}
+
+    async def _acall(self, inputs: Dict[str, Any], run_manager: Optional[AsyncCallbackManagerForChainRun] = None) -> Dict[str, str]:
+        run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        try:
+            plan = await asyncio.wait_for(
+                self.llm.ainvoke(self._plan_prompt(inputs), config={"callbacks": run_manager.get_child()}),
+                usable_seconds()
+            )
+        except asyncio.TimeoutError:
+            finish = self._partial([])
+            await run_manager.on_agent_finish(finish)
+            return finish.return_values
+        calls = parse_plan(plan, [t.name for t in self.tools], self.max_calls)
+
+        limit = asyncio.Semaphore(PLAN_MAX_WORKERS)
+        for tool_name, tool_input in calls:
+            await run_manager.on_agent_action(AgentAction(tool_name, tool_input, plan))
+        tasks = [
+            asyncio.ensure_future(self._arun_tool(tool_name, tool_input, run_manager.get_child(), limit))
+            for tool_name, tool_input in calls
+        ]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, timeout=usable_seconds())
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        results = []
+        for (name, tool_input), task in zip(calls, tasks):
+            if task.done():
+                results.append((name, tool_input, task.result()))
+            else:
+                task.cancel()
+                results.append((name, tool_input, self._abandoned()))
+
+        answer = None
+        if not running_low():
+            try:
+                answer = await asyncio.wait_for(
+                    self.llm.ainvoke(self._answer_prompt(inputs, results), config={"callbacks": run_manager.get_child()}),
+                    usable_seconds()
+                )
+            except asyncio.TimeoutError:
+                pass
+        if answer is None:
+            finish = self._partial(results)
+            await run_manager.on_agent_finish(finish)
+            return finish.return_values
+        output = final_answer(answer)
+        await run_manager.on_agent_finish(AgentFinish({self.output_key: output}, answer))
+        return {self.output_key: output}
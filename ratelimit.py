@@ -0,0 +1,288 @@
+# ratelimit.py
+
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import httpx
+from metrics import registry
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per upstream: (requests per second, burst, requests per UTC day; 0 means no daily cap).
+# Override one with RATE_LIMIT_<UPSTREAM>="rps,burst,daily", e.g. RATE_LIMIT_NEWS="1,3,100"
+DEFAULT_UPSTREAM_LIMITS = {
+    # Developer plan: 5,000 searches a month
+    "serpapi": (5.0, 5, 165),
+    # 10,000 quota units a day, and a search costs 100
+    "youtube": (10.0, 10, 100),
+    # Developer plan: 100 requests a day
+    "news": (2.0, 5, 100),
+    # Free plan: 60 calls a minute, 1,000,000 a month
+    "weather": (1.0, 10, 30000),
+}
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Longest a call may queue for a token before it is shed
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "2"))
+# How long to stop calling an upstream that answered 429 without a Retry-After
+RATE_LIMIT_429_PAUSE = float(os.getenv("RATE_LIMIT_429_PAUSE", "5"))
+
+RATE_LIMIT_REQUESTS = registry.counter(
+    "prism_rate_limit_requests", "Upstream calls by admission outcome.", ["upstream", "outcome"]
+)
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    "prism_rate_limit_wait_seconds", "Time an admitted upstream call queued for a token.", ["upstream"]
+)
+RATE_LIMIT_REMAINING = registry.gauge(
+    "prism_rate_limit_remaining_today", "Calls left today across an upstream's API keys.", ["upstream"]
+)
+
+
+def load_limits() -> Dict[str, Tuple[float, int, int]]:
+    limits = dict(DEFAULT_UPSTREAM_LIMITS)
+    for upstream in limits:
+        override = os.getenv(f"RATE_LIMIT_{upstream.upper()}")
+        if not override:
+            continue
+        try:
+            rps, burst, daily = (part.strip() for part in override.split(","))
+            limits[upstream] = (float(rps), int(burst), int(daily))
+        except ValueError:
+            logger.error(f"Invalid RATE_LIMIT_{upstream.upper()} '{override}', expected 'rps,burst,daily'")
+    return limits
+
+
+def split_keys(value: str) -> List[str]:
+    """
+    An API key setting may hold several comma separated keys, each with its own quota.
+    """
+    return [k.strip() for k in value.split(",") if k.strip()] or [""]
+
+
+def key_id(api_key: str) -> str:
+    # Status output names keys by a short hash, never by the key itself
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8] if api_key else "default"
+
+
+def seconds_until_utc_midnight(now: Optional[float] = None) -> float:
+    now = time.time() if now is None else now
+    return 86400 - now % 86400
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    retry_after = response.headers.get("Retry-After", "")
+    return float(retry_after) if retry_after.isdigit() else None
+
+
+class RateLimited(Exception):
+    """
+    Raised instead of calling an upstream whose budget cannot admit the call in time.
+    """
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(self.describe())
+
+    def describe(self) -> str:
+        if self.reason == "quota":
+            hours, minutes = divmod(int(self.retry_after // 60), 60)
+            return f"daily quota exhausted, resets in {hours}h {minutes}m"
+        if self.reason == "blocked":
+            return f"upstream asked to back off, retry in {self.retry_after:.0f}s"
+        return f"rate limit reached, retry in {self.retry_after:.1f}s"
+
+
+class TokenBucket:
+    """
+    Token bucket for one API key of one upstream, plus its daily call count.
+
+    Callers reserve a token and sleep until it is theirs, so the balance can go
+    negative and waiting callers are admitted in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: int, daily: int):
+        self.rate = rate
+        self.burst = burst
+        self.daily = daily
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.day = int(time.time() // 86400)
+        self.used_today = 0
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        day = int(time.time() // 86400)
+        if day != self.day:
+            self.day, self.used_today = day, 0
+
+    def remaining_today(self) -> Optional[int]:
+        return max(0, self.daily - self.used_today) if self.daily else None
+
+    def available_at(self, now: float) -> float:
+        start = max(now, self.blocked_until)
+        if self.tokens >= 1:
+            return start
+        return max(start, now + (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Admission control for the upstream APIs the tools call.
+
+    Each (upstream, API key) pair has a token bucket and a daily quota. A call
+    takes the key that can serve it soonest and waits for its token if that
+    fits within max_wait and the caller's deadline; otherwise, or once every
+    key's quota is spent, it is shed right away with RateLimited. An upstream
+    that still answers 429 is paused for its Retry-After. Limits are per
+    process, so split them across workers.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, int, int]]] = None,
+        max_wait: float = RATE_LIMIT_MAX_WAIT,
+        enabled: bool = RATE_LIMITS_ENABLED
+    ):
+        self.limits = limits if limits is not None else load_limits()
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._outcomes: Dict[str, Dict[str, int]] = {}
+
+    def _bucket(self, upstream: str, api_key: str) -> TokenBucket:
+        bucket = self._buckets.get((upstream, api_key))
+        if bucket is None:
+            rate, burst, daily = self.limits[upstream]
+            bucket = self._buckets[(upstream, api_key)] = TokenBucket(rate, burst, daily)
+        return bucket
+
+    def _count(self, upstream: str, outcome: str) -> None:
+        RATE_LIMIT_REQUESTS.inc(upstream=upstream, outcome=outcome)
+        counts = self._outcomes.setdefault(upstream, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    def _set_remaining(self, upstream: str) -> None:
+        remaining = [b.remaining_today() for (u, _), b in self._buckets.items() if u == upstream]
+        if remaining and None not in remaining:
+            RATE_LIMIT_REMAINING.set(sum(remaining), upstream=upstream)
+
+    def _reserve(self, upstream: str, api_keys: Sequence[str], deadline: Optional[float]) -> Tuple[str, float]:
+        with self._lock:
+            now = time.monotonic()
+            max_wait = self.max_wait if deadline is None else min(self.max_wait, deadline - now)
+            candidates = []
+            for api_key in api_keys:
+                bucket = self._bucket(upstream, api_key)
+                bucket.refill(now)
+                if bucket.remaining_today() == 0:
+                    continue
+                candidates.append((bucket.available_at(now), api_key, bucket))
+            if not candidates:
+                self._count(upstream, "shed_quota")
+                raise RateLimited(upstream, "quota", seconds_until_utc_midnight())
+            available_at, api_key, bucket = min(candidates, key=lambda c: c[0])
+            wait = available_at - now
+            if wait > max_wait:
+                blocked = bucket.blocked_until > now + max_wait
+                self._count(upstream, "shed_blocked" if blocked else "shed_rate")
+                raise RateLimited(upstream, "blocked" if blocked else "rate", wait)
+            bucket.tokens -= 1
+            bucket.used_today += 1
+            self._count(upstream, "waited" if wait > 0 else "admitted")
+            self._set_remaining(upstream)
+        RATE_LIMIT_WAIT_SECONDS.observe(wait, upstream=upstream)
+        return api_key, wait
+
+    def _refund(self, upstream: str, api_key: str) -> None:
+        with self._lock:
+            bucket = self._bucket(upstream, api_key)
+            bucket.tokens = min(bucket.burst, bucket.tokens + 1)
+            bucket.used_today = max(0, bucket.used_today - 1)
+
+    def acquire(self, upstream: str, api_keys: Sequence[str] = ("",), deadline: Optional[float] = None) -> str:
+        """
+        Blocks until a call to upstream is admitted and returns the API key to
+        use. Raises RateLimited if it cannot be admitted before the deadline
+        (a time.monotonic() value) or within max_wait.
+        """
+        if not self.enabled or upstream not in self.limits:
+            return api_keys[0]
+        api_key, wait = self._reserve(upstream, api_keys, deadline)
+        if wait > 0:
+            time.sleep(wait)
+        return api_key
+
+    async def aacquire(self, upstream: str, api_keys: Sequence[str] = ("",), deadline: Optional[float] = None) -> str:
+        if not self.enabled or upstream not in self.limits:
+            return api_keys[0]
+        api_key, wait = self._reserve(upstream, api_keys, deadline)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # The call will not be made, so give its token back
+                self._refund(upstream, api_key)
+                raise
+        return api_key
+
+    def penalize(self, upstream: str, api_key: str, retry_after: Optional[float] = None) -> None:
+        """
+        Records a 429 from upstream: drains the key's bucket and pauses it for
+        Retry-After, or RATE_LIMIT_429_PAUSE without one.
+        """
+        if upstream not in self.limits:
+            return
+        pause = retry_after if retry_after is not None else RATE_LIMIT_429_PAUSE
+        with self._lock:
+            bucket = self._bucket(upstream, api_key)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + pause)
+            self._count(upstream, "throttled")
+        logger.warning(f"{upstream} returned 429; pausing key {key_id(api_key)} for {pause:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            upstreams = {}
+            for upstream, (rate, burst, daily) in self.limits.items():
+                keys = {}
+                for (u, api_key), bucket in self._buckets.items():
+                    if u != upstream:
+                        continue
+                    bucket.refill(now)
+                    keys[key_id(api_key)] = {
+                        "tokens": round(max(bucket.tokens, 0.0), 3),
+                        # A negative balance is the number of calls waiting for a token
+                        "queued": math.ceil(-bucket.tokens) if bucket.tokens < 0 else 0,
+                        "used_today": bucket.used_today,
+                        "remaining_today": bucket.remaining_today(),
+                        "blocked_for_seconds": round(max(0.0, bucket.blocked_until - now), 3),
+                    }
+                upstreams[upstream] = {
+                    "rate_per_second": rate,
+                    "burst": burst,
+                    "daily_limit": daily or None,
+                    "keys": keys,
+                    "outcomes": dict(self._outcomes.get(upstream, {})),
+                }
+            return {
+                "enabled": self.enabled,
+                "max_wait_seconds": self.max_wait,
+                "quota_resets_in_seconds": round(seconds_until_utc_midnight(), 1),
+                "upstreams": upstreams,
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,140 @@
+# responses.py
+
+import hashlib
+import json
+import os
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+from fastapi import Request, Response
+from metrics import registry
+import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are sent as they are; compressing them costs more than it saves
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Brotli's default quality (11) is meant for static assets and is far too slow per request
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+RESPONSE_BYTES = registry.counter(
+    "prism_response_bytes", "Body bytes of read API responses before and after compression.", ["encoding", "stage"]
+)
+NOT_MODIFIED = registry.counter(
+    "prism_not_modified_responses", "Read API requests answered with 304 Not Modified."
+)
+
+
+def supported_encodings() -> tuple:
+    # Preferred first
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks the best supported encoding the client accepts, or None for identity.
+    """
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    return body
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """
+    Compresses a stream chunk by chunk. Each chunk is flushed so the client
+    can decode it as soon as it arrives.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+
+def make_etag(data: Union[bytes, str]) -> str:
+    # Weak, since the gzip and brotli bodies of one representation share it
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return f'W/"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    True if If-None-Match names this ETag, compared weakly as RFC 9110 requires.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tag = etag[2:] if etag.startswith("W/") else etag
+    return any((t.strip()[2:] if t.strip().startswith("W/") else t.strip()) == tag for t in header.split(","))
+
+
+def _cache_headers(etag: str) -> Dict[str, str]:
+    # no-cache: clients may keep the body but must revalidate it with the ETag
+    return {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+
+
+def not_modified_response(etag: str) -> Response:
+    NOT_MODIFIED.inc()
+    return Response(status_code=304, headers=_cache_headers(etag))
+
+
+def json_response(request: Request, payload: Any, etag: Optional[str] = None) -> Response:
+    """
+    Serializes payload once, answers 304 if the client already has it and
+    otherwise compresses it for the client. Without an etag, one is derived
+    from the body.
+    """
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    etag = etag or make_etag(body)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    headers = _cache_headers(etag)
+    encoding = choose_encoding(request.headers.get("accept-encoding")) if len(body) >= COMPRESS_MIN_BYTES else None
+    RESPONSE_BYTES.inc(len(body), encoding=encoding or "identity", stage="raw")
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    RESPONSE_BYTES.inc(len(body), encoding=encoding or "identity", stage="sent")
+    return Response(content=body, media_type="application/json", headers=headers)
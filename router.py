@@ -0,0 +1,502 @@
+# router.py
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+from langchain.llms.base import LLM
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun
+from metrics import registry
+from tracing import span
+from deadlines import DeadlineExceeded, exceeded, expired
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model choice that lets the router pick the backend
+AUTO_MODEL = "auto"
+# Backend that answered the last routed call made in this context
+served_backend: ContextVar[Optional[str]] = ContextVar("served_backend", default=None)
+
+# Rolling window of calls per backend that latency and error rates are computed over
+ROUTER_WINDOW_SIZE = int(os.getenv("ROUTER_WINDOW_SIZE", "100"))
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "300"))
+# Calls a backend needs in the window before its latency is trusted
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+# Retry a request on the other backend when its backend fails
+ROUTER_FALLBACK = os.getenv("ROUTER_FALLBACK", "true").lower() in ("1", "true", "yes")
+# Circuit breaker: opens after this many failures in a row, or at this error rate over the window
+ROUTER_BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))
+ROUTER_BREAKER_ERROR_RATE = float(os.getenv("ROUTER_BREAKER_ERROR_RATE", "0.5"))
+ROUTER_BREAKER_COOLDOWN = float(os.getenv("ROUTER_BREAKER_COOLDOWN", "30"))
+# Hedging sends a duplicate request to the other backend once the first one
+# has run longer than this percentile of its recent latencies
+ROUTER_HEDGE = os.getenv("ROUTER_HEDGE", "false").lower() in ("1", "true", "yes")
+ROUTER_HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "95"))
+ROUTER_HEDGE_MIN_DELAY = float(os.getenv("ROUTER_HEDGE_MIN_DELAY", "0.5"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+ROUTER_DECISIONS = registry.counter(
+    "prism_router_decisions", "Backend calls by requested model, backend and reason.", ["requested", "backend", "reason"]
+)
+ROUTER_CALL_SECONDS = registry.histogram(
+    "prism_router_call_seconds", "Latency of model backend calls.", ["backend", "outcome"]
+)
+ROUTER_BREAKER_STATE = registry.gauge(
+    "prism_router_breaker_state", "Circuit breaker state per backend: 0 closed, 1 half open, 2 open.", ["backend"]
+)
+ROUTER_HEDGES = registry.counter(
+    "prism_router_hedges", "Hedged requests by the backend that was first and the one that answered.", ["primary", "winner"]
+)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class BackendHealth:
+    """
+    Rolling latency and error window plus the circuit breaker of one backend.
+
+    Closed lets every call through. Open rejects calls until the cooldown has
+    passed, then half open lets a single trial call through: success closes
+    the breaker and failure opens it again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: Deque[Tuple[float, float, bool]] = deque(maxlen=ROUTER_WINDOW_SIZE)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.consecutive_failures = 0
+        self.opened = 0
+        ROUTER_BREAKER_STATE.set(0, backend=name)
+
+    def window(self, now: float) -> List[Tuple[float, float, bool]]:
+        return [s for s in self.samples if now - s[0] <= ROUTER_WINDOW_SECONDS]
+
+    def latencies(self, now: float) -> List[float]:
+        return [latency for _, latency, ok in self.window(now) if ok]
+
+    def error_rate(self, now: float) -> float:
+        window = self.window(now)
+        return sum(1 for _, _, ok in window if not ok) / len(window) if window else 0.0
+
+    def set_state(self, state: str, now: float) -> None:
+        if state == OPEN:
+            self.opened_at = now
+            self.opened += 1
+            logger.warning(f"Circuit breaker for '{self.name}' opened after {self.consecutive_failures} consecutive failures")
+        elif state == CLOSED and self.state != CLOSED:
+            logger.info(f"Circuit breaker for '{self.name}' closed")
+        self.state = state
+        ROUTER_BREAKER_STATE.set(BREAKER_STATE_VALUES[state], backend=self.name)
+
+    def available(self, now: float) -> bool:
+        if self.state == OPEN and now - self.opened_at >= ROUTER_BREAKER_COOLDOWN:
+            self.set_state(HALF_OPEN, now)
+        if self.state == HALF_OPEN:
+            return not self.trial_in_flight
+        return self.state == CLOSED
+
+    def record(self, latency: float, ok: bool, now: float) -> None:
+        self.samples.append((now, latency, ok))
+        self.trial_in_flight = False
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self.set_state(CLOSED, now)
+            return
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self.set_state(OPEN, now)
+            return
+        window = self.window(now)
+        if self.state == CLOSED and (
+            self.consecutive_failures >= ROUTER_BREAKER_FAILURES
+            or (len(window) >= ROUTER_MIN_SAMPLES and self.error_rate(now) >= ROUTER_BREAKER_ERROR_RATE)
+        ):
+            self.set_state(OPEN, now)
+
+
+class ModelRouter:
+    """
+    Decides which model backend serves a call.
+
+    A named model is served by that backend unless its breaker is open, with
+    the other backends as fallbacks. "auto" orders the healthy backends by
+    their recent median latency, trying backends without enough samples first
+    so that each one gets measured.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._health: Dict[str, BackendHealth] = {}
+        self._decisions: Dict[str, Dict[str, int]] = {}
+        self._hedges: Dict[str, int] = {"sent": 0, "won": 0}
+
+    def _backend(self, name: str) -> BackendHealth:
+        health = self._health.get(name)
+        if health is None:
+            health = self._health[name] = BackendHealth(name)
+        return health
+
+    def order(self, requested: str, models: Sequence[str]) -> List[str]:
+        """
+        Backends to try for a call, best first. Backends whose breaker is open
+        are left out.
+        """
+        with self._lock:
+            now = time.monotonic()
+            healthy = [m for m in models if self._backend(m).state != OPEN or self._backend(m).available(now)]
+            if requested == AUTO_MODEL:
+                def score(model: str) -> Tuple[int, float]:
+                    latencies = self._backend(model).latencies(now)
+                    if len(latencies) < ROUTER_MIN_SAMPLES:
+                        return (0, len(latencies))
+                    return (1, percentile(latencies, 50))
+                return sorted(healthy, key=score)
+            return sorted(healthy, key=lambda m: m != requested)
+
+    def admit(self, model: str) -> bool:
+        # A half-open breaker admits one trial call at a time
+        with self._lock:
+            health = self._backend(model)
+            if not health.available(time.monotonic()):
+                return False
+            if health.state == HALF_OPEN:
+                health.trial_in_flight = True
+            return True
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        ROUTER_CALL_SECONDS.observe(latency, backend=model, outcome="ok" if ok else "error")
+        with self._lock:
+            self._backend(model).record(latency, ok, time.monotonic())
+
+    def release(self, model: str) -> None:
+        # A cancelled trial call proves nothing either way
+        with self._lock:
+            self._backend(model).trial_in_flight = False
+
+    def decide(self, requested: str, model: str, reason: str) -> None:
+        ROUTER_DECISIONS.inc(requested=requested, backend=model, reason=reason)
+        with self._lock:
+            counts = self._decisions.setdefault(requested, {})
+            key = f"{model}:{reason}"
+            counts[key] = counts.get(key, 0) + 1
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        Seconds to wait for model before hedging, or None if hedging is off or
+        model has too few samples to know what slow looks like.
+        """
+        if not ROUTER_HEDGE:
+            return None
+        with self._lock:
+            latencies = self._backend(model).latencies(time.monotonic())
+        if len(latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        return max(ROUTER_HEDGE_MIN_DELAY, percentile(latencies, ROUTER_HEDGE_PERCENTILE))
+
+    def record_hedge(self, primary: str, winner: str) -> None:
+        ROUTER_HEDGES.inc(primary=primary, winner=winner)
+        with self._lock:
+            self._hedges["sent"] += 1
+            if winner != primary:
+                self._hedges["won"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            backends = {}
+            for name, health in self._health.items():
+                health.available(now)
+                latencies = health.latencies(now)
+                backends[name] = {
+                    "state": health.state,
+                    "samples": len(health.window(now)),
+                    "error_rate": round(health.error_rate(now), 4),
+                    "p50_seconds": round(percentile(latencies, 50), 3) if latencies else None,
+                    "p95_seconds": round(percentile(latencies, 95), 3) if latencies else None,
+                    "consecutive_failures": health.consecutive_failures,
+                    "times_opened": health.opened,
+                }
+            return {
+                "fallback": ROUTER_FALLBACK,
+                "hedging": ROUTER_HEDGE,
+                "hedge_percentile": ROUTER_HEDGE_PERCENTILE,
+                "backends": backends,
+                "decisions": {k: dict(v) for k, v in self._decisions.items()},
+                # "won" counts hedges the second backend answered first
+                "hedges": dict(self._hedges),
+            }
+
+
+model_router = ModelRouter()
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+    return _executor
+
+
+class _TokenWatch:
+    """
+    Passes streamed tokens through and remembers whether any were sent, since a
+    stream that already reached the client cannot be retried elsewhere. Without
+    a run manager the tokens are dropped.
+    """
+
+    def __init__(self, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None):
+        self._run_manager = run_manager
+        self.emitted = False
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.emitted = True
+        if self._run_manager is not None:
+            await self._run_manager.on_llm_new_token(token, **kwargs)
+
+    def get_sync(self) -> Any:
+        # LLMs without a native _acall run _call in a thread with the sync manager
+        return self._run_manager.get_sync() if self._run_manager is not None else None
+
+
+class RoutedLLM(LLM):
+    """
+    LLM that sends each call through the ModelRouter to GeminiLLM or QwenLLM.
+
+    Backends raise on failure; once every backend has failed the error is
+    returned as text, as the backends themselves used to do.
+    """
+
+    def __init__(self, requested: str, backends: Callable[[str], LLM], models: Sequence[str], router: ModelRouter = model_router, **kwargs):
+        super().__init__(**kwargs)
+        self._requested = requested
+        self._backends = backends
+        self._models = list(models)
+        self._router = router
+        self._model_name = requested
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def get_num_tokens(self, text: str) -> int:
+        model = self._requested if self._requested in self._models else self._models[0]
+        return self._backends(model).get_num_tokens(text)
+
+    def _reason(self, model: str, index: int) -> str:
+        if index > 0:
+            return "fallback"
+        if self._requested == AUTO_MODEL:
+            return "auto"
+        return "requested" if model == self._requested else "breaker_open"
+
+    def _candidates(self) -> List[str]:
+        order = self._router.order(self._requested, self._models)
+        return order if ROUTER_FALLBACK else order[:1]
+
+    def preferred_backend(self) -> str:
+        """
+        Backend the next call goes to first, if it does not fail.
+        """
+        order = self._router.order(self._requested, self._models)
+        return order[0] if order else self._requested
+
+    def _failed(self, errors: List[Tuple[str, Exception]]) -> str:
+        if not errors:
+            return "• Unable to generate a response: no model backend is available."
+        return f"• Unable to generate a response: {str(errors[-1][1])}"
+
+    def _record_failure(self, model: str, started: float) -> None:
+        if expired():
+            # Cut short by the request's deadline, which says nothing about the backend
+            exceeded("llm")
+            self._router.release(model)
+            return
+        self._router.record(model, time.perf_counter() - started, False)
+
+    def _timed_call(self, model: str, prompt: str, stop: Optional[List[str]]) -> str:
+        started = time.perf_counter()
+        try:
+            with span("llm_backend", model, requested=self._requested):
+                response = self._backends(model)._call(prompt, stop=stop)
+        except Exception:
+            self._record_failure(model, started)
+            raise
+        self._router.record(model, time.perf_counter() - started, True)
+        return response
+
+    async def _atimed_call(
+        self,
+        model: str,
+        prompt: str,
+        stop: Optional[List[str]],
+        run_manager: Optional[Any] = None
+    ) -> str:
+        started = time.perf_counter()
+        try:
+            with span("llm_backend", model, requested=self._requested):
+                response = await self._backends(model)._acall(prompt, stop=stop, run_manager=run_manager)
+        except asyncio.CancelledError:
+            self._router.release(model)
+            raise
+        except Exception:
+            self._record_failure(model, started)
+            raise
+        self._router.record(model, time.perf_counter() - started, True)
+        return response
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Optional[Any] = None, **kwargs: Any) -> str:
+        errors: List[Tuple[str, Exception]] = []
+        tried = set()
+        for index, model in enumerate(self._candidates()):
+            if expired():
+                exceeded("llm")
+                errors.append((model, DeadlineExceeded("the request deadline passed")))
+                break
+            if model in tried or not self._router.admit(model):
+                continue
+            tried.add(model)
+            self._router.decide(self._requested, model, self._reason(model, index))
+            hedge = self._hedge_target(model)
+            try:
+                if hedge is not None:
+                    return self._hedged_call(model, hedge, prompt, stop, tried)
+                response = self._timed_call(model, prompt, stop)
+                served_backend.set(model)
+                return response
+            except Exception as e:
+                logger.error(f"{model} LLM Error: {e}")
+                errors.append((model, e))
+        return self._failed(errors)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        watch = _TokenWatch(run_manager)
+        errors: List[Tuple[str, Exception]] = []
+        tried = set()
+        for index, model in enumerate(self._candidates()):
+            if expired():
+                exceeded("llm")
+                errors.append((model, DeadlineExceeded("the request deadline passed")))
+                break
+            if model in tried or not self._router.admit(model):
+                continue
+            tried.add(model)
+            self._router.decide(self._requested, model, self._reason(model, index))
+            hedge = self._hedge_target(model)
+            try:
+                if hedge is not None:
+                    return await self._ahedged_call(model, hedge, prompt, stop, tried, watch)
+                response = await self._atimed_call(model, prompt, stop, watch)
+                served_backend.set(model)
+                return response
+            except Exception as e:
+                logger.error(f"{model} LLM Error: {e}")
+                errors.append((model, e))
+                if watch.emitted:
+                    break
+        return self._failed(errors)
+
+    def _hedge_target(self, model: str) -> Optional[Tuple[str, float]]:
+        delay = self._router.hedge_delay(model)
+        if delay is None:
+            return None
+        others = [m for m in self._router.order(AUTO_MODEL, self._models) if m != model]
+        return (others[0], delay) if others else None
+
+    def _hedged_call(self, model: str, hedge: Tuple[str, float], prompt: str, stop: Optional[List[str]], tried: set) -> str:
+        other, delay = hedge
+        executor = get_executor()
+        # Copy the context so the trace and prompt session reach the worker threads
+        primary = executor.submit(contextvars.copy_context().run, self._timed_call, model, prompt, stop)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._router.admit(other):
+            response = primary.result()
+            served_backend.set(model)
+            return response
+        tried.add(other)
+        self._router.decide(self._requested, other, "hedge")
+        backup = executor.submit(contextvars.copy_context().run, self._timed_call, other, prompt, stop)
+        pending = {primary: model, backup: other}
+        error: Optional[Exception] = None
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                if future.exception() is None:
+                    # The slower call cannot be interrupted; its result is dropped
+                    self._router.record_hedge(model, winner)
+                    served_backend.set(winner)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged_call(
+        self,
+        model: str,
+        hedge: Tuple[str, float],
+        prompt: str,
+        stop: Optional[List[str]],
+        tried: set,
+        watch: _TokenWatch
+    ) -> str:
+        """
+        Streams from model and races other against it only until model sends
+        its first token. The backup's tokens are held back and its answer is
+        sent as one token if it wins.
+        """
+        other, delay = hedge
+        primary = asyncio.ensure_future(self._atimed_call(model, prompt, stop, watch))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or watch.emitted or not self._router.admit(other):
+            response = await primary
+            served_backend.set(model)
+            return response
+        tried.add(other)
+        self._router.decide(self._requested, other, "hedge")
+        backup = asyncio.ensure_future(self._atimed_call(other, prompt, stop, _TokenWatch()))
+        pending = {primary: model, backup: other}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                if backup in done and primary in pending and watch.emitted:
+                    # The client is already reading the primary's answer
+                    pending.pop(backup)
+                    done = done - {backup}
+                for task in done:
+                    winner = pending.pop(task)
+                    if task.exception() is None:
+                        self._router.record_hedge(model, winner)
+                        served_backend.set(winner)
+                        if task is backup:
+                            await watch.on_llm_new_token(task.result())
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
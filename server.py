@@ -1,14 +1,44 @@
 # server.py
 
+import time
+
+# Measures how long the application modules below take to import
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel, Field
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from task import run_agent_query
-from fastapi.responses import JSONResponse
+from task import arun_agent_query
+from http_client import http_client
+from gateway import model_gateway
+from warmup import readiness
+from writer import db_writer
+from streaming import astream_agent_query
+from batch import iter_batch, run_batch, BATCH_MAX_ITEMS
+from jobs import job_queue, job_runner, JOB_QUEUE_MAX, JOB_TIMEOUT, JOB_MAX_TIMEOUT
+from agents import agent_registry
+from cache import tool_cache
+from ratelimit import rate_limiter
+from router import model_router
+from memory import memory_manager
+from llm_cache import completion_cache
+from fastpath import fast_path
+from tracing import prompt_token_stats
+from deadlines import deadline_stats, resolve_timeout, DEADLINE_HEADER
+from observations import observation_stats
+from notes import find_notes, list_notes, MAX_PAGE_SIZE as NOTES_MAX_PAGE_SIZE
+from history import get_last_seq, get_messages, iter_conversations, list_conversations, MAX_PAGE_SIZE
+from responses import choose_encoding, compress_stream, json_response, make_etag, is_not_modified, not_modified_response
+from metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.exceptions import RequestValidationError
+import asyncio
+import json
 import logging
 
 app = FastAPI()
+readiness.import_seconds = time.perf_counter() - _import_started
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
@@ -26,8 +56,20 @@ app.add_middleware(
 class QueryRequest(BaseModel):
     agent_name: str = Field(..., description="Name of the agent")
     user_input: str = Field(..., description="User's input query")
-    model_name: str = Field(..., description="Name of the model to use")
+    model_name: str = Field(..., description="Name of the model to use: gemini, qwen or auto")
     conversation_id: str = Field(..., description="Unique identifier for the conversation")
+    memory_strategy: Optional[str] = Field(None, description="Conversation memory strategy: window, tokens or summary")
+    execution_mode: Optional[str] = Field(None, description="Agent execution mode: react or plan")
+    timeout: Optional[float] = Field(None, description="Seconds the query may take; the agent answers with what it has by then")
+
+class BatchQueryRequest(BaseModel):
+    items: List[QueryRequest] = Field(..., description="Queries to run")
+    max_concurrency: Optional[int] = Field(None, description="Items in flight at once, capped by BATCH_MAX_CONCURRENCY")
+    stream: bool = Field(False, description="Stream results as NDJSON in completion order")
+
+class JobRequest(QueryRequest):
+    webhook_url: Optional[str] = Field(None, description="URL the finished job is POSTed to")
+    timeout: Optional[float] = Field(None, description="Seconds the job may run, capped by JOB_MAX_TIMEOUT")
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -45,14 +87,31 @@ async def general_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal Server Error"},
     )
 
+@app.on_event("startup")
+async def startup():
+    # Pre-warm in the background; /ready reports 503 until it finishes
+    readiness.start()
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_runner.aclose()
+    await http_client.aclose()
+    await model_gateway.aclose()
+    # Commit whatever is still queued before the process exits
+    await asyncio.to_thread(db_writer.close)
+
 @app.post("/query")
-def query_agent(request: QueryRequest):
+async def query_agent(request: QueryRequest, http_request: Request):
     try:
-        result = run_agent_query(
+        result = await arun_agent_query(
             agent_name=request.agent_name,
             user_input=request.user_input,
             model_name=request.model_name,
-            conversation_id=request.conversation_id
+            conversation_id=request.conversation_id,
+            memory_strategy=request.memory_strategy,
+            execution_mode=request.execution_mode,
+            timeout=resolve_timeout(request.timeout, http_request.headers.get(DEADLINE_HEADER))
         )
         return {"response": result["response"], "reasoning": result["reasoning"]}
     except HTTPException as http_exc:
@@ -61,3 +120,188 @@ def query_agent(request: QueryRequest):
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.post("/query/stream")
+async def query_agent_stream(request: QueryRequest, http_request: Request):
+    async def event_source():
+        async for event in astream_agent_query(
+            agent_name=request.agent_name,
+            user_input=request.user_input,
+            model_name=request.model_name,
+            conversation_id=request.conversation_id,
+            memory_strategy=request.memory_strategy,
+            execution_mode=request.execution_mode,
+            is_disconnected=http_request.is_disconnected,
+            timeout=resolve_timeout(request.timeout, http_request.headers.get(DEADLINE_HEADER))
+        ):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    # The queue is shared by every worker, so the limit is global
+    if await asyncio.to_thread(job_queue.depth) >= JOB_QUEUE_MAX:
+        raise HTTPException(status_code=429, detail="Job queue is full")
+    timeout = min(request.timeout or JOB_TIMEOUT, JOB_MAX_TIMEOUT)
+    query = request.dict(exclude={"webhook_url", "timeout"})
+    job = await job_queue.enqueue(query, request.webhook_url, timeout)
+    job_runner.wake()
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    # wait > 0 long-polls until the job finishes or wait seconds pass
+    if wait > 0:
+        job = await job_runner.wait(job_id, wait)
+    else:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/query/batch")
+async def query_agent_batch(request: BatchQueryRequest):
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+
+    if request.stream:
+        async def result_lines():
+            async for result in iter_batch(request.items, request.max_concurrency):
+                yield json.dumps(result) + "\n"
+
+        return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+    started = time.perf_counter()
+    results = await run_batch(request.items, request.max_concurrency)
+    return {
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        "deduplicated": sum(1 for r in results if r["deduplicated_from"] is not None),
+    }
+
+@app.get("/notes")
+def get_notes(location: Optional[str] = None, after_id: int = 0, limit: int = 20):
+    # list_notes clamps the same way; a full page means there may be more
+    limit = max(1, min(limit, NOTES_MAX_PAGE_SIZE))
+    notes = list_notes(location=location, after_id=after_id, limit=limit)
+    next_cursor = notes[-1]["id"] if len(notes) == limit else None
+    return {"notes": notes, "next_after_id": next_cursor}
+
+@app.get("/notes/search")
+def search_notes(q: str, location: Optional[str] = None, limit: int = 20, offset: int = 0):
+    limit = max(1, min(limit, NOTES_MAX_PAGE_SIZE))
+    results = find_notes(q, location=location, limit=limit, offset=offset)
+    next_offset = offset + len(results) if len(results) == limit else None
+    return {"results": results, "next_offset": next_offset}
+
+@app.get("/conversations")
+def get_conversations(
+    request: Request,
+    agent_name: Optional[str] = None,
+    model_name: Optional[str] = None,
+    after_id: str = "",
+    limit: int = 50
+):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conversations = list_conversations(agent_name=agent_name, model_name=model_name, after_id=after_id, limit=limit)
+    next_cursor = conversations[-1]["id"] if len(conversations) == limit else None
+    return json_response(request, {"conversations": conversations, "next_after_id": next_cursor})
+
+@app.get("/conversations/export")
+def export_conversations(request: Request, agent_name: Optional[str] = None, model_name: Optional[str] = None):
+    # One JSON line per conversation with all of its messages
+    def lines():
+        for page in iter_conversations(agent_name=agent_name, model_name=model_name):
+            yield "".join(json.dumps(c) + "\n" for c in page).encode("utf-8")
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    headers = {"Content-Disposition": 'attachment; filename="conversations.ndjson"'}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(compress_stream(lines(), encoding), media_type="application/x-ndjson", headers=headers)
+
+@app.get("/conversations/{conversation_id}/messages")
+def get_conversation_messages(request: Request, conversation_id: str, after_seq: int = 0, limit: int = 50):
+    last_seq = get_last_seq(conversation_id)
+    if last_seq is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # Messages are append-only with consecutive seqs, so a page is identified
+    # by where it starts and ends; a client that already has it gets a 304
+    # without the messages being read
+    page_end = min(last_seq, after_seq + limit) if last_seq > after_seq else after_seq
+    etag = make_etag(f"{conversation_id}:{after_seq}:{page_end}")
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    messages = get_messages(conversation_id, after_seq=after_seq, limit=limit)
+    if (messages[-1]["seq"] if messages else after_seq) != page_end:
+        etag = None
+    next_cursor = messages[-1]["seq"] if len(messages) == limit else None
+    return json_response(
+        request, {"conversation_id": conversation_id, "messages": messages, "next_after_seq": next_cursor}, etag=etag
+    )
+
+# Gauges read from the component stats at scrape time
+metrics_registry.gauge(
+    "prism_live_conversations", "Conversation memories held in process.",
+    function=lambda: memory_manager.stats()["live_conversations"]
+)
+metrics_registry.gauge(
+    "prism_memory_bytes", "Bytes held in live conversation memories.",
+    function=memory_manager.memory_bytes
+)
+metrics_registry.gauge(
+    "prism_tool_cache_hits", "Tool cache hits since start.",
+    function=lambda: tool_cache.stats()["hits"]
+)
+metrics_registry.gauge(
+    "prism_db_write_queue", "Writes waiting for the group-commit writer.",
+    function=lambda: db_writer.stats()["queued"]
+)
+metrics_registry.gauge(
+    "prism_http_connections_opened", "Upstream TCP connections opened since start.",
+    function=lambda: http_client.stats()["connections_opened"]
+)
+
+@app.get("/ready")
+def get_ready():
+    status = readiness.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/rate-limits")
+def get_rate_limits():
+    # Remaining per-second and daily budget per upstream and API key
+    return rate_limiter.stats()
+
+@app.get("/routing")
+def get_routing():
+    # Breaker state, rolling latency and routing decisions per model backend
+    return model_router.stats()
+
+@app.get("/stats")
+def get_stats():
+    return {
+        "agent_registry": agent_registry.stats(),
+        "tool_cache": tool_cache.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "routing": model_router.stats(),
+        "jobs": job_runner.stats(),
+        "http": http_client.stats(),
+        "memory": memory_manager.stats(),
+        "llm_cache": completion_cache.stats(),
+        "fast_path": fast_path.stats(),
+        "gateway": model_gateway.stats(),
+        "db_writer": db_writer.stats(),
+        "prompt_tokens": prompt_token_stats(),
+        "deadlines": deadline_stats(),
+        "observations": observation_stats(),
+    }
@@ -0,0 +1,409 @@
+# statestore.py
+
+import json
+import os
+from abc import ABC, abstractmethod
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import SessionLocal, ConversationState
+from writer import db_writer
+from metrics import registry
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "memory" keeps state in this process; "sqlite" and "redis" share it between workers and hosts
+STATE_STORE = os.getenv("STATE_STORE", "memory")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://127.0.0.1:6379/0")
+STATE_REDIS_POOL_SIZE = int(os.getenv("STATE_REDIS_POOL_SIZE", "16"))
+STATE_REDIS_TIMEOUT = float(os.getenv("STATE_REDIS_TIMEOUT", "2"))
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "prism:conversation:")
+# Idle conversations expire from the store and are rebuilt from the messages table
+STATE_TTL_SECONDS = float(os.getenv("STATE_TTL_SECONDS", os.getenv("MEMORY_IDLE_SECONDS", "1800")))
+# Bound of the in-process store
+STATE_MAX_CONVERSATIONS = int(os.getenv("STATE_MAX_CONVERSATIONS", os.getenv("MEMORY_MAX_CONVERSATIONS", "1000")))
+
+STATE_STORE_OPERATIONS = registry.counter(
+    "prism_state_store_operations", "Conversation state store operations by outcome.", ["store", "operation", "outcome"]
+)
+
+# (version, state)
+StateRecord = Tuple[int, Dict[str, Any]]
+
+
+class StateStoreError(Exception):
+    pass
+
+
+class StateStore(ABC):
+    """
+    Versioned key-value store for conversation state.
+
+    save() is a compare-and-set: it writes only if the stored version still
+    equals expected_version (0 for a conversation that has no state) and
+    returns the new version, or None if another writer got there first.
+    """
+
+    name = "base"
+    # False when the state is only visible to this process
+    shared = True
+
+    @abstractmethod
+    def load(self, conversation_id: str) -> Optional[StateRecord]:
+        ...
+
+    @abstractmethod
+    def version(self, conversation_id: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def save(self, conversation_id: str, expected_version: int, state: Dict[str, Any]) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def delete(self, conversation_id: str) -> None:
+        ...
+
+    def _count(self, operation: str, outcome: str) -> None:
+        STATE_STORE_OPERATIONS.inc(store=self.name, operation=operation, outcome=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "shared": self.shared}
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessStateStore(StateStore):
+    """
+    Bounded in-process store; least recently used and idle conversations are
+    evicted. Only safe with a single worker.
+    """
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, max_conversations: int = STATE_MAX_CONVERSATIONS, ttl: float = STATE_TTL_SECONDS):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[str, Tuple[int, Dict[str, Any], float]]" = OrderedDict()
+        self._evictions = 0
+
+    def _evict(self, now: float) -> None:
+        for conversation_id in list(self._states):
+            _, _, updated = self._states[conversation_id]
+            if now - updated <= self.ttl and len(self._states) <= self.max_conversations:
+                break
+            del self._states[conversation_id]
+            self._evictions += 1
+
+    def _get(self, conversation_id: str) -> Optional[Tuple[int, Dict[str, Any], float]]:
+        entry = self._states.get(conversation_id)
+        if entry is not None and time.monotonic() - entry[2] > self.ttl:
+            del self._states[conversation_id]
+            self._evictions += 1
+            return None
+        return entry
+
+    def load(self, conversation_id: str) -> Optional[StateRecord]:
+        with self._lock:
+            entry = self._get(conversation_id)
+            return (entry[0], entry[1]) if entry is not None else None
+
+    def version(self, conversation_id: str) -> Optional[int]:
+        with self._lock:
+            entry = self._get(conversation_id)
+            return entry[0] if entry is not None else None
+
+    def save(self, conversation_id: str, expected_version: int, state: Dict[str, Any]) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._get(conversation_id)
+            if (entry[0] if entry is not None else 0) != expected_version:
+                self._count("save", "conflict")
+                return None
+            version = expected_version + 1
+            self._states[conversation_id] = (version, state, now)
+            self._states.move_to_end(conversation_id)
+            self._evict(now)
+        self._count("save", "ok")
+        return version
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._states.pop(conversation_id, None)
+
+    def states(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [state for _, state, _ in self._states.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            strategies: Dict[str, int] = {}
+            for _, state, _ in self._states.values():
+                strategies[state["strategy"]] = strategies.get(state["strategy"], 0) + 1
+            return {
+                **super().stats(),
+                "conversations": len(self._states),
+                "strategies": strategies,
+                "evictions": self._evictions,
+            }
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Keeps state in the conversation_state table of the application database,
+    which every worker on the host shares. Writes go through the group-commit
+    writer; expired rows count as missing and are replaced on the next save.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, ttl: float = STATE_TTL_SECONDS, session_factory=SessionLocal):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._saves = 0
+        self._lock = threading.Lock()
+
+    def _row(self, conversation_id: str, columns: tuple) -> Optional[Any]:
+        session_db = self.session_factory()
+        try:
+            return session_db.execute(
+                select(*columns).where(
+                    ConversationState.conversation_id == conversation_id,
+                    ConversationState.updated_at >= time.time() - self.ttl
+                )
+            ).first()
+        finally:
+            session_db.close()
+
+    def load(self, conversation_id: str) -> Optional[StateRecord]:
+        row = self._row(conversation_id, (ConversationState.version, ConversationState.data))
+        return (row.version, json.loads(row.data)) if row is not None else None
+
+    def version(self, conversation_id: str) -> Optional[int]:
+        row = self._row(conversation_id, (ConversationState.version,))
+        return row.version if row is not None else None
+
+    def save(self, conversation_id: str, expected_version: int, state: Dict[str, Any]) -> Optional[int]:
+        data = json.dumps(state, separators=(",", ":"))
+        now = time.time()
+
+        def stage(session_db) -> Optional[int]:
+            if expected_version == 0:
+                # Takes over a row that has expired, but never a live one
+                statement = sqlite_insert(ConversationState).values(
+                    conversation_id=conversation_id, version=1, data=data, updated_at=now
+                )
+                statement = statement.on_conflict_do_update(
+                    index_elements=[ConversationState.conversation_id],
+                    set_={"version": ConversationState.version + 1, "data": data, "updated_at": now},
+                    where=ConversationState.updated_at < now - self.ttl
+                ).returning(ConversationState.version)
+                return session_db.execute(statement).scalar()
+            result = session_db.execute(
+                update(ConversationState)
+                .where(
+                    ConversationState.conversation_id == conversation_id,
+                    ConversationState.version == expected_version,
+                    ConversationState.updated_at >= now - self.ttl
+                )
+                .values(version=expected_version + 1, data=data, updated_at=now)
+            )
+            return expected_version + 1 if result.rowcount else None
+
+        version = db_writer.write(stage)
+        self._count("save", "ok" if version is not None else "conflict")
+        with self._lock:
+            self._saves += 1
+            prune = self._saves % 256 == 0
+        if prune:
+            db_writer.submit(self._prune)
+        return version
+
+    def _prune(self, session_db) -> int:
+        return session_db.execute(
+            delete(ConversationState).where(ConversationState.updated_at < time.time() - self.ttl)
+        ).rowcount
+
+    def delete(self, conversation_id: str) -> None:
+        db_writer.write(lambda session_db: session_db.execute(
+            delete(ConversationState).where(ConversationState.conversation_id == conversation_id)
+        ))
+
+
+class RespConnection:
+    """
+    One connection speaking the Redis protocol (RESP2).
+    """
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+
+    def execute(self, *args: Any) -> Any:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+        self.sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self.file.readline()
+        if not line:
+            raise StateStoreError("Connection closed by the state store")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest.decode("utf-8")
+        if prefix == b"-":
+            raise StateStoreError(rest.decode("utf-8"))
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.file.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise StateStoreError(f"Unexpected reply from the state store: {line!r}")
+
+    def close(self) -> None:
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """
+    Minimal pooled client for Redis, or anything else that speaks its
+    protocol, covering only the commands the state store needs.
+    """
+
+    def __init__(self, url: str = STATE_REDIS_URL, pool_size: int = STATE_REDIS_POOL_SIZE, timeout: float = STATE_REDIS_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[RespConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> RespConnection:
+        conn = RespConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.execute("AUTH", self.password)
+        if self.db:
+            conn.execute("SELECT", self.db)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[RespConnection]:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except (OSError, StateStoreError):
+            # The connection may be mid-reply or mid-transaction; never reuse it
+            conn.close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def execute(self, *args: Any) -> Any:
+        with self.connection() as conn:
+            return conn.execute(*args)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RedisStateStore(StateStore):
+    """
+    Keeps state in Redis so workers on any host share it. Each conversation
+    has a version key and a data key; saves are WATCH/MULTI/EXEC transactions
+    on the version key.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Optional[RespClient] = None, ttl: float = STATE_TTL_SECONDS, prefix: str = STATE_KEY_PREFIX):
+        self.client = client or RespClient()
+        self.ttl_ms = int(ttl * 1000)
+        self.prefix = prefix
+
+    def _keys(self, conversation_id: str) -> Tuple[str, str]:
+        return f"{self.prefix}{conversation_id}:version", f"{self.prefix}{conversation_id}:data"
+
+    def load(self, conversation_id: str) -> Optional[StateRecord]:
+        version, data = self.client.execute("MGET", *self._keys(conversation_id))
+        if version is None or data is None:
+            return None
+        return int(version), json.loads(data)
+
+    def version(self, conversation_id: str) -> Optional[int]:
+        version = self.client.execute("GET", self._keys(conversation_id)[0])
+        return int(version) if version is not None else None
+
+    def save(self, conversation_id: str, expected_version: int, state: Dict[str, Any]) -> Optional[int]:
+        version_key, data_key = self._keys(conversation_id)
+        data = json.dumps(state, separators=(",", ":"))
+        with self.client.connection() as conn:
+            conn.execute("WATCH", version_key)
+            current = conn.execute("GET", version_key)
+            if int(current or 0) != expected_version:
+                conn.execute("UNWATCH")
+                self._count("save", "conflict")
+                return None
+            version = expected_version + 1
+            conn.execute("MULTI")
+            conn.execute("SET", data_key, data, "PX", self.ttl_ms)
+            conn.execute("SET", version_key, version, "PX", self.ttl_ms)
+            # A nil reply means the version key changed after WATCH
+            committed = conn.execute("EXEC")
+        self._count("save", "ok" if committed is not None else "conflict")
+        return version if committed is not None else None
+
+    def delete(self, conversation_id: str) -> None:
+        self.client.execute("DEL", *self._keys(conversation_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "url": f"redis://{self.client.host}:{self.client.port}/{self.client.db}"}
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def create_state_store(backend: str = STATE_STORE) -> StateStore:
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "redis":
+        return RedisStateStore()
+    if backend != "memory":
+        logger.warning(f"State store '{backend}' not recognized. Defaulting to 'memory'.")
+    return InProcessStateStore()
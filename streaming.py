@@ -0,0 +1,132 @@
+# streaming.py
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.schema import AgentAction
+from agents import aget_agent
+from fastpath import fast_path
+from task import get_query_semaphore, asave_conversation_turn, asave_direct_turn
+from tracing import start_trace, TracingCallbackHandler
+from deadlines import time_budget
+from observations import full_text
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+# How often to check for a disconnected client while the agent is quiet
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class StreamingEventHandler(AsyncCallbackHandler):
+    """
+    Turns LangChain agent callbacks into stream events on a queue.
+
+    Emits "thought", "action" and "observation" events for each ReAct step and
+    "token" events for the text the LLM produces after "Final Answer:".
+    """
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self._buffer = ""
+        self._emitted: Optional[int] = None
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, **kwargs: Any) -> None:
+        self._buffer = ""
+        self._emitted = None
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._buffer += token
+        if self._emitted is None:
+            idx = self._buffer.find(FINAL_ANSWER_MARKER)
+            if idx == -1:
+                return
+            self._emitted = idx + len(FINAL_ANSWER_MARKER)
+        text = self._buffer[self._emitted:]
+        if text:
+            self._emitted = len(self._buffer)
+            await self.queue.put({"event": "token", "text": text})
+
+    async def on_agent_action(self, action: AgentAction, **kwargs: Any) -> None:
+        thought = action.log.split("Action:")[0].replace("Thought:", "").strip()
+        if thought:
+            await self.queue.put({"event": "thought", "text": thought})
+        await self.queue.put({"event": "action", "tool": action.tool, "tool_input": action.tool_input})
+
+    async def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        await self.queue.put({"event": "observation", "text": full_text(output)})
+
+
+async def astream_agent_query(
+    agent_name: str,
+    user_input: str,
+    model_name: str,
+    conversation_id: str,
+    memory_strategy: Optional[str] = None,
+    execution_mode: Optional[str] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    timeout: Optional[float] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs the agent and yields its events as they happen.
+
+    The agent run is cancelled if the consumer stops iterating or
+    is_disconnected reports that the client has gone away. With a timeout it
+    sends the best answer it has before that many seconds pass.
+    """
+    yield {"event": "start", "conversation_id": conversation_id}
+    async with get_query_semaphore():
+        with time_budget(agent_name, timeout), start_trace(agent_name, model_name, conversation_id) as trace:
+            queue: asyncio.Queue = asyncio.Queue()
+            try:
+                response = await fast_path.aroute(agent_name, user_input)
+                if response is not None:
+                    await asave_direct_turn(conversation_id, agent_name, model_name, user_input, response)
+                    yield {"event": "token", "text": response}
+                    yield {"event": "final", "response": response}
+                    return
+                agent = await aget_agent(agent_name, model_name, conversation_id, memory_strategy, execution_mode)
+            except Exception as e:
+                trace.status = "error"
+                logger.error(f"Unexpected Error: {e}")
+                yield {"event": "error", "detail": str(e)}
+                return
+
+            run = asyncio.ensure_future(agent.acall(
+                {"input": user_input},
+                callbacks=[StreamingEventHandler(queue), TracingCallbackHandler(trace)]
+            ))
+            try:
+                while True:
+                    getter = asyncio.ensure_future(queue.get())
+                    done, _ = await asyncio.wait({getter, run}, timeout=DISCONNECT_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                    if getter in done:
+                        yield getter.result()
+                        continue
+                    getter.cancel()
+                    if run in done:
+                        while not queue.empty():
+                            yield queue.get_nowait()
+                        break
+                    if is_disconnected is not None and await is_disconnected():
+                        trace.status = "cancelled"
+                        logger.info(f"Client disconnected, stopping agent for conversation ID: {conversation_id}")
+                        return
+
+                try:
+                    result = run.result()
+                    response = result.get("output", result.get("text", "No response"))
+                    await asave_conversation_turn(conversation_id, agent_name, model_name, user_input, response)
+                except Exception as e:
+                    trace.status = "error"
+                    logger.error(f"Unexpected Error: {e}")
+                    yield {"event": "error", "detail": str(e)}
+                    return
+                yield {"event": "final", "response": response}
+            finally:
+                if not run.done():
+                    run.cancel()
@@ -1,33 +1,124 @@
 # task.py
 
-from agents import get_agent
-from db import SessionLocal, Conversation
-from typing import Dict
+from agents import agent_registry, get_agent, aget_agent
+from history import append_turn, aappend_turn
+from fastpath import fast_path
+from memory import memory_manager
+from tracing import start_trace, span, TracingCallbackHandler
+from deadlines import time_budget
+from typing import Dict, Optional
+import asyncio
 import logging
+import os
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def run_agent_query(agent_name: str, user_input: str, model_name: str, conversation_id: str) -> dict:
-    session_db = SessionLocal()
+# Upper bound on agent runs in flight on the async path
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "256"))
+
+_query_semaphore: Optional[asyncio.Semaphore] = None
+
+def get_query_semaphore() -> asyncio.Semaphore:
+    global _query_semaphore
+    if _query_semaphore is None:
+        _query_semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    return _query_semaphore
+
+def save_conversation_turn(conversation_id: str, agent_name: str, model_name: str, user_input: str, response: str) -> None:
+    with span("db", "append_turn"):
+        append_turn(conversation_id, agent_name, model_name, user_input, response)
+
+async def asave_conversation_turn(conversation_id: str, agent_name: str, model_name: str, user_input: str, response: str) -> None:
+    # Resolves once the background writer has committed the turn
+    with span("db", "append_turn"):
+        await aappend_turn(conversation_id, agent_name, model_name, user_input, response)
+
+def save_direct_turn(conversation_id: str, agent_name: str, model_name: str, user_input: str, response: str) -> None:
+    # The agent never saw this turn, so its memory has to be told about it
+    memory_manager.record_turn(conversation_id, user_input, response, agent_registry.get_llm(model_name))
+    save_conversation_turn(conversation_id, agent_name, model_name, user_input, response)
+
+async def asave_direct_turn(conversation_id: str, agent_name: str, model_name: str, user_input: str, response: str) -> None:
+    await asyncio.to_thread(
+        memory_manager.record_turn, conversation_id, user_input, response, agent_registry.get_llm(model_name)
+    )
+    await asave_conversation_turn(conversation_id, agent_name, model_name, user_input, response)
+
+def run_agent_query(
+    agent_name: str,
+    user_input: str,
+    model_name: str,
+    conversation_id: str,
+    memory_strategy: Optional[str] = None,
+    execution_mode: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> dict:
+    with time_budget(agent_name, timeout), start_trace(agent_name, model_name, conversation_id) as trace:
+        try:
+            response = fast_path.route(agent_name, user_input)
+            if response is not None:
+                save_direct_turn(conversation_id, agent_name, model_name, user_input, response)
+                return {"response": response, "reasoning": ""}
+
+            agent = get_agent(agent_name, model_name, conversation_id, memory_strategy, execution_mode)
+            result = agent({"input": user_input}, callbacks=[TracingCallbackHandler(trace)])
+            response = result.get("output", result.get("text", "No response"))
+
+            # Save conversation to database
+            save_conversation_turn(conversation_id, agent_name, model_name, user_input, response)
+
+            return {"response": response, "reasoning": ""}
+        except Exception as e:
+            trace.status = "error"
+            logger.error(f"Unexpected Error: {e}")
+            return {"response": f"Unexpected error occurred: {str(e)}", "reasoning": str(e)}
+
+async def execute_agent_query(
+    agent_name: str,
+    user_input: str,
+    model_name: str,
+    conversation_id: str,
+    memory_strategy: Optional[str] = None,
+    execution_mode: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> dict:
+    """
+    Runs one traced agent query and persists the turn. Raises on failure.
+    With a timeout, the run answers with what it has before that many seconds pass.
+    """
+    with time_budget(agent_name, timeout):
+        async with get_query_semaphore():
+            with start_trace(agent_name, model_name, conversation_id) as trace:
+                try:
+                    response = await fast_path.aroute(agent_name, user_input)
+                    if response is not None:
+                        await asave_direct_turn(conversation_id, agent_name, model_name, user_input, response)
+                        return {"response": response, "reasoning": ""}
+
+                    agent = await aget_agent(agent_name, model_name, conversation_id, memory_strategy, execution_mode)
+                    result = await agent.acall({"input": user_input}, callbacks=[TracingCallbackHandler(trace)])
+                    response = result.get("output", result.get("text", "No response"))
+
+                    await asave_conversation_turn(conversation_id, agent_name, model_name, user_input, response)
+
+                    return {"response": response, "reasoning": ""}
+                except Exception:
+                    trace.status = "error"
+                    raise
+
+async def arun_agent_query(
+    agent_name: str,
+    user_input: str,
+    model_name: str,
+    conversation_id: str,
+    memory_strategy: Optional[str] = None,
+    execution_mode: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> dict:
     try:
-        agent = get_agent(agent_name, model_name, conversation_id)
-        result = agent({"input": user_input})
-        response = result.get("output", result.get("text", "No response"))
-        
-        # Save conversation to database
-        conversation = session_db.query(Conversation).filter_by(id=conversation_id).first()
-        if not conversation:
-            conversation = Conversation(id=conversation_id, agent_name=agent_name, model_name=model_name, chat_history="")
-            session_db.add(conversation)
-        conversation.chat_history += f"User: {user_input}\nAssistant: {response}\n"
-        session_db.commit()
-        
-        return {"response": response, "reasoning": ""}
+        return await execute_agent_query(agent_name, user_input, model_name, conversation_id, memory_strategy, execution_mode, timeout)
     except Exception as e:
         logger.error(f"Unexpected Error: {e}")
         return {"response": f"Unexpected error occurred: {str(e)}", "reasoning": str(e)}
-    finally:
-        session_db.close()
-    
\ No newline at end of file
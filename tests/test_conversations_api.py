@@ -0,0 +1,63 @@
+# tests/test_conversations_api.py
+#
+# Paging of GET /conversations, including limits outside 1..MAX_PAGE_SIZE.
+
+import pytest
+from fastapi.testclient import TestClient
+from db import SessionLocal, Conversation, Message
+import server
+
+client = TestClient(server.app)
+
+
+@pytest.fixture
+def store():
+    def fill(count: int) -> None:
+        session_db = SessionLocal()
+        try:
+            session_db.add_all(
+                Conversation(id=f"c{i:03d}", agent_name="Weather Agent", model_name="qwen") for i in range(count)
+            )
+            session_db.commit()
+        finally:
+            session_db.close()
+
+    def clear() -> None:
+        session_db = SessionLocal()
+        try:
+            session_db.query(Message).delete()
+            session_db.query(Conversation).delete()
+            session_db.commit()
+        finally:
+            session_db.close()
+
+    clear()
+    yield fill
+    clear()
+
+
+@pytest.mark.parametrize("limit", [0, -5, 1, 50])
+def test_empty_store_has_no_cursor(store, limit):
+    response = client.get("/conversations", params={"limit": limit})
+    assert response.status_code == 200
+    assert response.json() == {"conversations": [], "next_after_id": None}
+
+
+@pytest.mark.parametrize("limit", [0, -5])
+def test_limit_below_one_pages_one_at_a_time(store, limit):
+    store(3)
+    body = client.get("/conversations", params={"limit": limit}).json()
+    assert [c["id"] for c in body["conversations"]] == ["c000"]
+    assert body["next_after_id"] == "c000"
+
+
+def test_cursor_walks_every_page(store):
+    store(5)
+    seen, after_id = [], ""
+    while True:
+        body = client.get("/conversations", params={"limit": 2, "after_id": after_id}).json()
+        seen += [c["id"] for c in body["conversations"]]
+        after_id = body["next_after_id"]
+        if after_id is None:
+            break
+    assert seen == [f"c{i:03d}" for i in range(5)]
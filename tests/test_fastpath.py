@@ -0,0 +1,67 @@
+# tests/test_fastpath.py
+#
+# Which weather questions the fast path answers itself, what location it
+# passes to the tool, and that tool failures fall back to the agent.
+
+import asyncio
+
+import pytest
+from fastpath import FastPathRouter, IntentRule, DEFAULT_RULES, fast_path
+
+WEATHER_AGENT = "Weather Agent"
+WEATHER_PATTERNS = [p.pattern for p in DEFAULT_RULES[0].patterns]
+
+
+@pytest.mark.parametrize("query, location", [
+    ("what is the weather like in New York today?", "New York"),
+    ("What's the weather in Paris right now", "Paris"),
+    ("weather in Paris, now", "Paris"),
+    ("current weather in San Francisco", "San Francisco"),
+    ("weather for Rio de Janeiro currently", "Rio de Janeiro"),
+    ("weather in Paris, France", "Paris, France"),
+    ("London weather", "London"),
+    ("in Berlin weather today", "Berlin"),
+    ("New York weather right now", "New York"),
+])
+def test_weather_location_is_normalized(query, location):
+    matched = fast_path.match(WEATHER_AGENT, query)
+    assert matched is not None
+    assert matched[1] == {"location": location}
+
+
+@pytest.mark.parametrize("query", [
+    "weather in my city",
+    "what's the weather like here",
+    "how is the weather at our place",
+    "I hate this weather",
+    "terrible weather",
+    "Nice weather today",
+    "weather in Paris tomorrow",
+    "will it rain in London",
+    "weather in Paris and Rome",
+])
+def test_weather_chatter_goes_to_the_agent(query):
+    assert fast_path.match(WEATHER_AGENT, query) is None
+
+
+@pytest.mark.parametrize("output", [
+    "• Unable to connect to Weather API.",
+    "No weather info found.",
+    "Error: boom",
+    "• Weather API rate limit reached, retry in 1.0s. Answer without this tool.",
+])
+def test_failed_tool_output_falls_back(output):
+    async def coroutine(location):
+        return output
+
+    rule = IntentRule("weather", WEATHER_AGENT, WEATHER_PATTERNS, lambda location: output, coroutine)
+    router = FastPathRouter([rule])
+    assert router.route(WEATHER_AGENT, "weather in Paris") is None
+    assert asyncio.run(router.aroute(WEATHER_AGENT, "weather in Paris")) is None
+    assert router.stats()["served"] == 0
+
+
+def test_weather_answer_is_served():
+    rule = IntentRule("weather", WEATHER_AGENT, WEATHER_PATTERNS, lambda location: f"Weather in {location}:\n• Clear sky")
+    router = FastPathRouter([rule])
+    assert router.route(WEATHER_AGENT, "what is the weather like in New York today?") == "Weather in New York:\n• Clear sky"
@@ -0,0 +1,74 @@
+# tests/test_gateway.py
+#
+# Request coalescing and per-loop state of the model gateway, against the
+# FakeOllama server from benchmarks.
+
+import asyncio
+import threading
+
+import pytest
+from fakes import FakeOllama
+from gateway import ModelGateway
+
+
+@pytest.fixture
+def ollama():
+    fake = FakeOllama(lambda prompt: "It is sunny.", latency=0.1).start()
+    yield fake
+    fake.stop()
+
+
+def test_sessions_do_not_share_a_generation(ollama):
+    gateway = ModelGateway(base_url=ollama.url)
+
+    async def run():
+        try:
+            return await asyncio.gather(
+                gateway.agenerate("qwen", "Weather in Paris?", session="a"),
+                gateway.agenerate("qwen", "Weather in Paris?", session="b"),
+            )
+        finally:
+            await gateway.aclose()
+
+    assert asyncio.run(run()) == ["It is sunny.", "It is sunny."]
+    assert ollama.requests == 2
+    assert gateway.stats()["coalesced"] == 0
+
+
+def test_identical_requests_in_one_session_share_a_generation(ollama):
+    gateway = ModelGateway(base_url=ollama.url)
+
+    async def run():
+        try:
+            return await asyncio.gather(
+                gateway.agenerate("qwen", "Weather in Paris?", session="a"),
+                gateway.agenerate("qwen", "Weather in Paris?", session="a"),
+            )
+        finally:
+            await gateway.aclose()
+
+    assert asyncio.run(run()) == ["It is sunny.", "It is sunny."]
+    assert ollama.requests == 1
+    assert gateway.stats()["coalesced"] == 1
+
+
+def test_each_loop_gets_its_own_client_and_pending_map(ollama):
+    gateway = ModelGateway(base_url=ollama.url)
+    states, results = [], []
+
+    async def generate():
+        states.append(gateway._loop_state())
+        results.append(await gateway.agenerate("qwen", "Weather in Paris?"))
+
+    async def server_loop():
+        # A worker thread runs the same request on its own loop meanwhile
+        worker = threading.Thread(target=asyncio.run, args=(generate(),))
+        worker.start()
+        await generate()
+        await asyncio.to_thread(worker.join)
+        await gateway.aclose()
+
+    asyncio.run(server_loop())
+    assert results == ["It is sunny.", "It is sunny."]
+    assert states[0][0] is not states[1][0]
+    assert states[0][1] is not states[1][1]
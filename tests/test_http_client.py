@@ -0,0 +1,51 @@
+# tests/test_http_client.py
+#
+# The shared HTTP client used from more than one event loop, against the
+# StubUpstream server from benchmarks.
+
+import asyncio
+import threading
+
+import pytest
+from fakes import StubUpstream
+from http_client import HTTPClient
+
+
+@pytest.fixture
+def upstream():
+    stub = StubUpstream({"ok": True}, latency=0.05).start()
+    yield stub
+    stub.stop()
+
+
+def test_server_loop_and_worker_thread_loop(upstream):
+    client = HTTPClient()
+    clients, results = [], []
+
+    async def fetch():
+        clients.append(client._get_aclient())
+        results.append((await client.aget(upstream.url)).json())
+
+    async def server_loop():
+        # A job worker calls asyncio.run() on its own thread meanwhile
+        worker = threading.Thread(target=asyncio.run, args=(fetch(),))
+        worker.start()
+        await asyncio.gather(fetch(), fetch())
+        await asyncio.to_thread(worker.join)
+        await client.aclose()
+
+    asyncio.run(server_loop())
+    assert results == [{"ok": True}] * 3
+    assert len({id(c) for c in clients}) == 2
+    assert client.stats()["failures"] == 0
+
+
+def test_sequential_loops_drop_closed_clients(upstream):
+    client = HTTPClient()
+
+    async def fetch():
+        return (await client.aget(upstream.url)).json()
+
+    for _ in range(3):
+        assert asyncio.run(fetch()) == {"ok": True}
+    assert len(client._aclients) == 1
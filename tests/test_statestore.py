@@ -0,0 +1,81 @@
+# tests/test_statestore.py
+#
+# Compare-and-set behaviour of the shared conversation state stores, run
+# against a scratch SQLite database and the FakeRedis server from benchmarks.
+
+import threading
+
+import pytest
+from fakes import FakeRedis
+from statestore import RedisStateStore, RespClient, SQLiteStateStore, StateStore
+
+WRITERS = 8
+
+
+@pytest.fixture
+def redis_store():
+    fake = FakeRedis().start()
+    store = RedisStateStore(RespClient(fake.url, pool_size=WRITERS))
+    yield store
+    store.close()
+    fake.stop()
+
+
+@pytest.fixture
+def sqlite_store():
+    return SQLiteStateStore()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request):
+    return request.getfixturevalue(f"{request.param}_store")
+
+
+def concurrent_saves(store: StateStore, conversation_id: str, expected_version: int) -> list:
+    """
+    Runs WRITERS saves against the same expected version at once and returns
+    what each of them got back.
+    """
+    barrier = threading.Barrier(WRITERS)
+    results = [None] * WRITERS
+
+    def save(index: int) -> None:
+        barrier.wait()
+        results[index] = store.save(conversation_id, expected_version, {"writer": index})
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_interface_is_abstract():
+    class Incomplete(StateStore):
+        def load(self, conversation_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_stale_version_conflicts(store):
+    assert store.save("stale", 0, {"n": 1}) == 1
+    assert store.save("stale", 0, {"n": 2}) is None
+    assert store.save("stale", 1, {"n": 2}) == 2
+    assert store.load("stale") == (2, {"n": 2})
+
+
+@pytest.mark.parametrize("expected_version", [0, 1])
+def test_concurrent_saves_have_one_winner(store, expected_version):
+    conversation_id = f"race-{expected_version}"
+    if expected_version:
+        assert store.save(conversation_id, 0, {"writer": -1}) == 1
+
+    results = concurrent_saves(store, conversation_id, expected_version)
+
+    winners = [i for i, version in enumerate(results) if version is not None]
+    assert len(winners) == 1
+    assert results[winners[0]] == expected_version + 1
+    assert store.load(conversation_id) == (expected_version + 1, {"writer": winners[0]})
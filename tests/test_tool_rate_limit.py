@@ -0,0 +1,95 @@
+# tests/test_tool_rate_limit.py
+#
+# Every HTTP attempt a tool makes, retries included, has to be admitted by
+# the rate limiter and count against the daily quota.
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import tools
+from ratelimit import RateLimiter
+
+
+class ScriptedUpstream:
+    """
+    Local server that answers each GET with the next status in statuses and
+    200 with a weather payload once they run out.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.hits = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                upstream.hits += 1
+                status = upstream.statuses.pop(0) if upstream.statuses else 200
+                body = json.dumps({"weather": [{"description": "clear sky"}], "main": {"temp": 20}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/weather"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RateLimiter(limits={"weather": (100.0, 10, 100)}, max_wait=1)
+    monkeypatch.setattr(tools, "rate_limiter", limiter)
+    monkeypatch.setattr(tools.http_client, "backoff_base", 0.01)
+    return limiter
+
+
+def used_today(limiter):
+    return limiter.stats()["upstreams"]["weather"]["keys"]["default"]["used_today"]
+
+
+@pytest.mark.parametrize("statuses", [[503, 502], [429], [429, 503]])
+def test_each_attempt_takes_a_token(limiter, statuses):
+    upstream = ScriptedUpstream(statuses)
+    try:
+        data = tools._get_json("weather", upstream.url, lambda api_key: {"q": "Paris"})
+        assert data["main"]["temp"] == 20
+        assert upstream.hits == len(statuses) + 1
+        assert used_today(limiter) == upstream.hits
+    finally:
+        upstream.stop()
+
+
+def test_async_attempts_take_tokens(limiter):
+    upstream = ScriptedUpstream([503, 429])
+    try:
+        data = asyncio.run(tools._aget_json("weather", upstream.url, lambda api_key: {"q": "Paris"}))
+        assert data["main"]["temp"] == 20
+        assert used_today(limiter) == upstream.hits == 3
+    finally:
+        upstream.stop()
+
+
+def test_429_penalizes_before_the_retry(limiter):
+    upstream = ScriptedUpstream([429, 429, 429])
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            tools._get_json("weather", upstream.url, lambda api_key: {"q": "Paris"})
+        assert limiter.stats()["upstreams"]["weather"]["outcomes"]["throttled"] == upstream.hits
+        assert used_today(limiter) == upstream.hits
+    finally:
+        upstream.stop()
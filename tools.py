@@ -1,9 +1,20 @@
 # tools.py
 
+import asyncio
 import os
-import requests
+import time
+from functools import partial
+from typing import Callable, Optional
+import httpx
 from langchain.agents import Tool
 from db import engine, SessionLocal, Note
+from writer import db_writer
+from notes import find_notes
+from cache import tool_cache
+from http_client import http_client, retryable
+from ratelimit import rate_limiter, RateLimited, retry_after_seconds, split_keys
+from deadlines import current_deadline
+from observations import observation
 import logging
 
 # Configure Logging
@@ -16,52 +27,157 @@ YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY", "")
 NEWS_API_KEY = os.getenv("NEWS_API_KEY", "")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY", "")
 
-def search_ingredients(query: str) -> str:
-    params = {
+# Upstream endpoints, overridable to point the tools at local stub servers
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+YOUTUBE_SEARCH_URL = os.getenv("YOUTUBE_SEARCH_URL", "https://www.googleapis.com/youtube/v3/search")
+NEWS_URL = os.getenv("NEWS_URL", "https://newsapi.org/v2/top-headlines")
+WEATHER_URL = os.getenv("WEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+# Each key setting may list several keys; the rate limiter spreads calls over them
+API_KEYS = {
+    "serpapi": split_keys(SERPAPI_API_KEY),
+    "youtube": split_keys(YOUTUBE_API_KEY),
+    "news": split_keys(NEWS_API_KEY),
+    "weather": split_keys(WEATHER_API_KEY),
+}
+
+def _throttled(upstream: str, api_key: str, e: Exception) -> None:
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+        rate_limiter.penalize(upstream, api_key, retry_after_seconds(e.response))
+
+def _retry_delay(upstream: str, attempt: int, e: Exception) -> Optional[float]:
+    # None when the call should not be retried. After a 429 a limited upstream
+    # has been penalized, so the next acquire does the waiting
+    if attempt >= http_client.max_retries or not retryable(e):
+        return None
+    response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+    limited = rate_limiter.enabled and upstream in rate_limiter.limits
+    if limited and response is not None and response.status_code == 429:
+        return 0.0
+    return http_client.retry_delay(attempt, response)
+
+def _get_json(upstream: str, url: str, params: Callable[[str], dict]) -> dict:
+    # Retried here rather than in the HTTP client so every attempt takes a
+    # token and counts against the daily quota
+    attempt = 0
+    while True:
+        api_key = rate_limiter.acquire(upstream, API_KEYS[upstream], deadline=current_deadline())
+        try:
+            return http_client.get_json(url, params=params(api_key), retries=0)
+        except Exception as e:
+            _throttled(upstream, api_key, e)
+            delay = _retry_delay(upstream, attempt, e)
+            if delay is None:
+                raise
+        logger.warning(f"Retrying {upstream} in {delay:.2f}s (attempt {attempt + 1})")
+        time.sleep(delay)
+        attempt += 1
+
+async def _aget_json(upstream: str, url: str, params: Callable[[str], dict]) -> dict:
+    attempt = 0
+    while True:
+        api_key = await rate_limiter.aacquire(upstream, API_KEYS[upstream], deadline=current_deadline())
+        try:
+            return await http_client.aget_json(url, params=params(api_key), retries=0)
+        except Exception as e:
+            _throttled(upstream, api_key, e)
+            delay = _retry_delay(upstream, attempt, e)
+            if delay is None:
+                raise
+        logger.warning(f"Retrying {upstream} in {delay:.2f}s (attempt {attempt + 1})")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def _afetch(upstream: str, url: str, params: Callable[[str], dict], format_result: Callable[[dict], str]) -> str:
+    return format_result(await _aget_json(upstream, url, params))
+
+def _shed(api_name: str, e: RateLimited) -> str:
+    # A definite answer, so the agent stops retrying the tool this run
+    logger.warning(f"{api_name} call shed: {e}")
+    return f"• {api_name} {e}. Answer without this tool."
+
+def _ingredients_params(query: str, api_key: str) -> dict:
+    return {
         "engine": "google",
         "q": f"Ingredients for {query}",
-        "api_key": SERPAPI_API_KEY
+        "api_key": api_key
     }
-    try:
-        response = requests.get("https://serpapi.com/search", params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        logger.error(f"SerpAPI Error: {e}")
-        return "• Unable to connect to SerpAPI."
-    
+
+def _format_ingredients(data: dict) -> str:
     ingredients_list = []
     if "organic_results" in data:
         for res in data["organic_results"]:
             snippet = res.get("snippet", "")
             if "ingredients" in snippet.lower():
-                ingredients_list.append(f"• {snippet}")
+                ingredients_list.append(snippet)
     if not ingredients_list:
         return "No specific ingredients found."
-    return "Suggested ingredients:\n" + "\n".join(ingredients_list)
+    return observation("search_ingredients", ingredients_list, "Suggested ingredients:")
 
-def search_youtube_videos(query: str) -> str:
-    params = {
+def search_ingredients(query: str) -> str:
+    try:
+        return tool_cache.get_or_call(
+            "search_ingredients", query,
+            lambda: _format_ingredients(_get_json("serpapi", SERPAPI_URL, partial(_ingredients_params, query)))
+        )
+    except RateLimited as e:
+        return _shed("SerpAPI", e)
+    except Exception as e:
+        logger.error(f"SerpAPI Error: {e}")
+        return "• Unable to connect to SerpAPI."
+
+async def asearch_ingredients(query: str) -> str:
+    try:
+        return await tool_cache.aget_or_call(
+            "search_ingredients", query,
+            lambda: _afetch("serpapi", SERPAPI_URL, partial(_ingredients_params, query), _format_ingredients)
+        )
+    except RateLimited as e:
+        return _shed("SerpAPI", e)
+    except Exception as e:
+        logger.error(f"SerpAPI Error: {e}")
+        return "• Unable to connect to SerpAPI."
+
+def _youtube_params(query: str, api_key: str) -> dict:
+    return {
         "part": "snippet",
         "q": query,
         "type": "video",
-        "key": YOUTUBE_API_KEY,
+        "key": api_key,
         "maxResults": 1   # Fetch top 3 relevant videos
     }
-    try:
-        response = requests.get("https://www.googleapis.com/youtube/v3/search", params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        logger.error(f"YouTube API Error: {e}")
-        return "• Unable to connect to YouTube Data API."
-    
+
+def _format_youtube(data: dict) -> str:
     video_links = extract_video_links(data)
     if video_links:
-        return "\n".join(video_links)
+        return observation("search_youtube_videos", video_links, bullet="")
     else:
         return "No video found."
 
+def search_youtube_videos(query: str) -> str:
+    try:
+        return tool_cache.get_or_call(
+            "search_youtube_videos", query,
+            lambda: _format_youtube(_get_json("youtube", YOUTUBE_SEARCH_URL, partial(_youtube_params, query)))
+        )
+    except RateLimited as e:
+        return _shed("YouTube Data API", e)
+    except Exception as e:
+        logger.error(f"YouTube API Error: {e}")
+        return "• Unable to connect to YouTube Data API."
+
+async def asearch_youtube_videos(query: str) -> str:
+    try:
+        return await tool_cache.aget_or_call(
+            "search_youtube_videos", query,
+            lambda: _afetch("youtube", YOUTUBE_SEARCH_URL, partial(_youtube_params, query), _format_youtube)
+        )
+    except RateLimited as e:
+        return _shed("YouTube Data API", e)
+    except Exception as e:
+        logger.error(f"YouTube API Error: {e}")
+        return "• Unable to connect to YouTube Data API."
+
 def extract_video_links(data: dict) -> list:
     """
     Extracts YouTube video links from the API response.
@@ -81,38 +197,72 @@ def extract_video_links(data: dict) -> list:
                 video_links.append(video_url)
     return video_links
 
+def _news_params(query: str, api_key: str) -> dict:
+    return {"apiKey": api_key, "q": query, "country": "india", "pageSize": 5}
+
+def _format_news(data: dict) -> str:
+    if "articles" in data and data["articles"]:
+        return observation("search_news", [a["title"] for a in data["articles"] if a.get("title")], "Latest news:")
+    return "No relevant news found."
+
 def search_news(query: str) -> str:
-    url = "https://newsapi.org/v2/top-headlines"
-    params = {"apiKey": NEWS_API_KEY, "q": query, "country": "india", "pageSize": 5}
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        return tool_cache.get_or_call(
+            "search_news", query,
+            lambda: _format_news(_get_json("news", NEWS_URL, partial(_news_params, query)))
+        )
+    except RateLimited as e:
+        return _shed("News API", e)
     except Exception as e:
         logger.error(f"News API Error: {e}")
         return "• Unable to connect to News API."
-    
-    if "articles" in data and data["articles"]:
-        return "Latest news:\n" + "\n".join("• " + a["title"] for a in data["articles"] if a.get("title"))
-    return "No relevant news found."
 
-def search_weather(location: str) -> str:
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {"q": location, "appid": WEATHER_API_KEY, "units": "metric"}
+async def asearch_news(query: str) -> str:
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        return await tool_cache.aget_or_call(
+            "search_news", query,
+            lambda: _afetch("news", NEWS_URL, partial(_news_params, query), _format_news)
+        )
+    except RateLimited as e:
+        return _shed("News API", e)
     except Exception as e:
-        logger.error(f"Weather API Error: {e}")
-        return "• Unable to connect to Weather API."
-    
+        logger.error(f"News API Error: {e}")
+        return "• Unable to connect to News API."
+
+def _weather_params(location: str, api_key: str) -> dict:
+    return {"q": location, "appid": api_key, "units": "metric"}
+
+def _format_weather(location: str, data: dict) -> str:
     if data.get("weather"):
         desc = data["weather"][0]["description"].capitalize()
         temp = data["main"]["temp"]
         return f"Weather in {location}:\n• {desc}\n• Temp: {temp}°C"
     return "No weather info found."
 
+def search_weather(location: str) -> str:
+    try:
+        return tool_cache.get_or_call(
+            "search_weather", location,
+            lambda: _format_weather(location, _get_json("weather", WEATHER_URL, partial(_weather_params, location)))
+        )
+    except RateLimited as e:
+        return _shed("Weather API", e)
+    except Exception as e:
+        logger.error(f"Weather API Error: {e}")
+        return "• Unable to connect to Weather API."
+
+async def asearch_weather(location: str) -> str:
+    try:
+        return await tool_cache.aget_or_call(
+            "search_weather", location,
+            lambda: _afetch("weather", WEATHER_URL, partial(_weather_params, location), lambda data: _format_weather(location, data))
+        )
+    except RateLimited as e:
+        return _shed("Weather API", e)
+    except Exception as e:
+        logger.error(f"Weather API Error: {e}")
+        return "• Unable to connect to Weather API."
+
 def create_note_tool(note_name: str, content: str, location: str) -> str:
     known_locations = {
         "desktop": os.path.join(os.path.expanduser("~"), "Desktop"),
@@ -128,12 +278,9 @@ def create_note_tool(note_name: str, content: str, location: str) -> str:
             return f"Note '{note_name}' already exists in {location}."
         with open(path, 'w', encoding='utf-8') as f:
             f.write(content)
-        new_note = Note(name=note_name, content=content, location=location)
-        session_db.add(new_note)
-        session_db.commit()
+        db_writer.write(lambda s: s.add(Note(name=note_name, content=content, location=location)))
         return f"Note '{note_name}' created successfully in {location}."
     except Exception as e:
-        session_db.rollback()
         logger.error(f"Create Note Error: {e}")
         return f"Failed to create note: {e}"
     finally:
@@ -154,11 +301,9 @@ def update_note_tool(note_name: str, content: str, location: str) -> str:
             return f"Note '{note_name}' does not exist in {location}."
         with open(path, 'a', encoding='utf-8') as f:
             f.write("\n" + content)
-        note.content += "\n" + content
-        session_db.commit()
+        db_writer.write(lambda s: s.query(Note).filter_by(id=note.id).update({Note.content: Note.content + "\n" + content}))
         return f"Note '{note_name}' updated successfully in {location}."
     except Exception as e:
-        session_db.rollback()
         logger.error(f"Update Note Error: {e}")
         return f"Failed to update note: {e}"
     finally:
@@ -179,11 +324,9 @@ def delete_note_tool(note_name: str, location: str) -> str:
             return f"Note '{note_name}' does not exist in {location}."
         if os.path.exists(path):
             os.remove(path)
-        session_db.delete(note)
-        session_db.commit()
+        db_writer.write(lambda s: s.query(Note).filter_by(id=note.id).delete())
         return f"Note '{note_name}' deleted successfully from {location}."
     except Exception as e:
-        session_db.rollback()
         logger.error(f"Delete Note Error: {e}")
         return f"Failed to delete note: {e}"
     finally:
@@ -205,6 +348,7 @@ def show_note_tool(note_name: str, location: str) -> str:
         if os.path.exists(path):
             with open(path, 'r', encoding='utf-8') as f:
                 content = f.read()
+            # Not compacted: showing the note verbatim is the whole answer
             return f"Note '{note_name}' in {location}:\n{content}"
         return "Note file not found."
     except Exception as e:
@@ -213,28 +357,44 @@ def show_note_tool(note_name: str, location: str) -> str:
     finally:
         session_db.close()
 
+def search_notes_tool(query: str) -> str:
+    try:
+        results = find_notes(query, limit=5)
+    except Exception as e:
+        logger.error(f"Search Notes Error: {e}")
+        return f"Failed to search notes: {e}"
+    if not results:
+        return f"No notes found matching '{query}'."
+    return observation(
+        "search_notes", [f"'{r['name']}' in {r['location']}: {' '.join(r['snippet'].split())}" for r in results], "Matching notes:"
+    )
+
 # Define Tools
 search_ingredients_tool = Tool(
     name="search_ingredients",
     func=search_ingredients,
+    coroutine=asearch_ingredients,
     description="Find ingredients for a given dish."
 )
 
 search_youtube_tool = Tool(
     name="search_youtube_videos",
     func=search_youtube_videos,
+    coroutine=asearch_youtube_videos,
     description="Find relevant YouTube videos."
 )
 
 search_news_tool = Tool(
     name="search_news_tool",
     func=search_news,
+    coroutine=asearch_news,
     description="Find the latest news on a topic."
 )
 
 search_weather_tool = Tool(
     name="search_weather_tool",
     func=search_weather,
+    coroutine=asearch_weather,
     description="Fetch weather information for a location."
 )
 
@@ -261,3 +421,10 @@ show_note = Tool(
     func=show_note_tool,
     description="Displays the content of the note with the given name from the specified location. Location can be 'desktop' or 'documents'."
 )
+
+
+search_notes = Tool(
+    name="search_notes",
+    func=search_notes_tool,
+    description="Searches all notes by name and content and returns the best matches with their location. Input is the text to look for."
+)
\ No newline at end of file
@@ -0,0 +1,272 @@
+# tracing.py
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+from langchain.callbacks.base import BaseCallbackHandler
+from metrics import registry, SIZE_BUCKETS, COUNT_BUCKETS
+from observations import full_text
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are appended to TRACE_LOG_PATH; 0 disables the dump
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "slow_traces.jsonl")
+
+REQUEST_SECONDS = registry.histogram(
+    "prism_request_seconds", "End-to-end agent run time.", ["agent_name", "model", "status"]
+)
+SPAN_SECONDS = registry.histogram(
+    "prism_span_seconds", "Time spent in LLM, tool, DB and agent build spans.", ["kind", "name", "agent_name", "model"]
+)
+LLM_PROMPT_CHARS = registry.histogram(
+    "prism_llm_prompt_chars", "Prompt size sent per LLM call.", ["agent_name", "model"], SIZE_BUCKETS
+)
+LLM_COMPLETION_CHARS = registry.histogram(
+    "prism_llm_completion_chars", "Completion size returned per LLM call.", ["agent_name", "model"], SIZE_BUCKETS
+)
+AGENT_ITERATIONS = registry.histogram(
+    "prism_agent_iterations", "Agent steps (tool calls plus the final answer) per run.", ["agent_name", "model", "mode"], COUNT_BUCKETS
+)
+AGENT_LLM_CALLS = registry.histogram(
+    "prism_agent_llm_calls", "LLM round trips per agent run.", ["agent_name", "model", "mode"], COUNT_BUCKETS
+)
+AGENT_RUN_SECONDS = registry.histogram(
+    "prism_agent_run_seconds", "Agent run time by execution mode.", ["agent_name", "model", "mode"]
+)
+REQUEST_OBSERVATION_BYTES = registry.histogram(
+    "prism_request_observation_bytes", "Tool observation bytes per agent run, in full and as sent to the LLM.", ["agent_name", "mode", "kind"], SIZE_BUCKETS
+)
+
+LLM_PROMPT_TOKENS = registry.counter(
+    "prism_llm_prompt_tokens", "Prompt tokens sent per model, and those processed rather than served from a prefix cache.", ["model", "kind"]
+)
+
+FIRST_REQUEST_SECONDS = registry.gauge(
+    "prism_first_request_seconds", "Duration of the first request per agent and model since start.", ["agent_name", "model"]
+)
+
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+_dump_lock = threading.Lock()
+_first_requests: Dict[str, float] = {}
+_prompt_tokens_lock = threading.Lock()
+_prompt_tokens: Dict[str, Dict[str, int]] = {}
+
+
+class Trace:
+    """
+    Spans recorded while serving one request.
+    """
+
+    def __init__(self, agent_name: str, model: str, conversation_id: str = ""):
+        self.trace_id = uuid.uuid4().hex
+        self.agent_name = agent_name
+        self.model = model.lower()
+        self.conversation_id = conversation_id
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.iterations = 0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.prompt_tokens_processed = 0
+        self.observation_bytes = 0
+        self.observation_full_bytes = 0
+        self.mode = "react"
+        self.status = "ok"
+        self.spans: List[Dict[str, Any]] = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, kind: str, name: str, started: float, duration: float, **attrs: Any) -> None:
+        span = {
+            "kind": kind,
+            "name": name,
+            "start_ms": round((started - self._t0) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+        }
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "agent_name": self.agent_name,
+            "model": self.model,
+            "conversation_id": self.conversation_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "iterations": self.iterations,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "prompt_tokens_processed": self.prompt_tokens_processed,
+            "observation_bytes": self.observation_bytes,
+            "observation_full_bytes": self.observation_full_bytes,
+            "mode": self.mode,
+            "status": self.status,
+            "spans": list(self.spans),
+        }
+
+
+def record_span(kind: str, name: str, started: float, duration: float, trace: Optional[Trace] = None, **attrs: Any) -> None:
+    trace = trace or current_trace.get()
+    agent_name = trace.agent_name if trace else ""
+    model = trace.model if trace else ""
+    SPAN_SECONDS.observe(duration, kind=kind, name=name, agent_name=agent_name, model=model)
+    if trace is not None:
+        trace.add_span(kind, name, started, duration, **attrs)
+
+
+@contextmanager
+def span(kind: str, name: str, **attrs: Any) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        attrs["error"] = str(e)
+        raise
+    finally:
+        record_span(kind, name, started, time.perf_counter() - started, **attrs)
+
+
+def _dump(trace: Trace) -> None:
+    try:
+        with _dump_lock, open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_dict()) + "\n")
+    except Exception as e:
+        logger.error(f"Trace Dump Error: {e}")
+
+
+@contextmanager
+def start_trace(agent_name: str, model: str, conversation_id: str = "") -> Iterator[Trace]:
+    trace = Trace(agent_name, model, conversation_id)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.status = "error"
+        raise
+    finally:
+        try:
+            current_trace.reset(token)
+        except ValueError:
+            # A streaming generator can be closed from a different context
+            current_trace.set(None)
+        trace.duration = time.perf_counter() - trace._t0
+        REQUEST_SECONDS.observe(trace.duration, agent_name=agent_name, model=trace.model, status=trace.status)
+        mode_labels = {"agent_name": agent_name, "model": trace.model, "mode": trace.mode}
+        AGENT_ITERATIONS.observe(trace.iterations, **mode_labels)
+        AGENT_LLM_CALLS.observe(trace.llm_calls, **mode_labels)
+        AGENT_RUN_SECONDS.observe(trace.duration, **mode_labels)
+        if trace.observation_full_bytes:
+            REQUEST_OBSERVATION_BYTES.observe(trace.observation_full_bytes, agent_name=agent_name, mode=trace.mode, kind="full")
+            REQUEST_OBSERVATION_BYTES.observe(trace.observation_bytes, agent_name=agent_name, mode=trace.mode, kind="sent")
+        first_key = f"{agent_name}/{trace.model}"
+        if first_key not in _first_requests:
+            _first_requests[first_key] = round(trace.duration, 6)
+            FIRST_REQUEST_SECONDS.set(trace.duration, agent_name=agent_name, model=trace.model)
+        if TRACE_SLOW_MS and trace.duration * 1000 >= TRACE_SLOW_MS:
+            _dump(trace)
+
+
+def first_request_seconds() -> Dict[str, float]:
+    return dict(_first_requests)
+
+
+def record_prompt_tokens(model: str, sent: int, processed: int) -> None:
+    """
+    Records the prompt tokens of one model call: how many were sent and how
+    many the backend had to process because they were not in its prefix cache.
+    """
+    processed = min(processed, sent)
+    LLM_PROMPT_TOKENS.inc(sent, model=model, kind="sent")
+    LLM_PROMPT_TOKENS.inc(processed, model=model, kind="processed")
+    with _prompt_tokens_lock:
+        totals = _prompt_tokens.setdefault(model, {"calls": 0, "sent": 0, "processed": 0})
+        totals["calls"] += 1
+        totals["sent"] += sent
+        totals["processed"] += processed
+    trace = current_trace.get()
+    if trace is not None:
+        trace.prompt_tokens += sent
+        trace.prompt_tokens_processed += processed
+
+
+def prompt_token_stats() -> Dict[str, Dict[str, Any]]:
+    with _prompt_tokens_lock:
+        return {
+            model: dict(totals, reused_ratio=round(1 - totals["processed"] / totals["sent"], 4) if totals["sent"] else 0.0)
+            for model, totals in _prompt_tokens.items()
+        }
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records a span for every LLM and tool call the agent makes.
+    """
+
+    # Run in the caller's thread/loop so timings are not skewed by an executor hop
+    run_inline = True
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self.trace.llm_calls += 1
+        self._runs[run_id] = {"started": time.perf_counter(), "prompt_chars": sum(len(p) for p in prompts)}
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        completion_chars = sum(len(g.text) for gens in response.generations for g in gens)
+        labels = {"agent_name": self.trace.agent_name, "model": self.trace.model}
+        LLM_PROMPT_CHARS.observe(run["prompt_chars"], **labels)
+        LLM_COMPLETION_CHARS.observe(completion_chars, **labels)
+        record_span(
+            "llm", self.trace.model, run["started"], time.perf_counter() - run["started"], self.trace,
+            prompt_chars=run["prompt_chars"], completion_chars=completion_chars
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            record_span("llm", self.trace.model, run["started"], time.perf_counter() - run["started"], self.trace, error=str(error))
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = {"started": time.perf_counter(), "name": serialized.get("name", "tool"), "input_chars": len(input_str)}
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        # A ReAct agent resends each observation on every later step, so it
+        # gets the compact rendering; plan mode sends the full one once
+        full = len(full_text(output).encode("utf-8"))
+        self.trace.observation_full_bytes += full
+        self.trace.observation_bytes += full if self.trace.mode == "plan" else len(str(output).encode("utf-8"))
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            record_span(
+                "tool", run["name"], run["started"], time.perf_counter() - run["started"], self.trace,
+                input_chars=run["input_chars"], output_chars=len(str(output))
+            )
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            record_span("tool", run["name"], run["started"], time.perf_counter() - run["started"], self.trace, error=str(error))
+
+    def on_agent_action(self, action: Any, **kwargs: Any) -> None:
+        self.trace.iterations += 1
+
+    def on_agent_finish(self, finish: Any, **kwargs: Any) -> None:
+        self.trace.iterations += 1
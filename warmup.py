@@ -0,0 +1,110 @@
+# warmup.py
+
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import text
+from agents import (
+    agent_registry, AGENT_NAMES, AVAILABLE_MODELS, ENABLED_MODELS, provider_import_seconds
+)
+from db import engine
+from gateway import model_gateway
+from http_client import http_client
+from llm_cache import completion_cache, LLM_CACHE_ENABLED
+from tracing import first_request_seconds
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() in ("1", "true", "yes")
+# Comma separated agent names to build at startup, or "all"
+PREWARM_AGENTS = os.getenv("PREWARM_AGENTS", "all")
+# Send one short prompt to every enabled model; off by default as it spends API quota
+PREWARM_LLM_CALLS = os.getenv("PREWARM_LLM_CALLS", "false").lower() in ("1", "true", "yes")
+WARMUP_PROMPT = "Reply with OK."
+
+
+def _prewarm_agent_names() -> list:
+    if PREWARM_AGENTS.strip().lower() == "all":
+        return list(AGENT_NAMES)
+    return [a.strip() for a in PREWARM_AGENTS.split(",") if a.strip()]
+
+
+def _open_databases() -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    if LLM_CACHE_ENABLED:
+        with completion_cache.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+
+class Readiness:
+    """
+    Runs the pre-warm phase and reports whether this worker is ready.
+
+    The phase opens the DB and HTTP pools, builds the agents, loads the local
+    model and optionally sends one warm-up prompt per model. A failed step is
+    logged and recorded but does not keep the worker from becoming ready.
+    """
+
+    def __init__(self, enabled: bool = PREWARM_ENABLED):
+        self.enabled = enabled
+        self.ready = False
+        self.import_seconds = 0.0
+        self.prewarm_seconds = 0.0
+        self.steps: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _step(self, name: str, action: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        try:
+            result = action()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.error(f"Prewarm Error in '{name}': {e}")
+        self.steps[name] = round(time.perf_counter() - started, 6)
+
+    async def _warm_llms(self) -> None:
+        for model in ENABLED_MODELS:
+            await agent_registry.get_backend(model).ainvoke(WARMUP_PROMPT)
+
+    async def prewarm(self) -> None:
+        started = time.perf_counter()
+        if self.enabled:
+            await self._step("databases", lambda: asyncio.to_thread(_open_databases))
+            # Runs on the event loop so the async client binds to it
+            await self._step("http", http_client.open)
+            await self._step("agents", lambda: asyncio.to_thread(agent_registry.warm, _prewarm_agent_names(), ENABLED_MODELS))
+            if "qwen" in ENABLED_MODELS:
+                await self._step("local_model", lambda: model_gateway.awarm_up([AVAILABLE_MODELS["qwen"]]))
+            if PREWARM_LLM_CALLS:
+                await self._step("llm_calls", self._warm_llms)
+        self.prewarm_seconds = round(time.perf_counter() - started, 6)
+        self.ready = True
+        logger.info(f"Worker ready after {self.prewarm_seconds:.3f}s of pre-warm")
+
+    def start(self) -> None:
+        # Keep a reference so the task is not garbage collected mid-run
+        self._task = asyncio.create_task(self.prewarm())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "prewarm_enabled": self.enabled,
+            "import_seconds": round(self.import_seconds, 6),
+            "provider_import_seconds": {k: round(v, 6) for k, v in provider_import_seconds.items()},
+            "prewarm_seconds": self.prewarm_seconds,
+            "steps": dict(self.steps),
+            "errors": dict(self.errors),
+            "first_request_seconds": first_request_seconds(),
+        }
+
+
+readiness = Readiness()
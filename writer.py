@@ -0,0 +1,194 @@
+# writer.py
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from db import WriteSession
+from metrics import registry, COUNT_BUCKETS
+import logging
+
+# Configure Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DB_GROUP_COMMIT = os.getenv("DB_GROUP_COMMIT", "true").lower() in ("1", "true", "yes")
+# Most writes folded into one transaction, and how long to wait for more once one arrives
+DB_GROUP_COMMIT_MAX = int(os.getenv("DB_GROUP_COMMIT_MAX", "64"))
+DB_GROUP_COMMIT_WAIT_MS = float(os.getenv("DB_GROUP_COMMIT_WAIT_MS", "2"))
+
+DB_COMMIT_SECONDS = registry.histogram(
+    "prism_db_commit_seconds", "Time to apply and commit one group of writes."
+)
+DB_WRITES_PER_COMMIT = registry.histogram(
+    "prism_db_writes_per_commit", "Writes folded into one commit.", buckets=COUNT_BUCKETS + (16, 32, 64)
+)
+
+WriteFn = Callable[[Session], Any]
+
+
+class GroupCommitWriter:
+    """
+    Single background writer for the application database.
+
+    Callers submit functions that stage changes on a session. The writer
+    applies everything that is queued in one transaction and commits once,
+    then resolves each caller's future, so a resolved future means the write
+    is committed. If a group fails, its writes are retried one by one so only
+    the failing write reports the error.
+    """
+
+    def __init__(
+        self,
+        session_factory=WriteSession,
+        enabled: bool = DB_GROUP_COMMIT,
+        max_batch: int = DB_GROUP_COMMIT_MAX,
+        wait_ms: float = DB_GROUP_COMMIT_WAIT_MS
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.wait_seconds = wait_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[WriteFn, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._commits = 0
+        self._failures = 0
+        self._commit_seconds = 0.0
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _run_direct(self, fn: WriteFn) -> Any:
+        session = self.session_factory()
+        try:
+            result = fn(session)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _collect(self, first: Tuple[WriteFn, Future]) -> Tuple[List[Tuple[WriteFn, Future]], bool]:
+        batch, stop = [first], False
+        deadline = time.monotonic() + self.wait_seconds
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _commit(self, batch: List[Tuple[WriteFn, Future]]) -> None:
+        started = time.perf_counter()
+        session = self.session_factory()
+        try:
+            results = []
+            for fn, _ in batch:
+                results.append(fn(session))
+                # Later writes in the group read what earlier ones staged
+                session.flush()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            session.close()
+            logger.warning(f"Group commit of {len(batch)} writes failed, retrying one by one: {e}")
+            for fn, future in batch:
+                try:
+                    result = self._run_direct(fn)
+                except Exception as write_error:
+                    with self._lock:
+                        self._failures += 1
+                    if not future.cancelled():
+                        future.set_exception(write_error)
+                    continue
+                if not future.cancelled():
+                    future.set_result(result)
+            return
+        session.close()
+        elapsed = time.perf_counter() - started
+        DB_COMMIT_SECONDS.observe(elapsed)
+        DB_WRITES_PER_COMMIT.observe(len(batch))
+        with self._lock:
+            self._writes += len(batch)
+            self._commits += 1
+            self._commit_seconds += elapsed
+        for (_, future), result in zip(batch, results):
+            # A caller that gave up waiting cancels its future; the write still happened
+            if not future.cancelled():
+                future.set_result(result)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            self._commit(batch)
+            if stop:
+                return
+
+    def submit(self, fn: WriteFn) -> Future:
+        future: Future = Future()
+        if not self.enabled:
+            try:
+                future.set_result(self._run_direct(fn))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._start()
+        self._queue.put((fn, future))
+        return future
+
+    def write(self, fn: WriteFn) -> Any:
+        """
+        Queues a write and blocks until it is committed. Returns fn's result.
+        """
+        return self.submit(fn).result()
+
+    async def awrite(self, fn: WriteFn) -> Any:
+        """
+        Queues a write and waits, without blocking the event loop, until it is committed.
+        """
+        if not self.enabled:
+            return await asyncio.to_thread(self._run_direct, fn)
+        return await asyncio.wrap_future(self.submit(fn))
+
+    def close(self) -> None:
+        """
+        Commits everything already queued and stops the writer thread.
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queued": self._queue.qsize(),
+                "writes": self._writes,
+                "commits": self._commits,
+                "writes_per_commit": round(self._writes / self._commits, 2) if self._commits else 0.0,
+                "mean_commit_ms": round(self._commit_seconds / self._commits * 1000, 3) if self._commits else 0.0,
+                "failures": self._failures,
+            }
+
+
+db_writer = GroupCommitWriter()